@@ -45,7 +45,7 @@ setup(
     install_requires=[
         'ebml', 'matroska', 'titlecase', 'ass', 'av', 'ciqueue',
         'numpy', 'scipy', 'lzma', 'Pillow', 'xml', 'json',
-        'regex', 'itertools', 'more_itertools', 'scenedetect'
+        'regex', 'itertools', 'more_itertools'
     ],
     license="MIT"
 )
@@ -0,0 +1,123 @@
+import unittest
+
+import numpy
+
+from transcode.filters.video.dropframes import DropFrames
+from transcode.filters.video.keyframes import KeyFrames
+
+
+class Source(object):
+    def __init__(self, framecount):
+        self.framecount = framecount
+        self.cumulativeIndexMap = numpy.arange(framecount)
+        self.cumulativeIndexReverseMap = numpy.arange(framecount)
+
+
+def loopIndexMap(framecount, dropframes):
+    """DropFrames.indexMap, as computed before vectorization."""
+    n = numpy.arange(framecount)
+    results = -numpy.ones(n.shape, dtype=numpy.int0)
+    matched = numpy.zeros(n.shape, dtype=bool)
+
+    for k, d in enumerate(sorted(dropframes)):
+        prefilter = n < d
+        arrayfilter = (~matched)*(prefilter)
+        results[arrayfilter] = n[arrayfilter] - k
+        matched[arrayfilter] = True
+        matched[n == d] = True
+
+    results[~matched] = n[~matched] - len(dropframes)
+    return results
+
+
+def loopReverseIndexMap(framecount, dropframes):
+    """DropFrames.reverseIndexMap, as computed before vectorization."""
+    m = numpy.arange(framecount - len(dropframes))
+    results = -numpy.ones(m.shape, dtype=numpy.int0)
+    matched = numpy.zeros(m.shape, dtype=bool)
+
+    for k, d in enumerate(sorted(dropframes)):
+        prefilter = m < d - k
+        arrayfilter = (~matched)*(prefilter)
+        results[arrayfilter] = m[arrayfilter] + k
+        matched[arrayfilter] = True
+
+    results[~matched] = m[~matched] + len(dropframes)
+    return results
+
+
+def loopNewKeyframes(keyframes, M):
+    """
+    KeyFrames.new_keyframes, as computed before vectorization, except that
+    keyframes past the last surviving frame are ignored rather than raising
+    IndexError.
+    """
+    if len(keyframes) == 0:
+        return set()
+
+    n = numpy.int0(sorted(keyframes))
+    n = n[n < len(M)]
+    m = M[n]
+
+    while (m < 0).any():
+        n[m < 0] += 1
+        n = n[n < len(M)]
+        m = M[n]
+
+    return set(m.tolist())
+
+
+class TestIndexMaps(unittest.TestCase):
+    trials = 300
+
+    def setUp(self):
+        self.rng = numpy.random.default_rng(0)
+
+    def randomDrops(self, N):
+        drops = set(self.rng.choice(
+            N, int(self.rng.integers(0, N)), replace=False).tolist())
+
+        if self.rng.integers(2):
+            # Drop a run at the end, leaving keyframes with nowhere to go.
+            drops.update(range(int(self.rng.integers(0, N)), N))
+
+        return drops
+
+    def test_dropframes(self):
+        for trial in range(self.trials):
+            N = int(self.rng.integers(1, 400))
+            drops = self.randomDrops(N)
+
+            # Keep 'source' in a local: filters hold only a weak reference
+            # to 'prev'.
+            source = Source(N)
+            filter = DropFrames(drops, prev=source)
+
+            numpy.testing.assert_array_equal(
+                filter.indexMap, loopIndexMap(N, drops))
+            numpy.testing.assert_array_equal(
+                filter.reverseIndexMap, loopReverseIndexMap(N, drops))
+
+    def test_keyframes(self):
+        for trial in range(self.trials):
+            N = int(self.rng.integers(1, 400))
+            # An empty DropFrames is falsy, and KeyFrames would then not
+            # take it as its 'prev'.
+            drops = self.randomDrops(N) or {N - 1}
+            keyframes = set(self.rng.choice(
+                N, int(self.rng.integers(0, N + 1)), replace=False).tolist())
+
+            # Make sure some keyframes land on dropped frames.
+            keyframes.update(list(drops)[:5])
+
+            source = Source(N)
+            dropfilter = DropFrames(drops, prev=source)
+            filter = KeyFrames(keyframes, prev=dropfilter)
+
+            self.assertEqual(
+                filter.new_keyframes,
+                loopNewKeyframes(keyframes, dropfilter.cumulativeIndexMap))
+
+
+if __name__ == "__main__":
+    unittest.main()
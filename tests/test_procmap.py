@@ -0,0 +1,146 @@
+import unittest
+from fractions import Fraction as QQ
+from multiprocessing import shared_memory
+from unittest import mock
+
+import numpy
+from av import VideoFrame
+
+from transcode import procmap
+from transcode.avarrays import toAFrame, toNDArray
+from transcode.filters.video.flip import HFlip
+
+
+def videoFrames(count, format="yuv420p", width=64, height=48, seed=0):
+    rng = numpy.random.default_rng(seed)
+
+    for k in range(count):
+        A = rng.integers(0, 256, (height, width, 3), dtype=numpy.uint8)
+        frame = VideoFrame.from_ndarray(A, "rgb24")
+
+        if format != "rgb24":
+            frame = frame.reformat(format=format)
+
+        frame.pts = k
+        frame.time_base = QQ(1, 24)
+        yield frame
+
+
+def audioFrame(dtype, samples=1024, pts=2048):
+    rng = numpy.random.default_rng(1)
+
+    if numpy.dtype(dtype).kind == "f":
+        A = rng.uniform(-1, 1, (samples, 2)).astype(dtype)
+
+    else:
+        info = numpy.iinfo(dtype)
+        A = rng.integers(info.min, info.max, (samples, 2), dtype=dtype)
+
+    frame = toAFrame(A, layout="stereo")
+    frame.pts = pts
+    frame.time_base = QQ(1, 48000)
+    frame.rate = 48000
+    return frame
+
+
+class TestPack(unittest.TestCase):
+    def assertVideoEqual(self, frame, newframe):
+        self.assertEqual(newframe.format.name, frame.format.name)
+        self.assertEqual(newframe.pts, frame.pts)
+        self.assertEqual(newframe.time_base, frame.time_base)
+        numpy.testing.assert_array_equal(
+            newframe.to_ndarray(), frame.to_ndarray())
+
+    def test_video(self):
+        for format in ("rgb24", "yuv420p"):
+            frame, = videoFrames(1, format)
+            size = frame.to_ndarray().nbytes
+            buf = bytearray(2*size)
+
+            packed = procmap._pack(frame, buf, size, size)
+            self.assertIsNone(packed[3])
+            self.assertVideoEqual(frame, procmap._unpack(*packed, buf, size))
+
+    def test_toolarge(self):
+        frame, = videoFrames(1)
+        size = frame.to_ndarray().nbytes
+        buf = bytearray(size)
+
+        packed = procmap._pack(frame, buf, 0, size - 1)
+        self.assertIsNotNone(packed[3])
+        self.assertVideoEqual(frame, procmap._unpack(*packed, buf, 0))
+
+        packed = procmap._pack(frame, None, 0, 0)
+        self.assertVideoEqual(frame, procmap._unpack(*packed, None, 0))
+
+    def test_audio(self):
+        for dtype in (numpy.float32, numpy.int16):
+            frame = audioFrame(dtype)
+            A = toNDArray(frame)
+            buf = bytearray(A.nbytes)
+
+            packed = procmap._pack(frame, buf, 0, A.nbytes)
+            self.assertIsNone(packed[3])
+            newframe = procmap._unpack(*packed, buf, 0)
+
+            self.assertEqual(newframe.format.name, frame.format.name)
+            self.assertEqual(newframe.layout.name, "stereo")
+            self.assertEqual(newframe.rate, 48000)
+            self.assertEqual(newframe.pts, frame.pts)
+            self.assertEqual(newframe.time_base, frame.time_base)
+            numpy.testing.assert_array_equal(toNDArray(newframe), A)
+
+
+class TestProcessPool(unittest.TestCase):
+    def test_imap(self):
+        filter = HFlip()
+        expected = [filter._processFrame(frame).to_ndarray()
+                    for frame in videoFrames(12)]
+        results = list(procmap.imap(filter, videoFrames(12), nworkers=2,
+                                    maxinflight=3))
+
+        self.assertEqual([frame.pts for frame in results], list(range(12)))
+
+        for A, frame in zip(expected, results):
+            numpy.testing.assert_array_equal(frame.to_ndarray(), A)
+
+    def test_close(self):
+        closed = []
+
+        def frames():
+            try:
+                yield from videoFrames(100)
+
+            finally:
+                closed.append(True)
+
+        results = procmap.imap(HFlip(), frames(), nworkers=2)
+        next(results)
+        results.close()
+        self.assertEqual(closed, [True])
+
+    def test_startfailure(self):
+        # The shared memory segment must be unlinked if no pool starts.
+        names = []
+        SharedMemory = shared_memory.SharedMemory
+
+        def create(*args, **kwargs):
+            shm = SharedMemory(*args, **kwargs)
+            names.append(shm.name)
+            return shm
+
+        with mock.patch.object(procmap.shared_memory, "SharedMemory",
+                               create), \
+                mock.patch.object(procmap, "ProcessPoolExecutor",
+                                  side_effect=OSError("no processes")):
+            with self.assertRaises(OSError):
+                procmap.ProcessPool(HFlip(), 2, 1024, 1)
+
+        self.assertEqual(len(names), 1)
+
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(names[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 from av import AudioFrame, VideoFrame, AudioLayout, AudioFormat
+from fractions import Fraction as QQ
 import numpy
 
 _aformat_dtypes = {
@@ -269,3 +270,221 @@ def aconvert(frame, format):
     newframe.rate = frame.rate
     newframe.time_base = frame.time_base
     return newframe
+
+
+def _fullscale(dtype):
+    if dtype.kind == "f":
+        return 1
+
+    return 2**(8*dtype.itemsize - 1)
+
+
+def _zero(dtype):
+    """Sample value of silence (offset of unsigned formats)."""
+    if dtype.kind == "u":
+        return 2**(8*dtype.itemsize - 1)
+
+    return 0
+
+
+def _channelviews(frame):
+    """Per-channel views of the samples of an audio frame, without copying."""
+    dtype = numpy.dtype(_aformat_dtypes[frame.format.name])
+    nb_channels = len(frame.layout.channels)
+
+    if frame.format.is_planar:
+        return dtype, [
+            numpy.frombuffer(plane, dtype=dtype, count=frame.samples)
+            for plane in frame.planes[:nb_channels]]
+
+    A = numpy.frombuffer(frame.planes[0], dtype=dtype,
+                         count=frame.samples*nb_channels)
+    return dtype, list(A.reshape(frame.samples, nb_channels).transpose())
+
+
+class Rechunker(object):
+    """
+    Re-chunks audio frames into frames of exactly 'framesize' samples in
+    sample format 'format', as required by encoders with a fixed frame size,
+    stopping after 'samples' samples if given. Only the last frame may be
+    shorter. Timestamps follow those of the input across discontinuities.
+
+    Input frames are gathered 'seconds' seconds at a time into a planar
+    buffer of the output sample type, so that sample format conversion is
+    done once per block instead of once per frame, and output frames are
+    copied straight out of the buffer. 'format' and 'framesize' may be
+    changed until iteration starts (see EncoderContext.open).
+    """
+
+    framesize = 1024
+    seconds = 1
+
+    def __init__(self, frames, format="fltp", framesize=None, samples=None):
+        self.frames = frames
+        self.format = format
+        self.samples = samples
+
+        if framesize:
+            self.framesize = framesize
+
+        self._iter = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iter is None:
+            self._iter = self._iterFrames()
+
+        return next(self._iter)
+
+    def close(self):
+        if self._iter is not None:
+            self._iter.close()
+
+        if hasattr(self.frames, "close"):
+            self.frames.close()
+
+    def _iterFrames(self):
+        framesize = self.framesize
+        format = AudioFormat(self.format)
+        dtype = numpy.dtype(_aformat_dtypes[format.name])
+        samples = self.samples
+        buffer = None
+        pending = []
+        count = 0
+        start = end = 0
+        emitted = received = base = 0
+
+        def write():
+            """Converts pending input into buffer[:, end:]."""
+            nonlocal buffer, start, end, count
+            unread = end - start
+
+            if end + count > buffer.shape[1]:
+                if unread + count > buffer.shape[1]:
+                    newbuffer = numpy.empty(
+                        (len(buffer), unread + count), dtype=dtype)
+
+                else:
+                    newbuffer = buffer
+
+                newbuffer[:, :unread] = buffer[:, start:end]
+                buffer = newbuffer
+                start, end = 0, unread
+
+            srcdtype = pending[0][0]
+            scale = _fullscale(dtype)/_fullscale(srcdtype)
+
+            for c, row in enumerate(buffer[:, end:end + count]):
+                arrays = [views[c] for _, views in pending]
+
+                if srcdtype == dtype:
+                    numpy.concatenate(arrays, out=row)
+                    continue
+
+                A = numpy.concatenate(arrays).astype(numpy.float64)
+
+                if _zero(srcdtype):
+                    A -= _zero(srcdtype)
+
+                if scale != 1:
+                    A *= scale
+
+                if _zero(dtype):
+                    A += _zero(dtype)
+
+                if dtype.kind in "iu":
+                    info = numpy.iinfo(dtype)
+                    numpy.rint(A, out=A)
+                    numpy.clip(A, info.min, info.max, out=A)
+
+                row[...] = A
+
+            end += count
+            pending.clear()
+            count = 0
+
+        def emit(final=False):
+            nonlocal start, emitted
+
+            while end - start >= framesize or (final and end > start):
+                n = min(framesize, end - start)
+
+                if samples is not None:
+                    n = min(n, samples - emitted)
+
+                    if n <= 0:
+                        return
+
+                frame = AudioFrame(format=format.name, layout=layout,
+                                   samples=n)
+                B = buffer[:, start:start + n]
+
+                if format.is_planar:
+                    for plane, row in zip(frame.planes, B):
+                        A = numpy.frombuffer(plane, dtype=dtype, count=n)
+                        A[...] = row
+
+                else:
+                    A = numpy.frombuffer(frame.planes[0], dtype=dtype,
+                                         count=n*len(B))
+                    A.reshape(n, len(B))[...] = B.transpose()
+
+                frame.rate = rate
+                frame.time_base = time_base
+                frame.pts = int(pts + QQ(emitted - base, rate)/time_base
+                                + QQ(1, 2))
+                start += n
+                emitted += n
+                yield frame
+
+        for frame in self.frames:
+            if buffer is None:
+                layout = frame.layout.name
+                rate = frame.rate
+                time_base = frame.time_base
+                pts = frame.pts or 0
+                blocksize = max(1, int(rate*self.seconds/framesize))*framesize
+                buffer = numpy.empty((len(frame.layout.channels),
+                                      blocksize + framesize), dtype=dtype)
+                tolerance = max(1, QQ(1, rate)/time_base)
+
+            elif frame.pts is not None:
+                expected = pts + QQ(received - base, rate)/time_base
+
+                if abs(frame.pts - expected) > tolerance:
+                    """
+                    Discontinuity in input. Whole frames before it keep
+                    their timestamps. The remainder (less than a frame) is
+                    placed right before this frame, and timestamps continue
+                    from it.
+                    """
+                    if pending:
+                        write()
+
+                    yield from emit()
+                    pts = frame.pts - QQ(received - emitted, rate)/time_base
+                    base = emitted
+
+            received += frame.samples
+            srcdtype, views = _channelviews(frame)
+
+            if pending and pending[0][0] != srcdtype:
+                write()
+
+            pending.append((srcdtype, views))
+            count += frame.samples
+
+            if (samples is not None
+                    and emitted + end - start + count >= samples):
+                break
+
+            if count >= blocksize:
+                write()
+                yield from emit()
+
+        if pending:
+            write()
+
+        yield from emit(True)
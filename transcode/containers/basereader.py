@@ -150,7 +150,7 @@ class Track(object):
                     continue
 
                 if endpts is not None and frame.pts >= endpts:
-                    raise StopIteration
+                    return
 
                 yield frame
 
@@ -251,7 +251,7 @@ class Track(object):
                         continue
 
                     if endpts is not None and pts1 >= endpts:
-                        raise StopIteration
+                        return
 
                     framesdelivered += 1
                     frame.pts = pts1
@@ -264,7 +264,7 @@ class Track(object):
                     continue
 
                 if endpts is not None and pts >= endpts:
-                    raise StopIteration
+                    return
 
                 framesdelivered += 1
                 frame.pts = pts
@@ -14,8 +14,13 @@ import abc
 from fractions import Fraction as QQ
 from copy import deepcopy
 from ..encoders import vencoders, sencoders, aencoders
-from transcode.avarrays import toNDArray, toAFrame
+from transcode.avarrays import Rechunker
+from .. import rendercache
 import socket
+import heapq
+from operator import itemgetter
+from functools import reduce
+from math import gcd
 
 
 class TrackStats(EBMLNDArray):
@@ -72,6 +77,18 @@ class Track(abc.ABC):
 
     parent = WeakRefProperty("parent")
 
+    """
+    Stream-copy GOPs lying entirely inside the kept ranges of the source,
+    and use the encoder only for partial GOPs at cuts (see smartrender).
+    """
+    smartrender = False
+
+    """
+    Frames to encode, if set by multioutput.transcode, replacing those of
+    source and filters.
+    """
+    sharedframes = None
+
     def __init__(self, source, encoder=None, filters=None,
                  name=None, language=None, delay=0, container=None):
         self.source = source
@@ -112,6 +129,9 @@ class Track(abc.ABC):
         if self.delay:
             state["delay"] = self.delay
 
+        if self.smartrender:
+            state["smartrender"] = True
+
         return state
 
     def __setstate__(self, state):
@@ -120,6 +140,7 @@ class Track(abc.ABC):
         self.name = state.get("name")
         self.language = state.get("language")
         self.delay = state.get("delay", 0)
+        self.smartrender = bool(state.get("smartrender", False))
 
     def __deepcopy__(self, memo):
         """
@@ -234,55 +255,75 @@ class Track(abc.ABC):
                 yield exc
 
             else:
-                try:
-                    self.sizeStats = numpy.concatenate(
-                        (self.sizeStats, (self._sizes,)))
-
-                except Exception:
-                    self.sizeStats = numpy.array((self._sizes,))
+                self._saveSizes()
 
             if not exit:
                 while True:
                     yield None
 
         finally:
-            if sum(self._sizes) > 1024:
-                print(
-                    f"Track {self.track_index}: "
-                    f"{len(self._sizes):,d} packets, {h(sum(self._sizes))} "
-                    f"({sum(self._sizes):,d} bytes)", file=logfile)
+            self._printSizes(logfile)
+            packets.close()
 
-            else:
-                print(
-                    f"Track {self.track_index}: "
-                    f"{len(self._sizes):,d} packets, "
-                    f"{sum(self._sizes):,d} bytes", file=logfile)
+    def _saveSizes(self):
+        try:
+            self.sizeStats = numpy.concatenate(
+                (self.sizeStats, (self._sizes,)))
 
-            packets.close()
+        except Exception:
+            self.sizeStats = numpy.array((self._sizes,))
 
-    def _prepare(self, duration=None, logfile=None, **kwargs):
-        if self.type == "video":
-            print(f"Track {self.track_index}: Video, "
-                  f"{self.width}x{self.height}, "
-                  f"{1/self.defaultDuration/self.time_base} fps, "
-                  f"{self.format}", file=logfile)
+    def _printSizes(self, logfile=None):
+        if sum(self._sizes) > 1024:
+            print(
+                f"Track {self.track_index}: "
+                f"{len(self._sizes):,d} packets, {h(sum(self._sizes))} "
+                f"({sum(self._sizes):,d} bytes)", file=logfile)
 
-        elif self.type == "audio":
+        else:
             print(
-                f"Track {self.track_index}: Audio, {self.rate}Hz, "
-                f"{self.layout}, {self.format}", file=logfile)
+                f"Track {self.track_index}: "
+                f"{len(self._sizes):,d} packets, "
+                f"{sum(self._sizes):,d} bytes", file=logfile)
 
-        elif self.type == "subtitle":
-            print(f"Track {self.track_index}: Subtitles", file=logfile)
+    def _remuxPackets(self, packets, scale, duration=None):
+        """
+        Packets of a copied track, for BaseWriter._remux, as (t, packet)
+        where t is the packet's timestamp in units of 1/scale seconds.
+        """
+        hook = getattr(self, "_iterPacketHook", None)
+        hook = hook if callable(hook) else None
+        track_index = self.track_index
+        delay = int(self.delay/self.time_base)
+        factor = int(scale*self.source.time_base)
+        end = None if duration is None else duration/self.time_base
+        completed = False
 
-        if self.name:
-            print(f"    Name: {self.name}", file=logfile)
+        try:
+            for packet in packets:
+                packet.track_index = track_index
+                packet.pts += delay
 
-        if self.language:
-            print(f"    Language: {self.language}", file=logfile)
+                if hook is not None:
+                    packet = hook(packet)
 
-        if logfile:
-            logfile.flush()
+                if (end is not None and packet.keyframe
+                        and packet.pts >= end):
+                    break
+
+                if len(packet.data):
+                    yield (packet.pts*factor, packet)
+
+            completed = True
+
+        finally:
+            if completed:
+                self._saveSizes()
+
+            packets.close()
+
+    def _prepare(self, duration=None, logfile=None, **kwargs):
+        self._printInfo(logfile)
 
         if self.encoder:
             try:
@@ -304,6 +345,42 @@ class Track(abc.ABC):
 
         return self._iterPackets(packets, duration=duration, logfile=logfile)
 
+    def _prepareRemux(self, scale, duration=None, logfile=None):
+        """
+        Prepares a copied track for BaseWriter._remux. Packets are read on
+        the muxing thread itself (see _remuxPackets).
+        """
+        self._printInfo(logfile)
+        packets = self.openpackets(duration=duration, logfile=logfile,
+                                   workahead=False)
+        self._prepareentry(packets=packets, logfile=logfile)
+        self._sizes = []
+        return self._remuxPackets(packets, scale, duration)
+
+    def _printInfo(self, logfile=None):
+        if self.type == "video":
+            print(f"Track {self.track_index}: Video, "
+                  f"{self.width}x{self.height}, "
+                  f"{1/self.defaultDuration/self.time_base} fps, "
+                  f"{self.format}", file=logfile)
+
+        elif self.type == "audio":
+            print(
+                f"Track {self.track_index}: Audio, {self.rate}Hz, "
+                f"{self.layout}, {self.format}", file=logfile)
+
+        elif self.type == "subtitle":
+            print(f"Track {self.track_index}: Subtitles", file=logfile)
+
+        if self.name:
+            print(f"    Name: {self.name}", file=logfile)
+
+        if self.language:
+            print(f"    Language: {self.language}", file=logfile)
+
+        if logfile:
+            logfile.flush()
+
     @abc.abstractmethod
     def _prepareentry(self, packets, logfile=None, **kwargs):
         """
@@ -486,14 +563,24 @@ class Track(abc.ABC):
     def _iterFrames(self, duration=None, logfile=None):
         source = self.source
 
-        if self.filters:
+        if self.sharedframes is not None:
+            frames = self._until(self.sharedframes, duration)
+            rate = self.filters.rate if self.filters else source.rate
+
+        elif self.filters:
+            end = None
+
             if duration is not None:
-                frames = self.filters.iterFrames(
-                    end=int(duration/self.filters.time_base), whence="pts")
+                end = int(duration/self.filters.time_base)
+                frames = self.filters.iterFrames(end=end, whence="pts")
 
             else:
                 frames = self.filters.iterFrames()
 
+            if self.type == "video":
+                frames = rendercache.iterFrames(self.filters, frames, end,
+                                                logfile)
+
             rate = self.filters.rate
 
         elif source is not None:
@@ -507,42 +594,34 @@ class Track(abc.ABC):
             rate = self.source.rate
 
         if self.type == "audio":
-            samples = 0
-            N = int(rate*duration + 0.5)
-
-            for frame in frames:
-                self.container._checkpause()
+            return Rechunker(self._pausing(frames), self.format or "fltp",
+                             samples=int(rate*duration + 0.5))
 
-                if samples + frame.samples == N:
-                    yield frame
-                    break
+        return self._iterVideoFrames(frames, duration)
 
-                elif samples + frame.samples > N:
-                    pts = frame.pts
-                    time_base = frame.time_base
-                    A = toNDArray(frame)
-                    frame = toAFrame(A[:N - samples], frame.layout.name)
-                    frame.pts = pts
-                    frame.time_base = time_base
-                    frame.rate = rate
-                    yield frame
-                    break
+    @staticmethod
+    def _until(frames, duration=None):
+        for frame in frames:
+            if (duration is not None
+                    and frame.pts*frame.time_base >= duration):
+                break
 
-                yield frame
-                samples += frame.samples
+            yield frame
 
-        else:
-            for frame in frames:
-                self.container._checkpause()
+    def _pausing(self, frames):
+        for frame in frames:
+            self.container._checkpause()
+            yield frame
 
-                if (duration is not None
-                        and frame.pts*frame.time_base < duration):
-                    yield frame
+    def _iterVideoFrames(self, frames, duration=None):
+        for frame in frames:
+            self.container._checkpause()
 
-    def openencoder(self, duration=None, logfile=None, **kwargs):
-        frames = self._iterFrames(duration - self.delay, logfile)
-        print(f"    Codec: {self.codec}", file=logfile)
+            if (duration is not None
+                    and frame.pts*frame.time_base < duration):
+                yield frame
 
+    def _encoderkwargs(self, **kwargs):
         if self.type == "video":
             kwargs.update(width=self.width, height=self.height,
                           sample_aspect_ratio=self.sar,
@@ -557,15 +636,37 @@ class Track(abc.ABC):
             if self.format:
                 kwargs.update(format=self.format)
 
+        return kwargs
+
+    def openencoder(self, duration=None, logfile=None, **kwargs):
+        kwargs = self._encoderkwargs(**kwargs)
+
+        if self.smartrender:
+            from . import smartrender
+
+            if smartrender.supported(self, duration, logfile, **kwargs):
+                print(f"    Codec: {self.codec} (smart render)",
+                      file=logfile)
+                return smartrender.iterPackets(
+                    self.source, self.encoder, self.time_base,
+                    smartrender.framecount(self.source,
+                                           duration - self.delay),
+                    logfile=logfile, **kwargs)
+
+        frames = self._iterFrames(duration - self.delay, logfile)
+        print(f"    Codec: {self.codec}", file=logfile)
         packets = self.encoder.create(
             frames, logfile=logfile, time_base=self.time_base, **kwargs)
         packets.open()
         return packets
 
-    def openpackets(self, duration=None, logfile=None):
+    def openpackets(self, duration=None, logfile=None, workahead=True):
         print(f"    Codec: {self.codec} (copy)", file=logfile)
         packets = self.source.iterPackets()
 
+        if not workahead:
+            return packets
+
         if (hasattr(self.source, "defaultDuration")
                 and self.source.defaultDuration):
             return WorkaheadIterator(
@@ -723,11 +824,16 @@ class BaseWriter(abc.ABC):
         │           │       None, handles notifyvencode if provided)
         │           ├─ packets = track.openpackets() (if track.encoder is None)
         │           └─ track._iterPackets(packets)
+        │       (if every track is copied, track._prepareRemux() is called
+        │           instead, and packets are read without workahead)
         ├─ self._multiplex()
         │   └─ for packet in self._iterPackets():
         │       ├─ self._checkpause(notifypause)
         │       ├─ self._mux(packet) (OVERRIDE in subclass)
         │       └─ notifymux(packet) (if notifymux is provided)
+        │   (if every track is copied, self._remux() is used instead,
+        │       calling self._checkpause() only every
+        │       self.remuxcheckinterval bytes)
         ├─ self._closepackets(self._iterators)
         │   └─ iterator.close() (for iterator in self._iterators)
         └─ self._wrapup()
@@ -762,6 +868,9 @@ class BaseWriter(abc.ABC):
     trackclass = Track
     config = WeakRefProperty("config")
 
+    """Bytes muxed between checks for low disk space when remuxing."""
+    remuxcheckinterval = 16*1024**2
+
     def __init__(self, outputpath, tracks=[], targetsize=None, config=None):
         self.config = config
         self.outputpath = outputpath
@@ -968,6 +1077,9 @@ class BaseWriter(abc.ABC):
             try:
                 iterator.close()
 
+                if self.remuxonly:
+                    self.tracks[k]._printSizes(logfile)
+
             except Exception:
                 print(
                     "!!! EXCEPTION encountered while printing summary !!!",
@@ -1080,6 +1192,9 @@ class BaseWriter(abc.ABC):
 
     def _multiplex(self, iterators, logfile=None,
                    notifymux=None, notifypaused=None):
+        if self.remuxonly:
+            return self._remux(iterators, logfile, notifymux, notifypaused)
+
         for packet in self._iterPackets(*iterators):
             self._checkpause(notifypaused)
 
@@ -1098,6 +1213,37 @@ class BaseWriter(abc.ABC):
 
             track._sizes.append(size)
 
+    def _remux(self, iterators, logfile=None,
+               notifymux=None, notifypaused=None):
+        """
+        Multiplexes the packets of copied tracks (see Track._prepareRemux),
+        interleaved by integer timestamps. Low disk space and stop requests
+        are only checked for every 'remuxcheckinterval' bytes.
+        """
+        mux = self._mux
+        sizes = [track._sizes.append for track in self.tracks]
+        adjust = [4 if track.codec in ("hevc", "libx265") else 0
+                  for track in self.tracks]
+        unchecked = self.remuxcheckinterval
+
+        for t, packet in heapq.merge(*iterators, key=itemgetter(0)):
+            if unchecked >= self.remuxcheckinterval:
+                self._checkpause(notifypaused)
+
+                if self._stop.isSet():
+                    return
+
+                unchecked = 0
+
+            size = mux(packet)
+            unchecked += size
+
+            if notifymux is not None:
+                notifymux(packet, size)
+
+            k = packet.track_index
+            sizes[k](size - adjust[k])
+
     def open(self, logfile=None):
         try:
             self._open()
@@ -1161,6 +1307,19 @@ class BaseWriter(abc.ABC):
         else:
             bitrate = None
 
+        if self.remuxonly:
+            scale = reduce(lambda a, b: a*b//gcd(a, b), [
+                QQ(track.source.time_base).denominator
+                for track in self.tracks], 1)
+            iterators = [
+                track._prepareRemux(scale, self.duration, logfile)
+                for track in self.tracks]
+
+            if logfile:
+                logfile.flush()
+
+            return iterators
+
         iterators = []
 
         for k, (track,
@@ -1195,6 +1354,12 @@ class BaseWriter(abc.ABC):
 
         return iterators
 
+    @property
+    def remuxonly(self):
+        """Whether every track is copied (see _remux)."""
+        return len(self.tracks) > 0 and all(
+            track.encoder is None for track in self.tracks)
+
     @property
     def vtrack(self):
         for track in self.tracks:
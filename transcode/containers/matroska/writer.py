@@ -361,18 +361,19 @@ class Track(basewriter.Track):
                 if atom.segment is self.container
                 and (not atom.tracks or self in atom.tracks)})
 
-            for frame in frames:
-                if (len(key_pts)
-                        and frame.pts*frame.time_base
-                        >= key_pts[0]*self.time_base):
-                    frame.pict_type = "I"
-                    del key_pts[0]
+            return self._forceKeyframes(frames, key_pts)
 
-                yield frame
+        return frames
 
-        else:
-            for frame in frames:
-                yield frame
+    def _forceKeyframes(self, frames, key_pts):
+        for frame in frames:
+            if (len(key_pts)
+                    and frame.pts*frame.time_base
+                    >= key_pts[0]*self.time_base):
+                frame.pict_type = "I"
+                del key_pts[0]
+
+            yield frame
 
     def _iterPacketHook(self, packet):
         if (self.container is not None
@@ -0,0 +1,407 @@
+"""
+Concurrent transcoding of several output files, decoding and filtering
+each common prefix of their pipelines once.
+"""
+
+import sys
+import threading
+from collections import OrderedDict, deque
+
+import numpy
+from av import AudioFrame, VideoFrame
+
+from ..filters.slice import Slice
+from ..filters.concatenate import Concatenate
+from ..filters.crossfade import CrossFade
+from .. import rendercache
+
+"""Maximum lead of a branch over the slowest one (seconds), by type."""
+maxlead = {"video": 1, "audio": 60}
+
+
+def copyFrame(frame):
+    """Copy of audio or video frame 'frame', data and timestamps."""
+    if isinstance(frame, VideoFrame):
+        copy = VideoFrame(frame.width, frame.height, frame.format.name)
+        copy.pict_type = frame.pict_type
+
+        for src, dest in zip(frame.planes, copy.planes):
+            A = numpy.frombuffer(src, dtype=numpy.uint8)
+            A = A.reshape(-1, src.line_size)
+            B = numpy.frombuffer(dest, dtype=numpy.uint8)
+            B = B.reshape(-1, dest.line_size)
+            rows = min(len(A), len(B))
+            cols = min(src.line_size, dest.line_size)
+            B[:rows, :cols] = A[:rows, :cols]
+
+    elif isinstance(frame, AudioFrame):
+        copy = AudioFrame(format=frame.format.name,
+                          layout=frame.layout.name, samples=frame.samples)
+        copy.rate = frame.rate
+
+        for src, dest in zip(frame.planes, copy.planes):
+            A = numpy.frombuffer(src, dtype=numpy.uint8)
+            B = numpy.frombuffer(dest, dtype=numpy.uint8)
+            n = min(len(A), len(B))
+            B[:n] = A[:n]
+
+    else:
+        raise TypeError(
+            "Expected AudioFrame or VideoFrame, got"
+            f" {frame.__class__.__name__} instead.")
+
+    copy.pts = frame.pts
+    copy.time_base = frame.time_base
+    return copy
+
+
+class TeeBranch(object):
+    """Iterator over the frames of a Tee."""
+
+    def __init__(self, tee, index):
+        self.tee = tee
+        self.index = index
+        self.pos = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.tee._next(self)
+
+    def close(self):
+        self.tee._close(self)
+
+
+class Tee(object):
+    """
+    Hands the frames of 'frames' to several branches, each getting its own
+    copy. No branch gets more than 'maxlead' seconds ahead.
+    """
+
+    def __init__(self, frames, maxlead=1):
+        self.frames = iter(frames)
+        self.maxlead = maxlead
+        self.branches = []
+        self._buffer = deque()
+        self._base = 0
+        self._cond = threading.Condition()
+        self._pulling = False
+        self._exhausted = False
+        self._exception = None
+
+    def branch(self):
+        """New branch. All branches must be created before iterating."""
+        branch = TeeBranch(self, len(self.branches))
+        self.branches.append(branch)
+        return branch
+
+    def _slowest(self):
+        return min((branch.pos for branch in self.branches
+                    if not branch.closed), default=None)
+
+    def _ahead(self, branch):
+        """Whether 'branch', needing a new frame, must wait for others."""
+        slowest = self._slowest()
+
+        if slowest is None or slowest >= self._base + len(self._buffer):
+            return False
+
+        t0 = self._buffer[slowest - self._base][-1]
+        t1 = self._buffer[-1][-1]
+        return t1 - t0 >= self.maxlead
+
+    def _trim(self):
+        slowest = self._slowest()
+
+        if slowest is None:
+            self._base += len(self._buffer)
+            self._buffer.clear()
+            return
+
+        while self._base < slowest and self._buffer:
+            self._buffer.popleft()
+            self._base += 1
+
+    def _pull(self):
+        """Pulls a frame from upstream, with self._cond released."""
+        self._pulling = True
+        active = [not branch.closed for branch in self.branches]
+        self._cond.release()
+
+        try:
+            frame = next(self.frames)
+
+            """
+            Downstream filters and encoders may modify frames in place
+            (pts, pict_type, ...). The first open branch gets the frame
+            itself, and every other open branch a copy.
+            """
+            first = active.index(True)
+            frames = [frame if k == first
+                      else copyFrame(frame) if isactive else None
+                      for k, isactive in enumerate(active)]
+
+        except StopIteration:
+            frame = None
+            exc = None
+
+        except BaseException as e:
+            frame = None
+            exc = e
+
+        else:
+            exc = None
+
+        finally:
+            self._cond.acquire()
+            self._pulling = False
+            self._cond.notify_all()
+
+        if frame is None:
+            self._exhausted = True
+            self._exception = exc
+            return
+
+        if frame.pts is not None:
+            t = float(frame.pts*frame.time_base)
+
+        elif self._buffer:
+            t = self._buffer[-1][-1]
+
+        else:
+            t = 0
+
+        self._buffer.append((frames, t))
+
+    def _next(self, branch):
+        with self._cond:
+            while True:
+                if branch.closed:
+                    raise StopIteration
+
+                k = branch.pos - self._base
+
+                if k < len(self._buffer):
+                    frames, t = self._buffer[k]
+                    frame = frames[branch.index]
+                    frames[branch.index] = None
+                    branch.pos += 1
+                    self._trim()
+                    self._cond.notify_all()
+                    break
+
+                if self._exhausted:
+                    if self._exception is not None:
+                        raise self._exception
+
+                    raise StopIteration
+
+                if self._pulling or self._ahead(branch):
+                    self._cond.wait()
+                    continue
+
+                self._pull()
+
+        return frame
+
+    def _close(self, branch):
+        with self._cond:
+            branch.closed = True
+            self._trim()
+            self._cond.notify_all()
+
+            if (self._pulling or self._exhausted
+                    or any(not b.closed for b in self.branches)):
+                return
+
+            self._exhausted = True
+
+        if hasattr(self.frames, "close"):
+            self.frames.close()
+
+
+def _streamable(stage):
+    """Whether 'stage' can process the frames of its prev from a Tee."""
+    return not isinstance(stage, (Slice, Concatenate, CrossFade))
+
+
+class _Node(object):
+    """Pipeline stage shared by the tracks passing through it."""
+
+    def __init__(self, stage, type, parent=None):
+        self.stage = stage
+        self.type = type
+        self.parent = parent
+        self.children = OrderedDict()
+        self.tracks = []
+        self.input = None
+        self.open = 0
+
+    def users(self):
+        """Children fed from this node, and tracks ending here."""
+        return ([child for child in self.children.values()
+                 if _streamable(child.stage)] + self.tracks)
+
+    def connect(self, upstream=None):
+        self.input = upstream
+
+        if upstream is None:
+            frames = self.stage.iterFrames()
+
+        else:
+            frames = self.stage.processFrames(upstream)
+
+        users = self.users()
+        self.open = len(users)
+
+        if len(users) > 1:
+            tee = Tee(frames, maxlead.get(self.type, 1))
+            inputs = [tee.branch() for user in users]
+
+        else:
+            inputs = [frames]
+
+        for user, frames in zip(users, inputs):
+            if isinstance(user, _Node):
+                user.connect(frames)
+
+            else:
+                user.sharedframes = frames
+
+        for child in self.children.values():
+            if not _streamable(child.stage):
+                child.connect()
+
+    def release(self):
+        """Called when a user is done. Closes 'input' once all are."""
+        self.open -= 1
+
+        if self.open > 0 or self.input is None:
+            return
+
+        if hasattr(self.input, "close"):
+            self.input.close()
+
+        if self.parent is not None and _streamable(self.stage):
+            self.parent.release()
+
+    def count(self):
+        return len(self.tracks) + sum(child.count()
+                                      for child in self.children.values())
+
+    def walk(self):
+        yield self
+
+        for child in self.children.values():
+            yield from child.walk()
+
+
+def _stages(track):
+    return [track.source] + list(track.filters or [])
+
+
+def plan(outputfiles):
+    """
+    Builds the tree of pipeline stages of all encoded tracks of
+    'outputfiles'. Returns the list of root nodes (one per source).
+    Tracks that are smart rendered or copied are left out.
+    """
+    roots = OrderedDict()
+
+    for outputfile in outputfiles:
+        for track in outputfile.tracks:
+            if (track.encoder is None or track.smartrender
+                    or track.type not in ("video", "audio")):
+                continue
+
+            stages = _stages(track)
+            key = id(stages[0])
+
+            if key not in roots:
+                roots[key] = _Node(stages[0], track.type)
+
+            node = roots[key]
+
+            for stage in stages[1:]:
+                key = rendercache.digest(stage)
+
+                if key is None:
+                    """Filter state cannot be compared. Share no further."""
+                    key = id(stage)
+
+                if key not in node.children:
+                    node.children[key] = _Node(stage, track.type, node)
+
+                node = node.children[key]
+
+            node.tracks.append(track)
+
+    return list(roots.values())
+
+
+def _describe(node, depth=0, logfile=None):
+    name = getattr(node.stage, "name", None) or type(node.stage).__name__
+    print(f"    {'  '*depth}{name}: {node.count()} track(s)", file=logfile)
+
+    for child in node.children.values():
+        _describe(child, depth + 1, logfile)
+
+
+def transcode(outputfiles, pass_=0, encoderoverrides=None, logfile=None):
+    """
+    Transcodes 'outputfiles' concurrently, sharing decoding and filtering
+    between them. 'encoderoverrides', if given, is a list with one entry
+    per output file, as passed to BaseWriter.transcode. Exceptions raised
+    by any output file are re-raised once all of them have finished.
+    """
+    if encoderoverrides is None:
+        encoderoverrides = [[] for outputfile in outputfiles]
+
+    roots = plan(outputfiles)
+    nodes = {id(track): node for root in roots for node in root.walk()
+             for track in node.tracks}
+    lock = threading.Lock()
+    print("--- Shared decoding ---", file=logfile)
+
+    for root in roots:
+        _describe(root, logfile=logfile)
+        root.connect()
+
+    errors = [None]*len(outputfiles)
+
+    def run(k, outputfile, overrides):
+        try:
+            outputfile.transcode(pass_, overrides, logfile)
+
+        except BaseException:
+            errors[k] = sys.exc_info()
+
+        finally:
+            for track in outputfile.tracks:
+                frames, track.sharedframes = track.sharedframes, None
+
+                if frames is None:
+                    continue
+
+                if hasattr(frames, "close"):
+                    frames.close()
+
+                with lock:
+                    nodes[id(track)].release()
+
+    threads = [threading.Thread(target=run, args=(k, outputfile, overrides),
+                                name=f"Transcode-{k}")
+               for k, (outputfile, overrides)
+               in enumerate(zip(outputfiles, encoderoverrides))]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    for error in errors:
+        if error is not None:
+            raise error[1]
@@ -0,0 +1,288 @@
+"""
+Smart rendering for output tracks whose source is an input track, a Slice of
+one, or a Concatenate of such sources.
+
+The frames kept from each input track are split at the track's keyframes.
+GOPs lying entirely inside a kept range are stream-copied, and only the
+partial GOPs at the cuts are decoded and re-encoded. Each run of re-encoded
+frames gets a fresh encoder context, so that it starts on a keyframe and
+ends with a closed GOP.
+
+Re-encoded packets are spliced between copied ones as they are, and the
+output track keeps the source's codec private data. The encoder must
+therefore use the source's codec and produce identical extradata (see
+'supported'). GOPs of the source are assumed to be closed: leading pictures
+of an open GOP (presented before its keyframe) are dropped from the copy,
+since those frames are re-encoded with the preceding cut.
+"""
+
+from fractions import Fraction as QQ
+from itertools import islice
+
+import numpy
+
+from ..filters.slice import Slice
+from ..filters.concatenate import Concatenate
+from .basereader import Track as InputTrack
+
+COPY = "copy"
+ENCODE = "encode"
+
+
+def spans(source):
+    """
+    Returns the frames making up 'source' as a list of (track, start, end)
+    tuples, each a range [start, end) of frames of an input track.
+    """
+    if isinstance(source, InputTrack):
+        return [(source, 0, source.framecount)]
+
+    if isinstance(source, Slice):
+        return restrict(spans(source.prev), source.prev_start,
+                        source.prev_end)
+
+    if isinstance(source, Concatenate):
+        return [span for segment in source for span in spans(segment)]
+
+    raise TypeError(
+        f"Smart rendering not supported for {source.__class__.__name__}.")
+
+
+def restrict(spans, start, end):
+    """Restrict 'spans' to frames [start, end) of their concatenation."""
+    results = []
+    N = 0
+
+    for track, a, b in spans:
+        lo = max(a, a + start - N)
+        hi = min(b, a + end - N)
+
+        if lo < hi:
+            results.append((track, lo, hi))
+
+        N += b - a
+
+    return results
+
+
+def keyframeIndices(track):
+    """Frame indices of the keyframes of input track 'track'."""
+    return numpy.searchsorted(track.pts, track.index[:, 0])
+
+
+def plan(source, count=None):
+    """
+    Splits the first 'count' frames of 'source' into runs. Returns a list of
+    (mode, n, parts), where mode is COPY or ENCODE, n is the frame number
+    (in 'source') of the first frame of the run, and parts is a list of
+    (track, start, end) tuples. Runs to be copied always have exactly one
+    part. Adjacent runs to be encoded are merged, even across input tracks.
+    """
+    S = spans(source)
+
+    if count is not None:
+        S = restrict(S, 0, count)
+
+    runs = []
+    n = 0
+
+    for track, a, b in S:
+        K = numpy.append(keyframeIndices(track), track.framecount)
+        k1 = max(a, int(K[numpy.searchsorted(K, a)]))
+        k2 = min(b, int(K[numpy.searchsorted(K, b, side="right") - 1]))
+
+        if k1 >= k2:
+            pieces = [(ENCODE, a, b)]
+
+        else:
+            pieces = [(ENCODE, a, k1), (COPY, k1, k2), (ENCODE, k2, b)]
+
+        for mode, x, y in pieces:
+            if x >= y:
+                continue
+
+            if mode == ENCODE and runs and runs[-1][0] == ENCODE:
+                runs[-1][2].append((track, x, y))
+
+            else:
+                runs.append((mode, n, [(track, x, y)]))
+
+            n += y - x
+
+    return runs
+
+
+def framecount(source, duration=None):
+    """Number of frames of 'source' presented before 'duration'."""
+    if duration is None:
+        return source.framecount
+
+    return int(numpy.searchsorted(source.pts_time, float(duration)))
+
+
+def _rescale(packet, time_base, pts):
+    if packet.duration:
+        packet.duration = int(
+            packet.duration*packet.time_base/time_base + 0.5)
+
+    packet.pts = pts
+    packet.time_base = time_base
+    return packet
+
+
+def _copyPackets(source, n, track, start, end, time_base):
+    """
+    Packets of frames [start, end) of input track 'track' (start being a
+    keyframe), with presentation times moved to those of frames n, n + 1,
+    ... of 'source'.
+    """
+    startpts = track.pts[start]
+    endpts = track.pts[end] if end < track.framecount else None
+    offset = QQ(int(source.pts[n]))*source.time_base
+    packets = track.iterPackets(startpts)
+
+    try:
+        for packet in packets:
+            if (endpts is not None and packet.keyframe
+                    and packet.pts >= endpts):
+                break
+
+            if packet.pts < startpts:
+                continue
+
+            k = int(numpy.searchsorted(track.pts, packet.pts))
+
+            if k < end and track.pts[k] == packet.pts:
+                T = source.pts[n + k - start]*source.time_base
+
+            else:
+                T = offset + (packet.pts - startpts)*packet.time_base
+
+            yield _rescale(packet, time_base, int(T/time_base + 0.5))
+
+    finally:
+        if hasattr(packets, "close"):
+            packets.close()
+
+
+def _iterFrames(source, n, parts):
+    """
+    Decoded frames of 'parts', stamped with the presentation times of
+    frames n, n + 1, ... of 'source'.
+    """
+    pts = source.pts
+    time_base = source.time_base
+
+    for track, start, end in parts:
+        frames = track.iterFrames(start, end, "framenumber")
+
+        try:
+            for frame in islice(frames, end - start):
+                frame.pts = int(pts[n])
+                frame.time_base = time_base
+                n += 1
+                yield frame
+
+        finally:
+            if hasattr(frames, "close"):
+                frames.close()
+
+
+def _encodePackets(source, n, parts, encoder, time_base, logfile=None,
+                   **kwargs):
+    frames = _iterFrames(source, n, parts)
+    context = encoder.create(frames, logfile=logfile, time_base=time_base,
+                             **kwargs)
+
+    try:
+        context.open()
+
+        for packet in context:
+            if packet.time_base != time_base:
+                packet = _rescale(
+                    packet, time_base,
+                    int(packet.pts*packet.time_base/time_base + 0.5))
+
+            yield packet
+
+    finally:
+        context.close()
+        frames.close()
+
+
+def iterPackets(source, encoder, time_base, count=None, logfile=None,
+                **kwargs):
+    """
+    Packets of the first 'count' frames of 'source', in 'time_base', with
+    whole GOPs stream-copied and frames around cuts re-encoded by 'encoder'
+    (an EncoderConfig). Additional keyword arguments are passed to
+    encoder.create.
+    """
+    runs = plan(source, count)
+    copied = sum(b - a for mode, n, parts in runs if mode == COPY
+                 for track, a, b in parts)
+    encoded = sum(b - a for mode, n, parts in runs if mode == ENCODE
+                  for track, a, b in parts)
+    print(f"    Smart render: {copied:,d} frames copied, {encoded:,d} frames "
+          f"re-encoded in {sum(mode == ENCODE for mode, *_ in runs):,d} "
+          "runs.", file=logfile)
+
+    for mode, n, parts in runs:
+        if mode == COPY:
+            (track, start, end), = parts
+            yield from _copyPackets(source, n, track, start, end, time_base)
+
+        else:
+            yield from _encodePackets(source, n, parts, encoder, time_base,
+                                      logfile=logfile, **kwargs)
+
+
+def supported(track, duration=None, logfile=None, **kwargs):
+    """
+    Checks whether output track 'track' can be smart rendered: its source
+    must be made of input tracks (see 'spans'), it must not have filters,
+    its encoder must use the source's codec, and an encoder created with
+    'kwargs' must produce the source's codec private data. The last check
+    encodes the first frame of the source.
+    """
+    source = track.source
+
+    def reject(reason):
+        print(f"    Smart render not possible: {reason}", file=logfile)
+        return False
+
+    if track.filters:
+        return reject("Track has filters.")
+
+    try:
+        spans(source)
+
+    except TypeError as exc:
+        return reject(str(exc))
+
+    if track.encoder.codec != source.codec:
+        return reject(f"Encoder codec '{track.encoder.codec}' differs from "
+                      f"source codec '{source.codec}'.")
+
+    frames = islice(source.iterFrames(), 1)
+    context = track.encoder.create(frames, time_base=track.time_base,
+                                   **kwargs)
+
+    try:
+        context.open()
+        extradata = context.extradata
+
+    except Exception as exc:
+        return reject(f"Encoder failed to open ({exc}).")
+
+    finally:
+        try:
+            context.close()
+
+        except Exception:
+            pass
+
+    if (extradata or b"") != (source.extradata or b""):
+        return reject("Encoder codec private data differs from source.")
+
+    return True
@@ -2,7 +2,8 @@ import av
 from collections import deque, OrderedDict
 from fractions import Fraction as QQ
 from ..util import Packet
-from ..avarrays import aconvert
+from ..avarrays import aconvert, Rechunker
+from ..nal import AnnexB, encoders
 
 
 class EncoderContext(object):
@@ -34,6 +35,7 @@ class EncoderContext(object):
         self._noMoreFrames = False
         self._success = False
         self._pts = 0
+        self._annexb = None
 
     @property
     def extradata(self):
@@ -43,9 +45,24 @@ class EncoderContext(object):
         self._encoder.open()
         self._isopen = True
 
+        if self._encoder.type == "audio":
+            if not isinstance(self._framesource, Rechunker):
+                self._framesource = Rechunker(self._framesource)
+
+            self._framesource.format = self._encoder.format.name
+
+            if self._encoder.frame_size:
+                self._framesource.framesize = self._encoder.frame_size
+
         while len(self._packets) == 0:
             self._sendframe()
 
+        if self._encoder.name in encoders:
+            """Annex-B output, to be stored length-prefixed (see nal)."""
+            self._annexb = AnnexB(self._encoder.name)
+            self._encoder.extradata = self._annexb.configure(
+                self._encoder.extradata or self._packets[0])
+
     def stop(self):
         packets = self._encoder.encode()
         self._packets.extend(packets)
@@ -98,15 +115,21 @@ class EncoderContext(object):
 
         packet = self._packets.popleft()
 
+        if self._annexb is not None:
+            data = self._annexb.convert(packet)
+
+        else:
+            data = packet.to_bytes()
+
         if packet.pts is None or self._encoder.type == "audio":
             packet = Packet(
-                data=packet.to_bytes(), pts=self._pts,
+                data=data, pts=self._pts,
                 duration=packet.duration, keyframe=packet.is_keyframe,
                 time_base=packet.time_base)
 
         else:
             packet = Packet(
-                data=packet.to_bytes(), pts=packet.pts,
+                data=data, pts=packet.pts,
                 duration=packet.duration, keyframe=packet.is_keyframe,
                 time_base=packet.time_base)
 
@@ -5,6 +5,7 @@ import os
 import fcntl
 from fractions import Fraction as QQ
 from ...util import Packet
+from ...nal import AnnexB
 from collections import OrderedDict
 import time
 import lzma
@@ -144,67 +145,8 @@ class libx265EncoderContext(EncoderContext):
             self.close()
             raise
 
-        packet = self._packets[0]
-
-        configurationVersion = 0b00000001
-
-        general_profile_space = 0b00
-        general_tier_flag = 0b1
-        general_profile_idc = 0b00001
-
-        general_profile_compatibility_flags = \
-            0b01100000000000000000000000000000
-
-        general_constraint_indicator_flags = \
-            0b100100000000000000000000000000000000000000000000
-
-        general_level_idc = 0b10010110
-
-        min_spatial_segmentation_idc = 0b000000000000
-        parallelismType = 0b00
-        chromaFormat = 0b01
-        bitDepthLumaMinus8 = 0b000
-        bitDepthChromaMinus8 = 0b000
-        avgFrameRate = 0b0000000000000000
-
-        constantFrameRate = 0b00
-        numTemporalLayers = 0b001
-        temporalIdNested = 0b1
-        lengthSizeMinusOne = 0b11
-
-        data = configurationVersion.to_bytes(1, "big")
-        data += (general_profile_space << 6 | general_tier_flag <<
-                 5 | general_profile_idc).to_bytes(1, "big")
-        data += general_profile_compatibility_flags.to_bytes(4, "big")
-        data += general_constraint_indicator_flags.to_bytes(6, "big")
-        data += general_level_idc.to_bytes(1, "big")
-        data += (0b1111 << 12
-                 | min_spatial_segmentation_idc).to_bytes(2, "big")
-        data += (0b111111 << 2 | parallelismType).to_bytes(1, "big")
-        data += (0b111111 << 2 | chromaFormat).to_bytes(1, "big")
-        data += (0b11111 << 3 | bitDepthLumaMinus8).to_bytes(1, "big")
-        data += (0b11111 << 3 | bitDepthChromaMinus8).to_bytes(1, "big")
-        data += avgFrameRate.to_bytes(2, "big")
-        data += (constantFrameRate << 6
-                 | numTemporalLayers << 3
-                 | temporalIdNested << 2
-                 | lengthSizeMinusOne).to_bytes(1, "big")
-
-        data += int.to_bytes(4, 1, "big")
-
-        pattern = b"(?:\\x00{2,3}\\x01)([\\x00-\\xff]+?)"
-        nal1, nal2, nal3, nal4, pktdata = regex.findall(
-            b"^" + 5*pattern + b"$", packet.to_bytes())[0]
-
-        NALtypes = [0b100000, 0b100001, 0b100010, 0b100111]
-
-        for naltype, p in zip(NALtypes, (nal1, nal2, nal3, nal4)):
-            data += naltype.to_bytes(1, "big")
-            data += int.to_bytes(1, 2, "big")
-            data += len(p).to_bytes(2, "big")
-            data += p
-
-        self._encoder.extradata = data
+        self._annexb = AnnexB("hevc")
+        self._encoder.extradata = self._annexb.configure(self._packets[0])
 
     def _readstats(self):
         stats = self._stats or "x265_2pass.log"
@@ -399,20 +341,13 @@ class libx265EncoderContext(EncoderContext):
         self.procStats()
         packet = self._packets.popleft()
 
-        if packet.is_keyframe:
-            pattern = b"(?:\\x00{2,3}\\x01)([\\x00-\\xff]+?)"
-            nal1, nal2, nal3, nal4, data = regex.findall(
-                b"^" + 5*pattern + b"$", packet.to_bytes())[0]
-
-        else:
-            data = packet.to_bytes()[4:]
-
+        data = self._annexb.convert(packet)
         self._packetsEncoded += 1
-        self._streamSize += len(data) - 4
+        self._streamSize += len(data)
         self._t1 = time.time()
 
         packet = Packet(
-            data=len(data).to_bytes(4, "big")+data, pts=packet.pts,
+            data=data, pts=packet.pts,
             duration=packet.duration, keyframe=packet.is_keyframe,
             time_base=packet.time_base)
 
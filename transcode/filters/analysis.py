@@ -0,0 +1,257 @@
+"""
+Several analyses (crop, levels, scenes, loudness) run concurrently over a
+single decode of each source.
+"""
+
+import queue
+import threading
+from functools import partial
+from itertools import islice
+
+
+class Cancelled(Exception):
+    """Raised from the frames of an analyzer when its analysis is cancelled."""
+
+
+class Analyzer(object):
+    """
+    One analysis of frames of 'source' in 'ranges', a list of [a, b) frame
+    number ranges. 'func' is called with an iterable of those frames, in
+    order, on a thread of its own, and must not modify them.
+    """
+
+    def __init__(self, source, ranges, func, name=None):
+        self.source = source
+        self.ranges = sorted((int(a), int(b)) for (a, b) in ranges if a < b)
+        self.func = func
+        self.name = name
+        self.result = None
+        self.exception = None
+        self.cancelled = False
+
+    def __repr__(self):
+        return f"<Analyzer {self.name or self.func!r} on {self.source!r}>"
+
+
+def mergeRanges(ranges):
+    """Union of [a, b) ranges, as a sorted list of disjoint ranges."""
+    merged = []
+
+    for a, b in sorted(ranges):
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(b, merged[-1][1]))
+
+        else:
+            merged.append((a, b))
+
+    return merged
+
+
+class _Feed(object):
+    """Frames of one analyzer, through a bounded queue."""
+
+    _end = object()
+    _cancel = object()
+
+    def __init__(self, analyzer, buffersize):
+        self.analyzer = analyzer
+        self.queue = queue.Queue(buffersize)
+        self.done = threading.Event()
+        self.closed = False
+        self.ended = False
+        self._k = 0
+        self.thread = threading.Thread(
+            target=self._run, name=f"Analyzer-{analyzer.name or ''}",
+            daemon=True)
+
+    def __iter__(self):
+        while True:
+            frame = self.queue.get()
+
+            if frame is self._end:
+                self.ended = True
+                return
+
+            if frame is self._cancel:
+                self.ended = True
+                raise Cancelled("Analysis cancelled.")
+
+            yield frame
+
+    def _run(self):
+        try:
+            self.analyzer.result = self.analyzer.func(iter(self))
+
+        except Cancelled:
+            self.analyzer.cancelled = True
+
+        except BaseException as exc:
+            self.analyzer.exception = exc
+
+        finally:
+            self.done.set()
+
+            """Keep the queue drained, so that the decoder never blocks."""
+            while not self.ended:
+                item = self.queue.get()
+                self.ended = item is self._end or item is self._cancel
+
+    def wants(self, n):
+        """Whether frame n is in the analyzer's ranges."""
+        ranges = self.analyzer.ranges
+
+        while self._k < len(ranges) and ranges[self._k][1] <= n:
+            self._k += 1
+
+        return self._k < len(ranges) and ranges[self._k][0] <= n
+
+    @property
+    def finished(self):
+        """Whether the analyzer needs no frame at or after the current."""
+        return self._k >= len(self.analyzer.ranges)
+
+    def put(self, frame):
+        if not self.done.is_set():
+            self.queue.put(frame)
+
+    def close(self, cancel=False):
+        """
+        Ends the frames of the analyzer. With 'cancel' set, the analyzer
+        gets Cancelled raised instead, so that it stores no partial result.
+        """
+        if not self.closed:
+            self.closed = True
+            self.queue.put(self._cancel if cancel else self._end)
+
+
+class Analysis(object):
+    def __init__(self, analyzers=(), buffersize=16):
+        self.analyzers = list(analyzers)
+        self.buffersize = buffersize
+
+    def add(self, analyzer):
+        self.analyzers.append(analyzer)
+        return analyzer
+
+    def addCropScenes(self, cropscenes, sample=1, samplelength=1):
+        """Adds crop detection of every zone of 'cropscenes'."""
+        for zone in cropscenes:
+            self.add(Analyzer(
+                cropscenes.prev, zone.sampleRanges(sample, samplelength),
+                zone.analyzeFrames, f"Crop {zone.src_start}"))
+
+    def addLevels(self, levels):
+        """Adds histograms of every zone of 'levels'."""
+        for zone in levels:
+            if not zone.transition:
+                self.add(Analyzer(
+                    levels.prev, [(zone.prev_start, zone.prev_end)],
+                    zone.analyzeFrames, f"Levels {zone.src_start}"))
+
+    def addScenes(self, scenes, start=0, end=None, notify_iter=None):
+        """Adds scene metrics of frames [start, end) of scenes.prev."""
+        from .video.scenes import AnalysisThread
+        thread = AnalysisThread(scenes, start, end, notify_iter)
+        return self.add(Analyzer(scenes.prev, [(start, thread._end)],
+                                 thread.analyzeFrames, "Scenes"))
+
+    def addGain(self, gain):
+        """Adds loudness and peak measurement of gain.prev."""
+        return self.add(Analyzer(gain.prev, [(0, gain.prev.framecount)],
+                                 gain.analyzeFrames, "Loudness"))
+
+    def _sources(self):
+        """Analyzers grouped by source, in order of first appearance."""
+        groups = []
+
+        for analyzer in self.analyzers:
+            for source, analyzers in groups:
+                if source is analyzer.source:
+                    analyzers.append(analyzer)
+                    break
+
+            else:
+                groups.append((analyzer.source, [analyzer]))
+
+        return groups
+
+    def _decode(self, source, feeds, notifyprogress=None, cancelled=None):
+        """Hands out the frames of 'source'. Returns False if cancelled."""
+        spans = mergeRanges(
+            [r for feed in feeds for r in feed.analyzer.ranges])
+
+        for a, b in spans:
+            frames = source.iterFrames(a, b, whence="framenumber")
+
+            try:
+                for n, frame in enumerate(islice(frames, b - a), a):
+                    if (isinstance(cancelled, threading.Event)
+                            and cancelled.is_set()):
+                        return False
+
+                    for feed in feeds:
+                        if feed.wants(n):
+                            feed.put(frame)
+
+                        elif feed.finished:
+                            feed.close()
+
+                    if callable(notifyprogress):
+                        notifyprogress(n)
+
+                    if all(feed.done.is_set() for feed in feeds):
+                        return True
+
+            finally:
+                if hasattr(frames, "close"):
+                    frames.close()
+
+        return True
+
+    def run(self, notifyprogress=None, cancelled=None):
+        """
+        Runs all analyzers, decoding each source once. 'notifyprogress' is
+        called with (source, n) after frame n of source has been handed
+        out. Setting threading.Event 'cancelled' stops decoding; analyzers
+        not yet finished then get Cancelled raised from their frames, so
+        that they store no partial results, and None is returned. The first
+        exception raised by an analyzer is re-raised once all of them have
+        finished.
+        """
+        complete = True
+
+        for source, analyzers in self._sources():
+            feeds = [_Feed(analyzer, self.buffersize)
+                     for analyzer in analyzers]
+
+            for feed in feeds:
+                feed.thread.start()
+
+            progress = None
+
+            if callable(notifyprogress):
+                progress = partial(notifyprogress, source)
+
+            complete = False
+
+            try:
+                complete = self._decode(source, feeds, progress, cancelled)
+
+            finally:
+                for feed in feeds:
+                    feed.close(cancel=not complete)
+
+                for feed in feeds:
+                    feed.thread.join()
+
+            if not complete:
+                break
+
+        for analyzer in self.analyzers:
+            if analyzer.exception is not None:
+                raise analyzer.exception
+
+        if not complete:
+            return None
+
+        return [analyzer.result for analyzer in self.analyzers]
@@ -0,0 +1,207 @@
+"""
+Block-based audio processing.
+
+Audio frames (especially from TrueHD or DTS sources) are often tiny, and
+processing them one at a time is dominated by per-frame overhead. Here,
+whole frames are gathered into large float32 planar blocks of shape
+(channels, samples), about one second long. Filters derived from
+BlockAudioFilter process whole blocks (in place where possible), and the
+result is sliced back into frames along the input frame boundaries, so
+that frame counts and timestamps are those of the input.
+
+A block is a tuple (A, pts, time_base, rate, layout, frames), where pts is
+the presentation time of the first sample of A, in units of time_base, and
+frames lists the (pts, samples) of the input frames making up A.
+
+When the input of a BlockAudioFilter is the output of another one, the
+blocks are passed along directly, so that a chain of such filters
+re-blocks only once.
+"""
+
+import numpy
+from av import AudioFrame
+
+from ...avarrays import aconvert, _zero
+from .base import BaseAudioFilter
+
+"""dtype and scale to [-1, 1) of planar sample formats."""
+_planarformats = {
+    "fltp": (numpy.float32, 1),
+    "dblp": (numpy.float64, 1),
+    "s16p": (numpy.int16, 2**-15),
+    "s32p": (numpy.int32, 2**-31),
+    "u8p": (numpy.uint8, 2**-7),
+}
+
+
+def _gather(chunks, channels, n, scale):
+    """Concatenates lists of plane arrays into a float32 block."""
+    A = numpy.empty((channels, n), dtype=numpy.float32)
+
+    for c, dest in enumerate(A):
+        numpy.concatenate([planes[c] for planes in chunks], out=dest,
+                          casting="unsafe")
+
+    """Unsigned samples are centered on 2**(bits - 1), not 0."""
+    zero = _zero(chunks[0][0].dtype)
+
+    if zero:
+        A -= numpy.float32(zero)
+
+    if scale != 1:
+        A *= numpy.float32(scale)
+
+    return A
+
+
+def iterBlocks(frames, seconds=1):
+    """
+    Gathers whole audio frames into blocks of at least 'seconds' seconds
+    (or the rest of the stream). A block is cut short where the stream is
+    discontinuous (a gap or overlap of more than one sample) or where the
+    format, layout or sample rate changes.
+    """
+    chunks = []
+    sizes = []
+    n = 0
+    key = None
+
+    for frame in frames:
+        fmt = frame.format.name
+
+        if fmt not in _planarformats:
+            frame = aconvert(frame, "fltp")
+            fmt = "fltp"
+
+        samples = frame.samples
+        start = frame.pts*float(frame.time_base)
+
+        if chunks and (
+                key != (fmt, frame.layout.name, frame.rate)
+                or abs((start - blockstart)*frame.rate - n) > 1):
+            yield (_gather(chunks, channels, n, scale),
+                   pts, time_base, rate, layout, sizes)
+            chunks = []
+            sizes = []
+
+        if not chunks:
+            key = fmt, layout, rate = (fmt, frame.layout.name, frame.rate)
+            dtype, scale = _planarformats[fmt]
+            channels = len(frame.layout.channels)
+            length = max(1, int(rate*seconds + 0.5))
+            pts = frame.pts
+            time_base = frame.time_base
+            blockstart = start
+            n = 0
+
+        chunks.append([numpy.frombuffer(plane, dtype=dtype, count=samples)
+                       for plane in frame.planes[:channels]])
+        sizes.append((frame.pts, samples))
+        n += samples
+
+        if n >= length:
+            yield (_gather(chunks, channels, n, scale),
+                   pts, time_base, rate, layout, sizes)
+            chunks = []
+            sizes = []
+
+    if chunks:
+        yield (_gather(chunks, channels, n, scale),
+               pts, time_base, rate, layout, sizes)
+
+
+def toFrame(A, pts, time_base, rate, layout):
+    """Creates an fltp AudioFrame from planar float32 array A."""
+    frame = AudioFrame(format="fltp", layout=layout, samples=A.shape[1])
+
+    for plane, row in zip(frame.planes, A):
+        dest = numpy.frombuffer(plane, dtype=numpy.float32,
+                                count=A.shape[1])
+        dest[...] = row
+
+    frame.rate = rate
+    frame.pts = pts
+    frame.time_base = time_base
+    return frame
+
+
+def iterFrames(blocks):
+    """Slices blocks into fltp AudioFrames, one per input frame."""
+    for A, pts, time_base, rate, layout, sizes in blocks:
+        k = 0
+
+        for framepts, samples in sizes:
+            yield toFrame(A[:, k:k + samples], framepts, time_base, rate,
+                          layout)
+            k += samples
+
+
+class BlockFrames(object):
+    """
+    Iterator over the frames sliced from 'blocks'. A BlockAudioFilter fed
+    with this iterator takes the blocks directly instead.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self._frames = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._frames is None:
+            self._frames = iterFrames(self.blocks)
+
+        return next(self._frames)
+
+    def close(self):
+        if self._frames is not None:
+            self._frames.close()
+
+        if hasattr(self.blocks, "close"):
+            self.blocks.close()
+
+
+class BlockAudioFilter(BaseAudioFilter):
+    """
+    Base class for audio filters that process blocks of samples (see
+    module docstring). Subclasses implement _processBlock, which receives a
+    float32 array of shape (channels, samples) that it may modify in place,
+    and the layout name, and returns the processed array and its layout.
+
+    Frames are gathered into blocks of 'blockseconds' seconds, and output
+    frames match the input frames. Setting blockseconds to 0 falls back to
+    processing frames one at a time.
+    """
+
+    stateless = True
+    blockseconds = 1
+
+    def _processBlock(self, A, layout):
+        return A, layout
+
+    def processBlocks(self, blocks):
+        for A, pts, time_base, rate, layout, sizes in blocks:
+            A, layout = self._processBlock(A, layout)
+            yield (A, pts, time_base, rate, layout, sizes)
+
+    def _processFrame(self, frame):
+        if not frame.samples:
+            return frame
+
+        (A, pts, time_base, rate, layout, sizes), = iterBlocks([frame], 0)
+        A, layout = self._processBlock(A, layout)
+        return toFrame(A, pts, time_base, rate, layout)
+
+    def _processFrames(self, iterable):
+        if not self.blockseconds or self.parallel:
+            return super()._processFrames(iterable)
+
+        if isinstance(iterable, BlockFrames):
+            blocks = iterable.blocks
+
+        else:
+            blocks = iterBlocks(iterable, self.blockseconds)
+
+        return BlockFrames(self.processBlocks(blocks))
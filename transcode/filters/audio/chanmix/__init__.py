@@ -1,6 +1,6 @@
 #!/usr/bin/python
 from ..base import BaseAudioFilter
-from transcode.avarrays import toNDArray, toAFrame, aconvert
+from ..blocks import BlockAudioFilter
 import numpy
 import av
 
@@ -8,7 +8,7 @@ import av
 # TODO: Automatic matrix selection when changing output layout.
 # Validation to check matrix with source and layout.
 
-class ChannelMix(BaseAudioFilter):
+class ChannelMix(BlockAudioFilter):
     __name__ = "Channel Mixer"
 
     def __init__(self, matrix=[], layout=None,
@@ -17,36 +17,23 @@ class ChannelMix(BaseAudioFilter):
         self.layout = layout
         super().__init__(prev=prev, next=next)
 
-    def iterFrames(self, start=0, end=None, whence="pts"):
-        if self.matrix is not None:
-            M = numpy.matrix(self.matrix, dtype=numpy.float32)
-
-        else:
-            M = None
+    def _processBlock(self, A, layout):
+        if self.matrix is None:
+            return A, layout
 
-        for frame in self.prev.iterFrames(start, end, whence):
-            frame = aconvert(frame, "fltp")
+        M = numpy.asarray(self.matrix, dtype=numpy.float32)
 
-            if M is not None:
-                A = toNDArray(frame)
+        if self._layout is not None or len(A) != self.channels:
+            layout = self.layout
 
-                if (self._layout is None
-                        and len(frame.layout.channels) == self.channels):
-                    newframe = toAFrame(
-                        (M*A.transpose()).transpose(),
-                        layout=frame.layout.name)
+        if (M.shape[0] == M.shape[1] == len(A)
+                and (M == numpy.identity(len(A))).all()):
+            return A, layout
 
-                else:
-                    newframe = toAFrame(
-                        (M*A.transpose()).transpose(), layout=self.layout)
+        return numpy.matmul(M, A), layout
 
-                newframe.rate = frame.rate
-                newframe.pts = frame.pts
-                newframe.time_base = frame.time_base
-                yield newframe
-
-            else:
-                yield frame
+    def iterFrames(self, start=0, end=None, whence="pts"):
+        return self.processFrames(self.prev.iterFrames(start, end, whence))
 
     @property
     def matrix(self):
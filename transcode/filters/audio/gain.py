@@ -1,25 +1,37 @@
 #!/usr/bin/python
-from .base import BaseAudioFilter
-from ...avarrays import toNDArray, toAFrame, aconvert
+import numpy
+from .blocks import BlockAudioFilter
+from . import loudness
 
 
-class Gain(BaseAudioFilter):
+class Gain(BlockAudioFilter):
     __name__ = "Amplify"
 
     def __init__(self, gain=0, prev=None, next=None, parent=None):
         self.gain = gain
+        self.loudness = None
+        self.peak = None
         super().__init__(prev=prev, next=next)
 
+    def _processBlock(self, A, layout):
+        if self.gain:
+            A *= numpy.float32(10**(self.gain/20))
+
+        return A, layout
+
     def iterFrames(self, start=0, end=None, whence="pts"):
-        scale = 10**(self.gain/20)
-        for frame in self.prev.iterFrames(start, end, whence):
-            frame = aconvert(frame, "fltp")
-            A = toNDArray(frame)
-            newframe = toAFrame(A*scale, layout=frame.layout.name)
-            newframe.rate = frame.rate
-            newframe.pts = frame.pts
-            newframe.time_base = frame.time_base
-            yield newframe
+        return self.processFrames(self.prev.iterFrames(start, end, whence))
+
+    def analyzeFrames(self, iterable=None):
+        """
+        Measures the integrated loudness (LUFS) and sample peak (dBFS) of
+        'iterable', or of all of prev, before gain is applied.
+        """
+        if iterable is None:
+            iterable = self.prev.iterFrames()
+
+        self.loudness, self.peak = loudness.measure(iterable)
+        return self.loudness, self.peak
 
     @property
     def format(self):
@@ -28,8 +40,17 @@ class Gain(BaseAudioFilter):
     def __getstate__(self):
         state = super().__getstate__()
         state["gain"] = self.gain
+
+        if self.loudness is not None:
+            state["loudness"] = self.loudness
+
+        if self.peak is not None:
+            state["peak"] = self.peak
+
         return state
 
     def __setstate__(self, state):
         self.gain = state.get("gain", 0)
+        self.loudness = state.get("loudness")
+        self.peak = state.get("peak")
         super().__setstate__(state)
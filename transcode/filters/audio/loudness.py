@@ -0,0 +1,140 @@
+"""
+Integrated loudness (ITU-R BS.1770-4) and sample peak of audio.
+
+Samples are K-weighted (a high shelf followed by a high-pass, both biquads
+designed for the stream's sample rate), and their mean square is taken over
+100 ms steps. Gating blocks are 400 ms long (four steps, so that blocks
+overlap by 75%). Blocks quieter than -70 LUFS, and then blocks more than
+10 LU below the loudness of the remaining ones, are gated out.
+"""
+
+import numpy
+from av import AudioLayout
+from scipy.signal import lfilter
+
+from .blocks import iterBlocks
+
+"""Channel weights. Surround channels count +1.5 dB; LFE is ignored."""
+_weights = {
+    "LFE": 0, "LFE2": 0,
+    "BL": 1.41, "BR": 1.41, "SL": 1.41, "SR": 1.41,
+    "TBL": 1.41, "TBR": 1.41,
+}
+
+
+def kweighting(rate):
+    """Filter coefficients ((b1, a1), (b2, a2)) of the K-weighting stages."""
+    f0 = 1681.974450955533
+    G = 3.999843853973347
+    Q = 0.7071752369554196
+    K = numpy.tan(numpy.pi*f0/rate)
+    Vh = 10**(G/20)
+    Vb = Vh**0.4996667741545416
+    a0 = 1 + K/Q + K*K
+    b1 = numpy.array([Vh + Vb*K/Q + K*K, 2*(K*K - Vh), Vh - Vb*K/Q + K*K])/a0
+    a1 = numpy.array([a0, 2*(K*K - 1), 1 - K/Q + K*K])/a0
+
+    f0 = 38.13547087602444
+    Q = 0.5003270373238773
+    K = numpy.tan(numpy.pi*f0/rate)
+    a0 = 1 + K/Q + K*K
+    b2 = numpy.array([1., -2., 1.])
+    a2 = numpy.array([a0, 2*(K*K - 1), 1 - K/Q + K*K])/a0
+    return ((b1, a1), (b2, a2))
+
+
+def channelWeights(layout):
+    """Weights of the channels of layout 'layout' (by name)."""
+    return numpy.array([_weights.get(channel.name, 1)
+                        for channel in AudioLayout(layout).channels])
+
+
+class LoudnessMeter(object):
+    """
+    Accumulates K-weighted mean squares of consecutive blocks (as produced
+    by blocks.iterBlocks) in 100 ms steps. The filter state is carried from
+    one block to the next, and reset if the format changes.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.peak = 0
+        self.steps = []
+        self._zi = None
+        self._carry = None
+
+    def _reset(self, channels, rate, layout):
+        self.key = (channels, rate, layout)
+        self.rate = rate
+        self.steplength = int(rate/10 + 0.5)
+        self.weights = channelWeights(layout)
+        self.coefficients = kweighting(rate)
+        self._zi = [numpy.zeros((channels, 2)) for stage in range(2)]
+        self._carry = numpy.zeros((channels, 0))
+
+    def add(self, A, rate, layout):
+        """Adds float32 samples A, shape (channels, samples)."""
+        if self.key != (A.shape[0], rate, layout):
+            self._reset(A.shape[0], rate, layout)
+
+        if A.shape[1]:
+            self.peak = max(self.peak, float(numpy.abs(A).max()))
+
+        X = A
+
+        for (b, a), zi in zip(self.coefficients, self._zi):
+            X, zi[...] = lfilter(b, a, X, axis=1, zi=zi)
+
+        X = numpy.concatenate((self._carry, X), axis=1)
+        n = X.shape[1] - X.shape[1] % self.steplength
+        S = (X[:, :n]**2).reshape(X.shape[0], -1, self.steplength)
+        self.steps.extend(self.weights.dot(S.mean(axis=2)))
+        self._carry = X[:, n:]
+
+    @property
+    def blocks(self):
+        """Weighted mean squares of the 400 ms gating blocks."""
+        Z = numpy.array(self.steps)
+
+        if len(Z) < 4:
+            return Z[:0]
+
+        return (Z[:-3] + Z[1:-2] + Z[2:-1] + Z[3:])/4
+
+    @property
+    def loudness(self):
+        """Integrated loudness in LUFS, or None if nothing passes the gates."""
+        Z = self.blocks
+
+        with numpy.errstate(divide="ignore"):
+            L = -0.691 + 10*numpy.log10(Z)
+
+        Z = Z[L > -70]
+
+        if not len(Z):
+            return None
+
+        gate = -0.691 + 10*numpy.log10(Z.mean()) - 10
+
+        with numpy.errstate(divide="ignore"):
+            Z = Z[-0.691 + 10*numpy.log10(Z) > gate]
+
+        return float(-0.691 + 10*numpy.log10(Z.mean()))
+
+    @property
+    def peakdB(self):
+        """Sample peak in dBFS."""
+        if self.peak > 0:
+            return float(20*numpy.log10(self.peak))
+
+        return float("-inf")
+
+
+def measure(frames):
+    """Returns (integrated loudness, sample peak in dBFS) of 'frames'."""
+    meter = LoudnessMeter()
+
+    for A, pts, time_base, rate, layout, sizes in iterBlocks(frames):
+        meter.add(A, rate, layout)
+
+    return meter.loudness, meter.peakdB
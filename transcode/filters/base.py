@@ -1,5 +1,7 @@
 from ..util import cached, search, llist, WeakRefProperty, SourceError
 from ..containers.basereader import Track
+from ..parmap import imap
+from .. import procmap
 import threading
 import numpy
 from collections import OrderedDict
@@ -39,6 +41,26 @@ class BaseFilter(object):
     from copy import deepcopy as copy
     allowedtypes = ("audio", "video")
 
+    """
+    Subclasses whose output frames each depend only on the corresponding
+    input frame should set 'stateless' to True and implement _processFrame
+    instead of _processFrames. Frames for such filters can then be processed
+    on a worker pool by setting 'parallel' on an instance to True (or
+    "thread"), or to an int specifying the maximum number of frames in
+    flight.
+
+    Setting 'parallel' to "process" runs _processFrame in worker processes
+    instead (see transcode.procmap), with at most 'memlimit' bytes of frame
+    data in flight. _processFrame must then not depend on 'prev' or
+    'source', as these are not sent to the workers.
+    """
+    stateless = False
+    parallel = False
+    memlimit = procmap.defaultmemlimit
+
+    """Output frame cache, see transcode.filters.framecache."""
+    framecache = None
+
     @property
     def __name__(self):
         return self.__class__.__name__
@@ -138,6 +160,9 @@ class BaseFilter(object):
         except AttributeError:
             pass
 
+        if self.framecache is not None:
+            self.framecache = self.framecache.invalidate(start, end)
+
         for i, ref in list(self._monitors.items()):
             mon = ref()
 
@@ -148,6 +173,29 @@ class BaseFilter(object):
             elif isinstance(mon, BaseFilter):
                 mon.reset_cache(start, end)
 
+    def reset_framecache(self):
+        """
+        Drops the cached output frames of this filter and of every filter
+        depending on it. For state changes that alter frame data but not
+        timing, which do not go through reset_cache.
+        """
+        if self.framecache is not None:
+            self.framecache = self.framecache.invalidate()
+
+        for i, ref in list(self._monitors.items()):
+            mon = ref()
+
+            if mon is None:
+                del self._monitors[i]
+
+            elif isinstance(mon, BaseFilter):
+                mon.reset_framecache()
+
+        parent = getattr(self, "parent", None)
+
+        if isinstance(parent, BaseFilter):
+            parent.reset_framecache()
+
     def isValidSource(self, source):
         if source.type not in self.allowedtypes:
             return False
@@ -193,6 +241,7 @@ class BaseFilter(object):
                 pass
 
         self.name = state.get("name")
+        self.reset_framecache()
 
     def __deepcopy__(self, memo):
         reduced = self.__reduce__()
@@ -232,6 +281,10 @@ class BaseFilter(object):
             new.update(deepcopy((key, value), memo)
                        for (key, value) in dictitems)
 
+        if self.framecache is not None:
+            self.framecache.shared = True
+            new.framecache = self.framecache
+
         return new
 
     @property
@@ -302,8 +355,25 @@ class BaseFilter(object):
         if self.prev is not None:
             return self.prev.duration
 
+    @property
+    def identityIndexMap(self):
+        """
+        True if frames pass through this filter one-to-one. See
+        BaseVideoFilter.identityIndexMap.
+        """
+        cls = type(self)
+        return (cls.indexMap is BaseFilter.indexMap
+                and cls.reverseIndexMap is BaseFilter.reverseIndexMap
+                and cls.framecount is BaseFilter.framecount
+                and cls.cumulativeIndexMap is BaseFilter.cumulativeIndexMap
+                and cls.cumulativeIndexReverseMap
+                is BaseFilter.cumulativeIndexReverseMap)
+
     @cached
     def framecount(self):
+        if self.prev is not None and self.identityIndexMap:
+            return self.prev.framecount or 0
+
         if self.prev is not None and self.prev.framecount:
             for k in count(self.prev.framecount - 1, -1):
                 n = self.indexMap[k]
@@ -330,6 +400,9 @@ class BaseFilter(object):
         else:
             n = numpy.arange(self.prev.framecount)
 
+        if self.identityIndexMap:
+            return n
+
         nonneg = n >= 0
         results = -numpy.ones(n.shape, dtype=numpy.int0)
         results[nonneg] = self.indexMap[n[nonneg]]
@@ -338,12 +411,13 @@ class BaseFilter(object):
 
     @cached
     def cumulativeIndexReverseMap(self):
-        n = self.reverseIndexMap
-
         if hasattr(self._prev, "cumulativeIndexReverseMap"):
-            n = self._prev.cumulativeIndexReverseMap[n]
+            if self.identityIndexMap:
+                return self._prev.cumulativeIndexReverseMap
 
-        return n
+            return self._prev.cumulativeIndexReverseMap[self.reverseIndexMap]
+
+        return self.reverseIndexMap
 
     @cached
     def indexMap(self):
@@ -361,7 +435,31 @@ class BaseFilter(object):
     def reverseIndexMap(self):
         del self.cumulativeIndexReverseMap
 
+    def mapFrames(self, func, iterable):
+        """
+        Equivalent to map(func, iterable), unless 'parallel' is set, in
+        which case func is evaluated on a worker thread pool (this includes
+        'parallel' == "process", since func need not be picklable). Results
+        are returned in order either way.
+        """
+        if self.parallel:
+            return imap(func, iterable, self._maxinflight)
+
+        return map(func, iterable)
+
+    @property
+    def _maxinflight(self):
+        if isinstance(self.parallel, int) and self.parallel is not True:
+            return self.parallel
+
     def _processFrames(self, iterable):
+        if self.stateless and self.parallel == "process":
+            return procmap.imap(self, iterable, "_processFrame",
+                                memlimit=self.memlimit)
+
+        elif self.stateless:
+            return self.mapFrames(self._processFrame, iterable)
+
         return iterable
 
     def processFrames(self, iterable):
@@ -2,11 +2,13 @@ from ..video.base import BaseVideoFilter
 from ..audio.base import BaseAudioFilter
 from ..base import BaseFilter
 import numpy
-from itertools import count
+from bisect import bisect_right
+from itertools import count, chain, islice
 from more_itertools import windowed
 from ...util import cached, SourceError, IncompatibleSource, BrokenReference
 from fractions import Fraction as QQ
 from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 import weakref
 import regex
 
@@ -24,11 +26,18 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
     allowedtypes = ("audio", "video")
     sourceCount = "+"
 
+    """Frames/packets of the next segment to read ahead (0 disables)."""
+    prefetch = 24
+
     def __init__(self, segments=[], time_base=QQ(1, 10**9), **kwargs):
         self.segments = list(map(tryweakref, segments))
         self.time_base = time_base
         super().__init__(**kwargs)
 
+        for segment in self:
+            if isinstance(segment, BaseFilter):
+                segment.addMonitor(self)
+
     def __iter__(self):
         for item in self.segments:
             if isinstance(item, weakref.ref):
@@ -48,16 +57,80 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
         return dependencies
 
     @cached
-    def pts_time(self):
-        L = []
-        T = 0
+    def segmentFrameOffsets(self):
+        """
+        Frame number at which each segment starts, followed by the total
+        framecount.
+        """
+        N = [0]
+
+        for segment in self:
+            N.append(N[-1] + segment.framecount)
+
+        return N
+
+    @cached
+    def segmentTimeOffsets(self):
+        """
+        Time (in seconds) at which each segment starts, followed by the
+        total duration.
+        """
+        T = [0]
 
         for segment in self:
-            L.append(segment.pts_time + T)
-            T += segment.duration
+            T.append(T[-1] + segment.duration)
+
+        return T
+
+    @cached
+    def segmentTimeBase(self):
+        """Time base shared by all segments, or False if they differ."""
+        time_bases = {segment.time_base for segment in self}
 
-        if len(L):
-            return numpy.concatenate(L)
+        if len(time_bases) == 1:
+            return time_bases.pop()
+
+        return False
+
+    def segmentIndex(self, start, whence="framenumber"):
+        """
+        Index of the first segment that does not end at or before 'start'.
+        """
+        if whence in ("framenumber", "packetnumber"):
+            offsets = self.segmentFrameOffsets
+
+        elif whence == "seconds":
+            offsets = self.segmentTimeOffsets
+
+        elif whence == "pts" and self.segmentTimeBase:
+            offsets = self.segmentTimeOffsets
+            start = start*self.segmentTimeBase
+
+        else:
+            """Segment time bases differ, so 'start' means something
+            different for each segment."""
+            for k, (segment, T) in enumerate(
+                    zip(self, self.segmentTimeOffsets[1:])):
+                if start*segment.time_base < T:
+                    return k
+
+            return len(self)
+
+        return max(bisect_right(offsets, start) - 1, 0)
+
+    def reset_cache(self, start=0, end=None):
+        del self.segmentFrameOffsets
+        del self.segmentTimeOffsets
+        del self.segmentTimeBase
+        del self.sizes
+        super().reset_cache(start, end)
+
+    @cached
+    def pts_time(self):
+        if len(self):
+            return numpy.concatenate([
+                segment.pts_time + T
+                for segment, T in zip(self, self.segmentTimeOffsets)])
 
         return numpy.array((), dtype=numpy.float64)
 
@@ -67,7 +140,7 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
 
     @cached
     def duration(self):
-        return sum(segment.duration for segment in self)
+        return self.segmentTimeOffsets[-1]
 
     @cached
     def durations(self):
@@ -87,7 +160,7 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
 
     @cached
     def framecount(self):
-        return sum(segment.framecount for segment in self)
+        return self.segmentFrameOffsets[-1]
 
     @property
     def type(self):
@@ -161,212 +234,222 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
     def cumulativeIndexMap(self):
         return numpy.arange(self.framecount)
 
-    def iterFrames(self, start=0, end=None, whence=None):
-        if self.type == "video" and whence is None:
-            whence = "framenumber"
-
-        elif self.type in ("audio", "subtitle") and whence is None:
-            whence = "seconds"
-
-        N = 0
-        T = 0
-
-        for segment in self:
-            if whence == "framenumber":
+    def _segmentCalls(self, start, end, whence, indexwhence, zero):
+        """
+        Yields (T, segment, args) for each segment overlapping the requested
+        range, where T is the time offset of the segment (in seconds) and
+        args are the arguments for the segment's iterFrames/iterPackets.
+        'indexwhence' is "framenumber" or "packetnumber", and 'zero' is the
+        start argument used when only an end point is needed.
+
+        The first segment is located by bisection (see segmentIndex).
+        """
+        k = self.segmentIndex(start, whence)
+        offsets = zip(self[k:], self.segmentFrameOffsets[k:],
+                      self.segmentTimeOffsets[k:])
+
+        for segment, N, T in offsets:
+            if whence == indexwhence:
                 if start >= N + segment.framecount:
-                    N += segment.framecount
-                    T += segment.duration
                     continue
 
                 elif N <= start:
                     if end is not None and end < N + segment.framecount:
-                        frames = segment.iterFrames(start - N, end - N, whence)
+                        args = (start - N, end - N, whence)
 
                     else:
-                        frames = segment.iterFrames(start - N, None, whence)
+                        args = (start - N, None, whence)
 
                 elif end is None or end >= N + segment.framecount:
-                    frames = segment.iterFrames()
+                    args = ()
 
                 elif end > N:
-                    frames = segment.iterFrames(0, end - N, whence)
+                    args = (zero, end - N, whence)
 
                 else:
                     break
 
             elif whence == "pts":
                 if start*segment.time_base >= T + segment.duration:
-                    N += segment.framecount
-                    T += segment.duration
                     continue
 
                 elif T <= start*segment.time_base:
                     if (end is not None
                             and end*segment.time_base < T + segment.duration):
-                        frames = segment.iterFrames(
-                            start - int(T/segment.time_base + 0.5),
-                            end - int(T/segment.time_base + 0.5), whence)
+                        args = (start - int(T/segment.time_base + 0.5),
+                                end - int(T/segment.time_base + 0.5), whence)
 
                     else:
-                        frames = segment.iterFrames(
-                            start - int(T/segment.time_base + 0.5),
-                            None, whence)
+                        args = (start - int(T/segment.time_base + 0.5),
+                                None, whence)
 
                 elif (end is None
                       or end*segment.time_base >= T + segment.duration):
-                    frames = segment.iterFrames()
+                    args = ()
 
                 elif end*segment.time_base > T:
-                    frames = segment.iterFrames(
-                        0, end - int(T/segment.time_base + 0.5), whence)
+                    args = (zero, end - int(T/segment.time_base + 0.5),
+                            whence)
 
                 else:
                     break
 
             elif whence == "seconds":
                 if start >= T + segment.duration:
-                    N += segment.framecount
-                    T += segment.duration
                     continue
 
                 elif T <= start:
                     if end is not None and end < T + segment.duration:
-                        frames = segment.iterFrames(start - T, end - T, whence)
+                        args = (start - T, end - T, whence)
 
                     else:
-                        frames = segment.iterFrames(start - T, None, whence)
+                        args = (start - T, None, whence)
 
                 elif end is None or end >= T + segment.duration:
-                    frames = segment.iterFrames()
+                    args = ()
 
                 elif end > T:
-                    frames = segment.iterFrames(0, end - T, whence)
+                    args = (zero, end - T, whence)
 
                 else:
                     break
 
-            for frame in frames:
-                frame.pts = int(
-                    (T + frame.pts*frame.time_base)/self.time_base + 0.5)
-                frame.time_base = self.time_base
-                yield frame
+            yield T, segment, args
 
-            N += segment.framecount
-            T += segment.duration
+    def _iterSegments(self, calls, method):
+        """
+        Yields (T, iterator) for each item of 'calls' (see _segmentCalls).
 
-    def iterPackets(self, start=0, end=None, whence="pts"):
-        if self.type == "video" and whence is None:
-            whence = "packetnumber"
+        While the iterator of one segment is being consumed, the next
+        segment's iterator is opened, and its first 'self.prefetch' items
+        are read, on a background thread. That way, the seek, decoder
+        setup and first GOP of the next segment are already done when the
+        current segment runs out. Each yielded iterator must be exhausted
+        before the next one is requested.
+        """
+        if not self.prefetch:
+            for T, segment, args in calls:
+                yield T, getattr(segment, method)(*args)
 
-        elif self.type in ("audio", "subtitle") and whence is None:
-            whence = "seconds"
+            return
 
-        N = 0
-        T = 0
+        def openSegment(segment, args):
+            items = getattr(segment, method)(*args)
 
-        if whence == "pts":
-            K = count(self.frameIndexFromPts(start, "+"))
+            try:
+                return items, list(islice(items, self.prefetch))
 
-        elif whence == "seconds":
-            K = count(self.frameIndexFromPtsTime(start, "+"))
+            except BaseException:
+                if hasattr(items, "close"):
+                    items.close()
 
-        else:
-            K = count(start)
+                raise
 
-        for segment in self:
-            if whence == "packetnumber":
-                if start >= N + segment.framecount:
-                    N += segment.framecount
-                    T += segment.duration
-                    continue
+        def submit():
+            for T, segment, args in calls:
+                return T, executor.submit(openSegment, segment, args)
 
-                elif N <= start:
-                    if end is not None and end < N + segment.framecount:
-                        packets = segment.iterPackets(
-                            start - N, end - N, whence)
+        def discard(future):
+            if not future.cancelled() and future.exception() is None:
+                items, head = future.result()
 
-                    else:
-                        packets = segment.iterPackets(start - N, None, whence)
+                if hasattr(items, "close"):
+                    items.close()
 
-                elif end is None or end >= N + segment.framecount:
-                    packets = segment.iterPackets()
+        executor = ThreadPoolExecutor(
+            1, thread_name_prefix="ConcatenatePrefetch")
+        items = None
+        pending = submit()
 
-                elif end > N:
-                    packets = segment.iterPackets(None, end - N, whence)
+        try:
+            while pending is not None:
+                T, future = pending
+                items, head = future.result()
+                pending = submit()
+                yield T, chain(head, items)
 
-                else:
-                    break
+                if hasattr(items, "close"):
+                    items.close()
 
-            elif whence == "pts":
-                if start*segment.time_base >= T + segment.duration:
-                    N += segment.framecount
-                    T += segment.duration
-                    continue
+                items = None
 
-                elif T <= start*segment.time_base:
-                    if (end is not None
-                            and end*segment.time_base < T + segment.duration):
-                        packets = segment.iterPackets(
-                            start - int(T/segment.time_base + 0.5),
-                            end - int(T/segment.time_base + 0.5), whence)
+        finally:
+            if items is not None and hasattr(items, "close"):
+                items.close()
 
-                    else:
-                        packets = segment.iterPackets(
-                            start - int(T/segment.time_base + 0.5),
-                            None, whence)
+            if pending is not None:
+                T, future = pending
 
-                elif (end is None
-                      or end*segment.time_base >= T + segment.duration):
-                    packets = segment.iterPackets()
+                if not future.cancel():
+                    future.add_done_callback(discard)
 
-                elif end*segment.time_base > T:
-                    packets = segment.iterPackets(
-                        None, end - int(T/segment.time_base + 0.5), whence)
+            executor.shutdown(wait=False)
 
-                else:
-                    break
+    def iterFrames(self, start=0, end=None, whence=None):
+        if self.type == "video" and whence is None:
+            whence = "framenumber"
 
-            elif whence == "seconds":
-                if start >= T + segment.duration:
-                    N += segment.framecount
-                    T += segment.duration
-                    continue
+        elif self.type in ("audio", "subtitle") and whence is None:
+            whence = "seconds"
 
-                elif T <= start:
-                    if end is not None and end < T + segment.duration:
-                        packets = segment.iterPackets(
-                            start - T, end - T, whence)
+        segments = self._iterSegments(
+            self._segmentCalls(start, end, whence, "framenumber", 0),
+            "iterFrames")
 
-                    else:
-                        packets = segment.iterPackets(start - T, None, whence)
+        try:
+            for T, frames in segments:
+                for frame in frames:
+                    frame.pts = int(
+                        (T + frame.pts*frame.time_base)/self.time_base + 0.5)
+                    frame.time_base = self.time_base
+                    yield frame
 
-                elif end is None or end >= T + segment.duration:
-                    packets = segment.iterPackets()
+        finally:
+            segments.close()
 
-                elif end > T:
-                    packets = segment.iterPackets(None, end - T, whence)
+    def iterPackets(self, start=0, end=None, whence="pts"):
+        if self.type == "video" and whence is None:
+            whence = "packetnumber"
 
-                else:
-                    break
+        elif self.type in ("audio", "subtitle") and whence is None:
+            whence = "seconds"
+
+        if whence == "pts":
+            K = count(self.frameIndexFromPts(start, "+"))
 
-            for packet in packets:
-                packet.pts = int(
-                    (T + packet.pts*packet.time_base)/self.time_base + 0.5)
+        elif whence == "seconds":
+            K = count(self.frameIndexFromPtsTime(start, "+"))
+
+        else:
+            K = count(start)
+
+        segments = self._iterSegments(
+            self._segmentCalls(start, end, whence, "packetnumber", None),
+            "iterPackets")
+
+        try:
+            for T, packets in segments:
+                for packet in packets:
+                    packet.pts = int(
+                        (T + packet.pts*packet.time_base)/self.time_base
+                        + 0.5)
 
-                if packet.duration:
-                    packet.duration = int(
-                        packet.duration*packet.time_base/self.time_base + 0.5)
+                    if packet.duration:
+                        packet.duration = int(
+                            packet.duration*packet.time_base/self.time_base
+                            + 0.5)
 
-                packet.time_base = self.time_base
+                    packet.time_base = self.time_base
 
-                if self[0].source.codec == "ass":
-                    match, = regex.findall(b"\\d,(.+)", packet.data)
-                    packet.data = str(next(K)).encode("utf8") + b"," + match
+                    if self[0].source.codec == "ass":
+                        match, = regex.findall(b"\\d,(.+)", packet.data)
+                        packet.data = (str(next(K)).encode("utf8") + b","
+                                       + match)
 
-                yield packet
+                    yield packet
 
-            N += segment.framecount
-            T += segment.duration
+        finally:
+            segments.close()
 
     def append(self, segment):
         self.segments.append(tryweakref(segment))
@@ -374,12 +457,16 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
         if isinstance(segment, BaseFilter):
             segment.addMonitor(self)
 
+        self.reset_cache()
+
     def insert(self, index, segment):
         self.segments.insert(index, tryweakref(segment))
 
         if isinstance(segment, BaseFilter):
             segment.addMonitor(self)
 
+        self.reset_cache()
+
     def extend(self, segments):
         k = len(self)
         self.segments.extend(map(tryweakref, segments))
@@ -391,12 +478,15 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
             if isinstance(segment, BaseFilter):
                 segment.addMonitor(self)
 
+        self.reset_cache()
+
     def clear(self):
         for segment in self:
             if isinstance(segment, BaseFilter):
                 segment.removeMonitor(self)
 
         self.segments.clear()
+        self.reset_cache()
 
     def __getitem__(self, index):
         item = self.segments[index]
@@ -421,6 +511,8 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
         if isinstance(segment, BaseFilter) and segment not in self.segments:
             segment.removeMonitor(self)
 
+        self.reset_cache()
+
     def __setitem__(self, index, value):
         oldvalue = self[index]
         self.segments[index] = tryweakref(value)
@@ -431,6 +523,8 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
         if isinstance(oldvalue, BaseFilter) and oldvalue not in self.segments:
             oldvalue.removeMonitor(self)
 
+        self.reset_cache()
+
     def __reduce__(self):
         return type(self), (), self.__getstate__(), iter(self)
 
@@ -460,11 +554,9 @@ class Concatenate(BaseVideoFilter, BaseAudioFilter):
     @cached
     def keyframes(self):
         kf = set()
-        n = 0
 
-        for segment in self:
+        for segment, n in zip(self, self.segmentFrameOffsets):
             kf.update(k + n for k in segment.keyframes)
-            n += segment.framecount
 
         return kf
 
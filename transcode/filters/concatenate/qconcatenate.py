@@ -16,6 +16,7 @@ from transcode.pyqtgui.treeview import TreeView as QTreeView
 from transcode.containers.basereader import Track
 from . import Concatenate
 from ..base import BaseFilter
+from .. import framecache
 from functools import partial
 
 
@@ -236,7 +237,7 @@ class QVideoPreview(QWidget):
 
     def updateImage(self, n, t):
         try:
-            frame = next(self._source.iterFrames(n, whence="framenumber"))
+            frame = next(framecache.iterFrames(self._source, n))
 
         except Exception:
             return
@@ -5,15 +5,37 @@ import numpy
 from collections import OrderedDict
 from itertools import count
 from transcode.util import (cached, WeakRefProperty, SourceError,
-                            IncompatibleSource)
+                            IncompatibleSource, WorkaheadIterator)
 from transcode.avarrays import toNDArray, toAFrame, aconvert
 from av import VideoFrame
 from copy import deepcopy
+from fractions import Fraction as QQ
+
+"""Formats that can be blended plane by plane without conversion."""
+_planarformats = {"yuv420p", "yuvj420p", "yuv422p", "yuvj422p", "yuv444p",
+                  "yuvj444p", "yuv411p", "yuv410p", "gray"}
+
+"""Video blend weights are in units of 2**-_fadebits."""
+_fadebits = 15
+
+
+def _planes(frame):
+    """Writable uint8 views of the planes of 'frame', cropped to size."""
+    for plane in frame.planes:
+        A = numpy.frombuffer(plane, dtype=numpy.uint8)
+        yield A.reshape(-1, plane.line_size)[:plane.height, :plane.width]
 
 
 class CrossFade(BaseVideoFilter, BaseAudioFilter):
     allowedtypes = ("audio", "video")
 
+    """
+    Decode source2 on a separate thread, so that decoding of both sources
+    is not serialized, and bound how far ahead it may get.
+    """
+    concurrent = True
+    maxqueue = {"video": 4, "audio": 32}
+
     def __new__(cls, *args, **kwargs):
         self = super().__new__(cls)
         self._source1 = None
@@ -56,6 +78,7 @@ class CrossFade(BaseVideoFilter, BaseAudioFilter):
         if isinstance(oldsource, BaseFilter):
             oldsource.removeMonitor(self)
 
+        self.reset_cache()
         return value
 
     @source2.setter
@@ -68,6 +91,7 @@ class CrossFade(BaseVideoFilter, BaseAudioFilter):
         if isinstance(oldsource, BaseFilter):
             oldsource.removeMonitor(self)
 
+        self.reset_cache()
         return value
 
     def __getstate__(self):
@@ -107,7 +131,13 @@ class CrossFade(BaseVideoFilter, BaseAudioFilter):
     @property
     def format(self):
         if self.type == "video":
-            return "rgb24"
+            source = self.source1 if self.source1 is not None else self.source2
+            fmt = getattr(source.format, "name", source.format)
+
+            if fmt in _planarformats:
+                return fmt
+
+            return "yuv420p"
 
         elif self.type == "audio":
             return "fltp"
@@ -274,91 +304,153 @@ class CrossFade(BaseVideoFilter, BaseAudioFilter):
         if self.source2 is not None:
             return self.source2.time_base
 
+    def fadeWeights(self):
+        """
+        Video blend weights (for source1, source2) of each frame index, as
+        a uint16 array of shape (framecount, 2), in units of 2**-_fadebits.
+        """
+        n = self.framecount
+        one = 1 << _fadebits
+        W = numpy.empty((n, 2), dtype=numpy.uint16)
+        B = numpy.rint(numpy.arange(1, n + 1)*(one/(n + 2)))
+        W[:, 0] = one if 1 & self.flags else one - B
+        W[:, 1] = one if 2 & self.flags else B
+        return W
+
     def iterFrames(self, start=0, end=None, whence="pts"):
         frames1 = self.source1.iterFrames(start, end, whence)
         frames2 = self.source2.iterFrames(start, end, whence)
 
-        if self.type == "video":
-            for frame1, frame2 in zip(frames1, frames2):
-                k = self.source1.frameIndexFromPts(frame1.pts)
-
-                A = frame1.to_rgb().to_ndarray()
-                B = frame2.to_rgb().to_ndarray()
-
-                if not 1 & self.flags:
-                    A = (1 - (k + 1)/(self.framecount + 2))*A
-
-                if not 2 & self.flags:
-                    B = ((k + 1)/(self.framecount + 2))*B
-
-                C = numpy.uint8((A + B).clip(max=255) + 0.5).copy(order="C")
-                newframe = VideoFrame.from_ndarray(C)
-                newframe.time_base = frame1.time_base
-                newframe.pts = frame1.pts
-
-                if frame1.pict_type == "I" or frame2.pict_type == "I":
-                    newframe.pict_type = "I"
-
-                yield newframe
-
-        elif self.type == "audio":
-            AA = numpy.zeros((0, self.source1.channels), dtype=numpy.float32)
-            BB = numpy.zeros((0, self.source2.channels), dtype=numpy.float32)
-            T = None
-
-            while True:
-                while len(AA) < 1536:
-                    try:
-                        frame1 = next(frames1)
-
-                    except StopIteration:
-                        break
-
-                    if T is None:
-                        T = frame1.pts*frame1.time_base
-
-                    frame1 = aconvert(frame1, self.format)
-                    A = toNDArray(frame1)
-                    AA = numpy.concatenate((AA, A))
-
-                while len(BB) < 1536:
-                    try:
-                        frame2 = next(frames2)
+        if self.concurrent:
+            frames2 = WorkaheadIterator(frames2, self.maxqueue[self.type])
+
+        try:
+            if self.type == "video":
+                yield from self._iterVideo(frames1, frames2)
+
+            elif self.type == "audio":
+                yield from self._iterAudio(frames1, frames2)
+
+        finally:
+            for frames in (frames1, frames2):
+                if hasattr(frames, "close"):
+                    frames.close()
+
+    def _iterVideo(self, frames1, frames2):
+        fmt = self.format
+        W = self.fadeWeights()
+        clip = W.sum(axis=1).max() > 1 << _fadebits
+        half = 1 << (_fadebits - 1)
+
+        """Accumulators, reused from frame to frame."""
+        buffers = {}
+
+        for frame1, frame2 in zip(frames1, frames2):
+            k = self.source1.frameIndexFromPts(frame1.pts)
+            wA, wB = W[min(max(k, 0), len(W) - 1)]
+            newframe = VideoFrame(frame1.width, frame1.height, fmt)
+
+            if frame1.format.name != fmt:
+                frame1 = frame1.reformat(format=fmt)
+
+            if frame2.format.name != fmt:
+                frame2 = frame2.reformat(format=fmt)
+
+            for A, B, C in zip(_planes(frame1), _planes(frame2),
+                               _planes(newframe)):
+                if A.shape not in buffers:
+                    buffers[A.shape] = (
+                        numpy.empty(A.shape, dtype=numpy.uint32),
+                        numpy.empty(A.shape, dtype=numpy.uint32))
+
+                acc, tmp = buffers[A.shape]
+                numpy.multiply(A, wA, out=acc, dtype=numpy.uint32)
+                numpy.multiply(B, wB, out=tmp, dtype=numpy.uint32)
+                acc += tmp
+                acc += half
+                acc >>= _fadebits
+
+                if clip:
+                    numpy.minimum(acc, 255, out=acc)
+
+                numpy.copyto(C, acc, casting="unsafe")
+
+            newframe.time_base = frame1.time_base
+            newframe.pts = frame1.pts
+
+            if frame1.pict_type == "I" or frame2.pict_type == "I":
+                newframe.pict_type = "I"
+
+            yield newframe
+
+    def _iterAudio(self, frames1, frames2):
+        """
+        Output frames follow the framing of source1. Samples of source2 are
+        queued until enough are available, and each output frame is blended
+        with a per-sample cos²/sin² ramp in a single multiply.
+        """
+        fmt = self.format
+        flags = self.flags
+        rate = self.rate
+        layout = self.layout
+        pending = numpy.zeros((0, self.channels), dtype=numpy.float32)
+        T = None
+        s = 0
+        scale = numpy.pi/2/float(self.duration)
+
+        def take(N):
+            nonlocal pending
+            chunks = [pending]
+            available = len(pending)
+
+            while available < N:
+                try:
+                    frame2 = next(frames2)
+
+                except StopIteration:
+                    break
 
-                    except StopIteration:
-                        break
+                chunks.append(toNDArray(aconvert(frame2, fmt)))
+                available += len(chunks[-1])
 
-                    frame2 = aconvert(frame2, self.format)
-                    B = toNDArray(frame2)
-                    BB = numpy.concatenate((BB, B))
+            B = numpy.concatenate(chunks) if len(chunks) > 1 else pending
+            pending = B[N:]
+            return B[:N]
 
-                N = min(len(AA), len(BB), 1536)
+        for frame1 in frames1:
+            if T is None:
+                T = frame1.pts*frame1.time_base
 
-                if N == 0:
-                    break
+            A = toNDArray(aconvert(frame1, fmt))
+            B = take(len(A))
+            N = len(B)
 
-                if not 1 & self.flags:
-                    A = AA[:N]*numpy.cos(T*numpy.pi/2/self.duration)**2
+            if N == 0:
+                break
 
-                else:
-                    A = AA[:N]
+            short = N < len(A)
+            A = A[:N]
+            theta = float(T)*scale + (s + numpy.arange(N))*(scale/rate)
+            wB = numpy.float32(numpy.sin(theta)**2)[:, None]
 
-                if not 2 & self.flags:
-                    B = BB[:N]*numpy.sin(T*numpy.pi/2/self.duration)**2
+            if not 1 & flags:
+                A *= 1 - wB
 
-                else:
-                    B = BB[:N]
+            if not 2 & flags:
+                B *= wB
 
-                newframe = toAFrame(A + B, layout=self.layout)
+            A += B
+            newframe = toAFrame(A, layout=layout)
+            newframe.rate = frame1.rate
+            newframe.pts = int((T + QQ(s, rate))/frame1.time_base
+                               + 0.00001)
+            newframe.time_base = frame1.time_base
+            yield newframe
 
-                newframe.rate = frame1.rate
-                newframe.pts = int(T/frame1.time_base + 0.00001)
-                newframe.time_base = frame1.time_base
-                yield newframe
+            s += N
 
-                T += N/self.rate
-                AA = AA[N:]
-                BB = BB[N:]
+            if short:
+                break
 
     @staticmethod
     def QtDlgClass():
@@ -6,6 +6,7 @@ from PyQt5.QtWidgets import (QLabel, QVBoxLayout, QHBoxLayout, QWidget,
 
 from . import CrossFade
 from ..base import BaseFilter
+from .. import framecache
 
 from transcode.pyqtgui.qimageview import QImageView
 from transcode.pyqtgui.qfilterconfig import QFilterConfig
@@ -99,7 +100,7 @@ class QCrossFade(QFilterConfig):
 
     def setFrame(self, n):
         try:
-            frame = next(self.filtercopy.iterFrames(n, whence="framenumber"))
+            frame = next(framecache.iterFrames(self.filtercopy, n))
 
         except StopIteration:
             self.imageView.setFrame(
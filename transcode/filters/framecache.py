@@ -0,0 +1,217 @@
+"""
+Output frame cache for interactive use.
+
+Stepping through frames in a filter dialog calls iterFrames for one frame
+at a time, which re-decodes from the previous keyframe and re-runs every
+filter upstream. A FrameCache keeps output frames of a filter, keyed by
+output frame index, so that revisiting a frame costs nothing.
+
+All caches share one memory budget ('budget'), evicting the least recently
+used frames first. Setting budget.maxbytes to 0 disables caching.
+
+A filter's cache is invalidated through its reset_cache(start, end): frames
+made from source frames at or after 'start' are dropped, since the frames
+after an edit may all shift. Deep copies of a filter (as made by the
+dialogs) share its cache until either one is reset, at which point the one
+being reset gets its own copy of the frames still valid. State changes that
+alter frame data without going through reset_cache (__setstate__, setters of
+filter and zone parameters) call reset_framecache instead, which clears the
+caches of the filter and of everything depending on it.
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+from itertools import count
+
+defaultmaxbytes = 512*1024**2
+
+
+def _nbytes(frame):
+    try:
+        return sum(plane.buffer_size for plane in frame.planes)
+
+    except AttributeError:
+        return 0
+
+
+class FrameCacheBudget(object):
+    """Least-recently-used order and memory accounting of all FrameCaches."""
+
+    def __init__(self, maxbytes=defaultmaxbytes):
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._caches = weakref.WeakValueDictionary()
+        self._tokens = count()
+
+    def register(self, cache):
+        token = next(self._tokens)
+        self._caches[token] = cache
+        weakref.finalize(cache, self.discardAll, token)
+        return token
+
+    def add(self, token, n, nbytes):
+        with self.lock:
+            self.discard(token, n)
+            self._entries[token, n] = nbytes
+            self.nbytes += nbytes
+            self._evict()
+
+    def touch(self, token, n):
+        with self.lock:
+            if (token, n) in self._entries:
+                self._entries.move_to_end((token, n))
+
+    def discard(self, token, n):
+        with self.lock:
+            nbytes = self._entries.pop((token, n), None)
+
+            if nbytes is not None:
+                self.nbytes -= nbytes
+
+    def discardAll(self, token):
+        with self.lock:
+            for key in [key for key in self._entries if key[0] == token]:
+                self.nbytes -= self._entries.pop(key)
+
+    def _evict(self):
+        while self.nbytes > self.maxbytes and self._entries:
+            (token, n), nbytes = self._entries.popitem(last=False)
+            self.nbytes -= nbytes
+            cache = self._caches.get(token)
+
+            if cache is not None:
+                cache._frames.pop(n, None)
+
+
+budget = FrameCacheBudget()
+
+
+class FrameCache(object):
+    """
+    Output frames of one filter, keyed by output frame index. Each entry
+    also records the index of the source frame it was made from, and the
+    frame's pts, time_base and pict_type, which are restored on retrieval
+    in case a consumer changed them.
+    """
+
+    def __init__(self, budget=budget):
+        self.budget = budget
+        self.shared = False
+        self._frames = {}
+        self._token = budget.register(self)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, n):
+        return n in self._frames
+
+    def get(self, n):
+        with self.budget.lock:
+            entry = self._frames.get(n)
+
+            if entry is None:
+                return
+
+            self.budget.touch(self._token, n)
+
+        frame, src, pts, time_base, pict_type = entry
+        frame.pts = pts
+        frame.time_base = time_base
+
+        if pict_type is not None:
+            frame.pict_type = pict_type
+
+        return frame
+
+    def put(self, n, frame, src=None):
+        if self.budget.maxbytes <= 0:
+            return
+
+        with self.budget.lock:
+            self._frames[n] = (frame, src, frame.pts, frame.time_base,
+                               getattr(frame, "pict_type", None))
+            self.budget.add(self._token, n, _nbytes(frame))
+
+    def clear(self):
+        with self.budget.lock:
+            self._frames.clear()
+            self.budget.discardAll(self._token)
+
+    def invalidate(self, start=0, end=None):
+        """
+        Drops frames made from source frames at or after 'start' (all frames,
+        if start is 0). Returns the cache to use from now on: self, or if
+        this cache is shared, a new cache with the frames still valid.
+        """
+        with self.budget.lock:
+            keep = {n: entry for (n, entry) in self._frames.items()
+                    if start > 0 and entry[1] is not None
+                    and entry[1] < start}
+
+            if self.shared:
+                new = type(self)(self.budget)
+
+                for n, entry in keep.items():
+                    new._frames[n] = entry
+                    self.budget.add(new._token, n, _nbytes(entry[0]))
+
+                return new
+
+            for n in list(self._frames):
+                if n not in keep:
+                    del self._frames[n]
+                    self.budget.discard(self._token, n)
+
+            return self
+
+
+def _sourceIndex(source, n):
+    M = getattr(source, "cumulativeIndexReverseMap", None)
+
+    if M is not None and 0 <= n < len(M):
+        return int(M[n])
+
+
+def iterFrames(source, start=0, end=None):
+    """
+    Frames [start, end) of 'source' (by frame number), served from the
+    frame cache of 'source' where possible. The frames decoded are added to
+    the cache, which is created on first use. Sources that do not support
+    a frame cache (i.e., that are not filters) are iterated directly.
+    """
+    if not hasattr(type(source), "framecache") or budget.maxbytes <= 0:
+        yield from source.iterFrames(start, end, whence="framenumber")
+        return
+
+    if source.framecache is None:
+        source.framecache = FrameCache()
+
+    cache = source.framecache
+    n = start
+
+    while end is None or n < end:
+        frame = cache.get(n)
+
+        if frame is None:
+            break
+
+        yield frame
+        n += 1
+
+    if end is not None and n >= end:
+        return
+
+    frames = source.iterFrames(n, end, whence="framenumber")
+
+    try:
+        for k, frame in zip(count(n), frames):
+            cache.put(k, frame, _sourceIndex(source, k))
+            yield frame
+
+    finally:
+        if hasattr(frames, "close"):
+            frames.close()
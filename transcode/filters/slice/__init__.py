@@ -20,6 +20,12 @@ class Slice(BaseVideoFilter, BaseAudioFilter):
         self.endpts = endpts
         self.firstframekey = bool(firstframekey)
 
+    def reset_cache(self, start=0, end=None):
+        del self.prev_start
+        del self.prev_end
+        del self.sizes
+        super().reset_cache(start, end)
+
     @cached
     def prev_start(self):
         if self.type == "video":
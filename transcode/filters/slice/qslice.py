@@ -8,6 +8,7 @@ import numpy
 from numpy import concatenate
 
 from . import Slice
+from .. import framecache
 from transcode.util import search
 from transcode.pyqtgui.slider import Slider
 from transcode.pyqtgui.qimageview import QImageView
@@ -242,8 +243,7 @@ class QSlice(QFilterConfig):
                        self.filtercopy.startpts + 0.0005, "-")
 
             try:
-                frame = next(self.filtercopy.prev.iterFrames(
-                    n, whence="framenumber"))
+                frame = next(framecache.iterFrames(self.filtercopy.prev, n))
 
             except StopIteration:
                 self.startImageView.setFrame(
@@ -263,8 +263,8 @@ class QSlice(QFilterConfig):
                            self.filtercopy.endpts + 0.0005, "-")
 
                 try:
-                    frame = next(self.filtercopy.prev.iterFrames(
-                        n, whence="framenumber"))
+                    frame = next(framecache.iterFrames(
+                        self.filtercopy.prev, n))
 
                 except StopIteration:
                     self.endImageView.setFrame(
@@ -1,5 +1,5 @@
 from ...util import cached, search, ValidationException
-from ..base import BaseFilter, notifyIterate
+from ..base import BaseFilter
 import numpy
 from itertools import count
 
@@ -8,6 +8,56 @@ class InvalidType(ValidationException):
     pass
 
 
+def gopStarts(prev, start=0, end=None):
+    """
+    Frame indices (in the numbering of 'prev') in [start, end) at which a
+    GOP of the underlying source track begins.
+    """
+    if end is None:
+        end = prev.framecount
+
+    source = prev
+
+    while not hasattr(source, "index") and hasattr(source, "prev"):
+        source = source.prev
+
+    index = getattr(source, "index", None)
+
+    if not isinstance(index, numpy.ndarray) or index.ndim != 2 \
+            or not index.size:
+        return numpy.array([start])
+
+    K = numpy.searchsorted(source.pts, index[:, 0])
+    K = K[K < len(source.pts)]
+
+    if source is not prev and hasattr(prev, "cumulativeIndexMap"):
+        K = prev.cumulativeIndexMap[K]
+        K = K[K >= 0]
+
+    K = numpy.unique(K)
+    K = K[(K > start)*(K < end)]
+    return numpy.concatenate(([start], K))
+
+
+def gopChunks(prev, start=0, end=None, minsize=240):
+    """
+    Splits [start, end) into GOP-aligned chunks of at least 'minsize'
+    frames (except possibly the last one). Returns a list of (a, b) pairs.
+    """
+    if end is None:
+        end = prev.framecount
+
+    G = gopStarts(prev, start, end)
+    bounds = [start]
+
+    for k in G[1:]:
+        if k - bounds[-1] >= minsize:
+            bounds.append(int(k))
+
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
 class BaseVideoFilter(BaseFilter):
     allowedtypes = ("video",)
 
@@ -107,8 +157,29 @@ class BaseVideoFilter(BaseFilter):
 
         super().reset_cache(start, end)
 
+    @property
+    def identityIndexMap(self):
+        """
+        True if frames pass through this filter one-to-one, i.e., if it
+        overrides none of the index maps or framecount. Cumulative index
+        maps of such a filter are those of self.prev, shared rather than
+        recomputed, so that a chain of such filters stores no index maps of
+        its own.
+        """
+        cls = type(self)
+        return (cls.indexMap is BaseVideoFilter.indexMap
+                and cls.reverseIndexMap is BaseVideoFilter.reverseIndexMap
+                and cls.framecount is BaseVideoFilter.framecount
+                and cls.cumulativeIndexMap
+                is BaseVideoFilter.cumulativeIndexMap
+                and cls.cumulativeIndexReverseMap
+                is BaseVideoFilter.cumulativeIndexReverseMap)
+
     @cached
     def framecount(self):
+        if self.prev is not None and self.identityIndexMap:
+            return self.prev.framecount
+
         if self.prev is not None and self.prev.framecount is not None:
             for k in count(self.prev.framecount - 1, -1):
                 n = self.indexMap[k]
@@ -150,6 +221,9 @@ class BaseVideoFilter(BaseFilter):
         else:
             return
 
+        if self.identityIndexMap:
+            return n
+
         nonneg = n >= 0
         results = -numpy.ones(n.shape, dtype=numpy.int0)
         results[nonneg] = self.indexMap[n[nonneg]]
@@ -158,12 +232,14 @@ class BaseVideoFilter(BaseFilter):
 
     @cached
     def cumulativeIndexReverseMap(self):
-        n = self.reverseIndexMap
         if (hasattr(self.prev, "cumulativeIndexReverseMap")
                 and self.prev.cumulativeIndexReverseMap is not None):
-            n = self.prev.cumulativeIndexReverseMap[n]
+            if self.identityIndexMap:
+                return self.prev.cumulativeIndexReverseMap
 
-        return n
+            return self.prev.cumulativeIndexReverseMap[self.reverseIndexMap]
+
+        return self.reverseIndexMap
 
     @cached
     def indexMap(self):
@@ -183,20 +259,6 @@ class BaseVideoFilter(BaseFilter):
     def reverseIndexMap(self):
         del self.cumulativeIndexReverseMap
 
-    def _processFrames(self, iterable):
-        return iterable
-
-    def processFrames(self, iterable):
-        if callable(self.notify_input):
-            iterable = notifyIterate(iterable, self.notify_input)
-
-        iterable = self._processFrames(iterable)
-
-        if callable(self.notify_output):
-            iterable = notifyIterate(iterable, self.notify_output)
-
-        return iterable
-
     def iterFrames(self, start=0, end=None, whence="framenumber"):
         if whence == "pts":
             start = self.frameIndexFromPts(start)
@@ -1,16 +1,125 @@
 from .. import zoned
-from ..base import BaseVideoFilter
+from ..base import BaseVideoFilter, gopStarts
 from transcode.avarrays import toNDArray, toVFrame
+import transcode.parmap as parallel
+from concurrent.futures import ThreadPoolExecutor
+import threading
 from itertools import islice
 import numpy
 from av.video import VideoFrame
 from PIL import Image
 from collections import OrderedDict
 
+try:
+    from av.video.reformatter import VideoReformatter
+
+except ImportError:
+    VideoReformatter = None
+
+
+_8bitformats = {"yuv420p", "yuvj420p", "yuv422p", "yuvj422p", "yuv444p",
+                "yuvj444p", "nv12", "nv21", "gray"}
+
+
+def _luma(frame):
+    """Luma plane of 'frame' as a uint8 array, without copying if possible."""
+    if frame.format.name not in _8bitformats:
+        frame = frame.reformat(format="gray")
+
+    plane = frame.planes[0]
+    A = numpy.frombuffer(plane, dtype=numpy.uint8)
+    return A.reshape(-1, plane.line_size)[:frame.height, :frame.width]
+
+
+"""swscale equivalents of PIL resampling filters."""
+_interpolations = {
+    int(Image.NEAREST): "POINT",
+    int(Image.BILINEAR): "BILINEAR",
+    int(Image.BICUBIC): "BICUBIC",
+    int(Image.LANCZOS): "LANCZOS",
+    int(Image.BOX): "AREA",
+}
+
+
+class Scaler(object):
+    """
+    Resizes frames with libswscale, keeping their pixel format. One
+    VideoReformatter (and so one cached scaler context) is kept per thread,
+    so that scaler state is reused across frames even when frames are
+    processed in parallel. 'threads' is the number of slice threads
+    swscale may use (0: automatic), if the installed PyAV supports it.
+
+    Falls back to PIL (RGB only) if swscale is unavailable, or if
+    'resample' or 'box' cannot be expressed with swscale.
+    """
+
+    def __init__(self, width, height, resample=Image.LANCZOS, box=None,
+                 threads=None):
+        self.width = width
+        self.height = height
+        self.resample = resample
+        self.box = box
+        self.threads = threads
+        self._local = threading.local()
+        self._threadsupported = threads is not None
+
+    @property
+    def interpolation(self):
+        if self.resample is None:
+            return "BICUBIC"
+
+        return _interpolations.get(int(self.resample))
+
+    @property
+    def useswscale(self):
+        return (VideoReformatter is not None and self.box is None
+                and self.interpolation is not None)
+
+    def _reformatter(self):
+        reformatter = getattr(self._local, "reformatter", None)
+
+        if reformatter is None:
+            reformatter = self._local.reformatter = VideoReformatter()
+
+        return reformatter
+
+    def _swscale(self, frame):
+        kwargs = dict(width=self.width, height=self.height,
+                      interpolation=self.interpolation)
+
+        if self._threadsupported:
+            try:
+                return self._reformatter().reformat(
+                    frame, threads=self.threads, **kwargs)
+
+            except TypeError:
+                """PyAV too old for slice threading."""
+                self._threadsupported = False
+
+        return self._reformatter().reformat(frame, **kwargs)
+
+    def _pil(self, frame):
+        im = frame.to_image()
+        im = im.resize((self.width, self.height), self.resample, self.box)
+        return VideoFrame.from_image(im)
+
+    def __call__(self, frame):
+        if self.useswscale:
+            newframe = self._swscale(frame)
+
+        else:
+            newframe = self._pil(frame)
+
+        newframe.time_base = frame.time_base
+        newframe.pts = frame.pts
+        newframe.pict_type = frame.pict_type
+        return newframe
+
 
 class Crop(BaseVideoFilter):
     """Crop Video."""
     __name__ = "Crop"
+    stateless = True
 
     def __init__(self, croptop=0, cropbottom=0, cropleft=0, cropright=0,
                  prev=None, next=None, parent=None):
@@ -52,58 +161,57 @@ class Crop(BaseVideoFilter):
         if self.prev is not None:
             return self.prev.height - self.croptop - self.cropbottom
 
-    def _processFrames(self, iterable):
-        for frame in iterable:
-            if ((self.croptop % 2
-                 or self.cropbottom % 2
-                 or self.cropleft % 2
-                 or self.cropright % 2)
-                    and frame.format.name != "rgb24"):
-                frame = frame.to_rgb()
-
-            if frame.format.name == "rgb24":
-                A = toNDArray(frame)
-
-                A = A[
-                    self.croptop:-self.cropbottom
-                    if self.cropbottom else None,
-                    self.cropleft:-self.cropright
-                    if self.cropright else None
-                ]
-
-                newframe = toVFrame(A, frame.format.name)
-
-            elif frame.format.name == "yuv420p":
-                Y, U, V = toNDArray(frame)
-
-                Y = Y[
-                    self.croptop:-self.cropbottom
-                    if self.cropbottom else None,
-                    self.cropleft:-self.cropright
-                    if self.cropright else None
-                ]
-
-                U = U[
-                    self.croptop//2:-self.cropbottom//2
-                    if self.cropbottom else None,
-                    self.cropleft//2:-self.cropright//2
-                    if self.cropright else None
-                ]
-
-                V = V[
-                    self.croptop//2:-self.cropbottom//2
-                    if self.cropbottom else None,
-                    self.cropleft//2:-self.cropright//2
-                    if self.cropright else None
-                ]
-
-                newframe = toVFrame((Y, U, V), frame.format.name)
-
-            newframe.time_base = frame.time_base
-            newframe.pts = frame.pts
-            newframe.pict_type = frame.pict_type
-
-            yield newframe
+    def _processFrame(self, frame):
+        if ((self.croptop % 2
+             or self.cropbottom % 2
+             or self.cropleft % 2
+             or self.cropright % 2)
+                and frame.format.name != "rgb24"):
+            frame = frame.to_rgb()
+
+        if frame.format.name == "rgb24":
+            A = toNDArray(frame)
+
+            A = A[
+                self.croptop:-self.cropbottom
+                if self.cropbottom else None,
+                self.cropleft:-self.cropright
+                if self.cropright else None
+            ]
+
+            newframe = toVFrame(A, frame.format.name)
+
+        elif frame.format.name == "yuv420p":
+            Y, U, V = toNDArray(frame)
+
+            Y = Y[
+                self.croptop:-self.cropbottom
+                if self.cropbottom else None,
+                self.cropleft:-self.cropright
+                if self.cropright else None
+            ]
+
+            U = U[
+                self.croptop//2:-self.cropbottom//2
+                if self.cropbottom else None,
+                self.cropleft//2:-self.cropright//2
+                if self.cropright else None
+            ]
+
+            V = V[
+                self.croptop//2:-self.cropbottom//2
+                if self.cropbottom else None,
+                self.cropleft//2:-self.cropright//2
+                if self.cropright else None
+            ]
+
+            newframe = toVFrame((Y, U, V), frame.format.name)
+
+        newframe.time_base = frame.time_base
+        newframe.pts = frame.pts
+        newframe.pict_type = frame.pict_type
+
+        return newframe
 
     @staticmethod
     def QtDlgClass():
@@ -114,15 +222,13 @@ class Crop(BaseVideoFilter):
 class Resize(BaseVideoFilter):
     """Resize video."""
     __name__ = "Resize"
+    stateless = True
 
-    getinitkwargs = ["width", "height", "sar", "resample", "box"]
+    getinitkwargs = ["width", "height", "sar", "resample", "box", "threads"]
 
     def __init__(self, width=None, height=None, sar=1, resample=Image.LANCZOS,
-                 box=None, prev=None, next=None, parent=None):
-        self.width = width
-        self.height = height
-        self.resample = resample
-        self.box = box
+                 box=None, threads=None, prev=None, next=None, parent=None):
+        self.scaler = Scaler(width, height, resample, box, threads)
         self.sar = sar
         super().__init__(prev=prev, next=next, parent=parent)
 
@@ -133,6 +239,10 @@ class Resize(BaseVideoFilter):
         state["resample"] = self.resample
         state["box"] = self.box
         state["sar"] = self.sar
+
+        if self.threads is not None:
+            state["threads"] = self.threads
+
         return state
 
     def __setstate__(self, state):
@@ -141,6 +251,7 @@ class Resize(BaseVideoFilter):
         self.resample = state.get("resample")
         self.box = state.get("box")
         self.sar = state.get("sar", 1)
+        self.threads = state.get("threads")
         super().__setstate__(state)
 
     def __str__(self):
@@ -162,32 +273,55 @@ class Resize(BaseVideoFilter):
     @sar.setter
     def sar(self, value):
         self._sar = value
+        self.reset_framecache()
 
     @property
     def width(self):
-        return self._width
+        return self.scaler.width
 
     @width.setter
     def width(self, value):
-        self._width = value
+        self.scaler.width = value
+        self.reset_framecache()
 
     @property
     def height(self):
-        return self._height
+        return self.scaler.height
 
     @height.setter
     def height(self, value):
-        self._height = value
+        self.scaler.height = value
+        self.reset_framecache()
 
-    def _processFrames(self, iterable):
-        for frame in iterable:
-            im = frame.to_image()
-            im = im.resize((self.width, self.height), self.resample, self.box)
-            newframe = VideoFrame.from_image(im)
-            newframe.time_base = frame.time_base
-            newframe.pts = frame.pts
-            newframe.pict_type = frame.pict_type
-            yield newframe
+    @property
+    def resample(self):
+        return self.scaler.resample
+
+    @resample.setter
+    def resample(self, value):
+        self.scaler.resample = value
+        self.reset_framecache()
+
+    @property
+    def box(self):
+        return self.scaler.box
+
+    @box.setter
+    def box(self, value):
+        self.scaler.box = value
+        self.reset_framecache()
+
+    @property
+    def threads(self):
+        return self.scaler.threads
+
+    @threads.setter
+    def threads(self, value):
+        self.scaler.threads = value
+        self.scaler._threadsupported = value is not None
+
+    def _processFrame(self, frame):
+        return self.scaler(frame)
 
     @staticmethod
     def QtDlgClass():
@@ -229,65 +363,105 @@ class CropZone(zoned.Zone):
         self.rowanalysis = state.get("rowanalysis")
         self.colanalysis = state.get("colanalysis")
 
-    def analyzeFrames(self, iterable=None):
+    def sampleRanges(self, sample=1, samplelength=1):
+        """
+        Frame ranges [a, b) (in the numbering of parent.prev) to analyze.
+        With sample == 1, the whole zone. Otherwise, 'samplelength' frames
+        starting at every sample-th GOP start within the zone (or every
+        sample-th frame if no GOP information is available).
+        """
+        start, end = self.prev_start, self.prev_end
+
+        if sample <= 1:
+            return [(start, end)]
+
+        G = gopStarts(self.parent.prev, start, end)
+
+        if len(G) <= 1:
+            G = numpy.arange(start, end, sample*samplelength)
+
+        else:
+            G = G[::sample]
+
+        return [(int(k), int(min(k + samplelength, end))) for k in G]
+
+    def analyzeFrames(self, iterable=None, sample=1, samplelength=1,
+                      notifyprogress=None, cancelled=None):
+        """
+        Computes the maximum over all analyzed frames of each column
+        (rowanalysis) and of each row (colanalysis), keeping only running
+        maxima. If 'iterable' is not given, frames are read from
+        parent.prev, subject to 'sample' and 'samplelength' (see
+        sampleRanges). Nothing is stored if 'cancelled' is set.
+        """
         if iterable is None:
-            iterable = self.parent.prev.readFrames(
-                self.prev_start, self.prev_end)
+            iterable = (
+                frame for a, b in self.sampleRanges(sample, samplelength)
+                for frame in islice(self.parent.prev.iterFrames(
+                    a, b, whence="framenumber"), b - a))
 
-        R = []
-        C = []
+        R = C = None
 
-        for frame in iterable:
-            A = frame.to_ndarray()
+        for k, frame in enumerate(iterable):
+            if isinstance(cancelled, threading.Event) and cancelled.is_set():
+                """Partial maxima are not stored."""
+                return
 
             if frame.format.name == "rgb24":
-                R.append(A.max(axis=(0, 2)))
-                C.append(A.max(axis=(1, 2)))
+                A = frame.to_ndarray()
+                r = A.max(axis=(0, 2))
+                c = A.max(axis=(1, 2))
+
+            else:
+                A = _luma(frame)
+                r = A.max(axis=0)
+                c = A.max(axis=1)
+
+            if R is None:
+                R = r
+                C = c
 
             else:
-                h, w = A.shape
-                A = A[:2*h//3]
-                R.append(A.max(axis=0))
-                C.append(A.max(axis=1))
+                numpy.maximum(R, r, out=R)
+                numpy.maximum(C, c, out=C)
+
+            if callable(notifyprogress):
+                notifyprogress(k)
 
-        self.rowanalysis = numpy.array(R).max(axis=0)
-        self.colanalysis = numpy.array(C).max(axis=0)
+        self.rowanalysis = R
+        self.colanalysis = C
         return self.rowanalysis, self.colanalysis
 
-    def autocrop(self, setvalues=True):
-        if self.rowanalysis is None or self.colanalysis is None:
-            self.analyzeFrames()
+    @staticmethod
+    def _edges(analysis, threshold=32):
+        """
+        Returns (start, end) crop values, rounded down to even numbers, such
+        that everything below 'threshold' at either edge is cropped.
+        """
+        bright = numpy.asarray(analysis) >= threshold
 
-        S = self.rowanalysis < 32
-        D = self.colanalysis < 32
+        if bright.ndim > 1:
+            bright = bright.any(axis=tuple(range(1, bright.ndim)))
 
-        for j in range(len(self.rowanalysis)):
-            if not S[j].all():
-                cropleft = (j - 1) + (1 - j) % 2
-                break
-        else:
-            cropleft = None
+        K = bright.nonzero()[0]
 
-        for j in range(len(self.rowanalysis) - 1, 0, -1):
-            if not S[j].all():
-                cropright = len(self.rowanalysis) - (j + 1) + (j + 1) % 2
-                break
-        else:
-            cropright = None
+        if not len(K):
+            return None, None
 
-        for j in range(len(self.colanalysis)):
-            if not D[j].all():
-                croptop = (j - 1) + (1 - j) % 2
-                break
-        else:
-            croptop = None
+        start = int(K[0] - K[0] % 2)
 
-        for j in range(len(self.colanalysis) - 1, 0, -1):
-            if not D[j].all():
-                cropbottom = len(self.colanalysis) - (j + 1) + (j + 1) % 2
-                break
-        else:
-            cropbottom = None
+        if K[-1] == 0:
+            return start, None
+
+        n = len(bright)
+        return start, int(n - (K[-1] + 1) + (K[-1] + 1) % 2)
+
+    def autocrop(self, setvalues=True):
+        if self.rowanalysis is None or self.colanalysis is None:
+            self.analyzeFrames()
+
+        cropleft, cropright = self._edges(self.rowanalysis)
+        croptop, cropbottom = self._edges(self.colanalysis)
 
         if setvalues:
             self.croptop = croptop
@@ -295,6 +469,8 @@ class CropZone(zoned.Zone):
             self.cropleft = cropleft
             self.cropright = cropright
 
+        return croptop, cropbottom, cropleft, cropright
+
     def processFrames(self, iterable, prev_start):
         for frame in iterable:
             if ((self.croptop % 2
@@ -352,6 +528,7 @@ class CropZone(zoned.Zone):
 class CropScenes(zoned.ZonedFilter):
     """Crop video in zones. Resizes to a common size."""
     zoneclass = CropZone
+    identityIndexMap = True
 
     def __init__(self, zones=[], width=None, height=None,
                  resample=Image.LANCZOS, box=None, sar=1, **kwargs):
@@ -402,6 +579,7 @@ class CropScenes(zoned.ZonedFilter):
     @sar.setter
     def sar(self, value):
         self._sar = value
+        self.reset_framecache()
 
     @property
     def width(self):
@@ -410,6 +588,7 @@ class CropScenes(zoned.ZonedFilter):
     @width.setter
     def width(self, value):
         self._width = value
+        self.reset_framecache()
 
     @property
     def height(self):
@@ -418,31 +597,39 @@ class CropScenes(zoned.ZonedFilter):
     @height.setter
     def height(self, value):
         self._height = value
-
-    def analyzeFrames(self):
-        frames = self.prev.readFrames()
-
-        zone = self.start_zone
-
-        while zone is not None:
-            if zone.prev_framecount is not None:
-                zone_iterable = islice(frames, int(zone.prev_framecount))
-
-            else:
-                zone_iterable = frames
-
-            zone.analyzeFrames(zone_iterable)
-            zone = zone.next_zone
+        self.reset_framecache()
+
+    def analyzeFrames(self, sample=1, samplelength=1, nworkers=None,
+                      notifyprogress=None, cancelled=None):
+        """
+        Runs CropZone.analyzeFrames on all zones, several zones at a time,
+        each with its own reader. 'notifyprogress' is called with the number
+        of frames analyzed so far across all zones.
+        """
+        lock = threading.Lock()
+        done = [0]
+
+        def progress(k):
+            with lock:
+                done[0] += 1
+                count = done[0]
+
+            if callable(notifyprogress):
+                notifyprogress(count)
+
+        def analyze(zone):
+            return zone.analyzeFrames(sample=sample,
+                                      samplelength=samplelength,
+                                      notifyprogress=progress,
+                                      cancelled=cancelled)
+
+        with ThreadPoolExecutor(nworkers or parallel.nthreads,
+                                thread_name_prefix="CropWorker") as pool:
+            return list(pool.map(analyze, self))
 
     def _processFrames(self, iterable):
-        for frame in super()._processFrames(iterable):
-            im = frame.to_image()
-            im = im.resize((self.width, self.height), self.resample, self.box)
-            newframe = VideoFrame.from_image(im)
-            newframe.time_base = frame.time_base
-            newframe.pts = frame.pts
-            newframe.pict_type = frame.pict_type
-            yield newframe
+        scaler = Scaler(self.width, self.height, self.resample, self.box)
+        return map(scaler, super()._processFrames(iterable))
 
     def QtTableColumns(self):
         from .qcropandresize import CropResizeCol
@@ -13,6 +13,7 @@ import regex
 from . import Crop, Resize, CropScenes
 from transcode.filters.video.scenes import Scenes
 from transcode.filters.filterchain import FilterChain
+from transcode.filters import framecache
 from transcode.pyqtgui.qzones import ZoneDlg
 from transcode.pyqtgui.qframetablecolumn import ZoneCol
 from transcode.pyqtgui.qimageview import QImageView
@@ -343,8 +344,7 @@ class CropDlg(QFilterConfig):
     @pyqtSlot(int, QTime)
     def loadFrame(self, n, t):
         if self.filtercopy.prev is not None:
-            frame = next(
-                self.filtercopy.prev.iterFrames(n, whence="framenumber"))
+            frame = next(framecache.iterFrames(self.filtercopy.prev, n))
 
             im = frame.to_image()
             pixmap = im.convert("RGBA").toqpixmap()
@@ -65,34 +65,25 @@ class DropFrames(BaseVideoFilter, set):
 
     @BaseVideoFilter.indexMap.getter
     def indexMap(self):
+        D = numpy.int0(sorted(self.prev_dropframes))
         n = numpy.arange(self.prev.framecount)
-        results = -numpy.ones(n.shape, dtype=numpy.int0)
-        matched = numpy.zeros(n.shape, dtype=bool)
 
-        for k, d in enumerate(sorted(self.prev_dropframes)):
-            prefilter = n < d
-            arrayfilter = (~matched)*(prefilter)
-            results[arrayfilter] = n[arrayfilter] - k
-            matched[arrayfilter] = True
-            matched[n == d] = True
-
-        results[~matched] = n[~matched] - len(self.prev_dropframes)
+        """Each frame moves back by the number of frames dropped before it."""
+        results = n - numpy.searchsorted(D, n)
+        results[D] = -1
         return results
 
     @BaseVideoFilter.reverseIndexMap.getter
     def reverseIndexMap(self):
+        D = numpy.int0(sorted(self.prev_dropframes))
         m = numpy.arange(self.framecount)
-        results = -numpy.ones(m.shape, dtype=numpy.int0)
-        matched = numpy.zeros(m.shape, dtype=bool)
-
-        for k, d in enumerate(sorted(self.prev_dropframes)):
-            prefilter = m < d - k
-            arrayfilter = (~matched)*(prefilter)
-            results[arrayfilter] = m[arrayfilter] + k
-            matched[arrayfilter] = True
 
-        results[~matched] = m[~matched] + len(self.prev_dropframes)
-        return results
+        """
+        Output frame m comes after the first k dropped frames, where k is
+        the number of drops with D[k] - k <= m (nondecreasing in k).
+        """
+        return m + numpy.searchsorted(D - numpy.arange(len(D)), m,
+                                      side="right")
 
     def _processFrames(self, iterable):
         frame = next(iterable)
@@ -6,44 +6,46 @@ from ...avarrays import toNDArray, toVFrame
 class HFlip(BaseVideoFilter):
     """Horizontal Flip."""
 
+    stateless = True
+
     def __str__(self):
         return "Horizontal Flip"
 
-    def _processFrames(self, iterable):
-        for frame in iterable:
-            if frame.format.name == "rgb24":
-                A = toNDArray(frame)
-                newframe = toVFrame(A[:, ::-1], frame.format.name)
+    def _processFrame(self, frame):
+        if frame.format.name == "rgb24":
+            A = toNDArray(frame)
+            newframe = toVFrame(A[:, ::-1], frame.format.name)
 
-            elif frame.format.name == "yuv420p":
-                Y, U, V = toNDArray(frame)
-                newframe = toVFrame(
-                    (Y[:, ::-1], U[:, ::-1], V[:, ::-1]), frame.format.name)
+        elif frame.format.name == "yuv420p":
+            Y, U, V = toNDArray(frame)
+            newframe = toVFrame(
+                (Y[:, ::-1], U[:, ::-1], V[:, ::-1]), frame.format.name)
 
-            newframe.pts = frame.pts
-            newframe.time_base = frame.time_base
-            newframe.pict_type = frame.pict_type
-            yield newframe
+        newframe.pts = frame.pts
+        newframe.time_base = frame.time_base
+        newframe.pict_type = frame.pict_type
+        return newframe
 
 
 class VFlip(BaseVideoFilter):
     """Vertical Flip."""
 
+    stateless = True
+
     def __str__(self):
         return "Vertical Flip"
 
-    def _processFrames(self, iterable):
-        for frame in iterable:
-            if frame.format.name == "rgb24":
-                A = toNDArray(frame)
-                newframe = toVFrame(A[::-1], frame.format.name)
-
-            elif frame.format.name == "yuv420p":
-                Y, U, V = toNDArray(frame)
-                newframe = toVFrame(
-                    (Y[::-1], U[::-1], V[::-1]), frame.format.name)
-
-            newframe.pts = frame.pts
-            newframe.time_base = frame.time_base
-            newframe.pict_type = frame.pict_type
-            yield newframe
+    def _processFrame(self, frame):
+        if frame.format.name == "rgb24":
+            A = toNDArray(frame)
+            newframe = toVFrame(A[::-1], frame.format.name)
+
+        elif frame.format.name == "yuv420p":
+            Y, U, V = toNDArray(frame)
+            newframe = toVFrame(
+                (Y[::-1], U[::-1], V[::-1]), frame.format.name)
+
+        newframe.pts = frame.pts
+        newframe.time_base = frame.time_base
+        newframe.pict_type = frame.pict_type
+        return newframe
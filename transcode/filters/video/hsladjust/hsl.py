@@ -0,0 +1,307 @@
+"""
+RGB -> HSL -> RGB adjustment math used by HSLAdjust.
+
+Since the output of the adjustment depends only on the input RGB triple and
+the three parameters (dh, sfactor, lgamma), the transform can be tabulated.
+Three implementations are provided:
+
+* hsladjust64: The original float64 implementation. Used as the reference
+  when building tables.
+* hsladjust32: A vectorized float32 implementation without boolean masks.
+* LUT: An exact 256x256x256 table computed with the reference
+  implementation, cached on disk per parameter set.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy
+from numpy import moveaxis, zeros, uint8, float32, float64
+from numpy import min as npmin
+
+
+def _clipped64(A, dh=0, sfactor=1, lgamma=1):
+    """
+    Reference implementation. Accepts an array of shape (..., 3) with values
+    in [0, 256) and returns the clipped (but not yet truncated) float64
+    output.
+    """
+    A = numpy.asarray(A, dtype=float64)/256
+    R, G, B = moveaxis(A, -1, 0)
+    V = A.max(axis=-1)
+    C = V - A.min(axis=-1)
+    L = V - C/2
+
+    H = zeros(A.shape[:-1], dtype=float64)
+
+    case1 = C == 0
+    case2 = (V == R)*(~case1)
+    case3 = (V == G)*(~case1)*(~case2)
+    case4 = (V == B)*(~case1)*(~case2)*(~case3)
+
+    H[case2] = (60*(G[case2] - B[case2])/C[case2]) % 360
+    H[case3] = 60*(2 + (B[case3] - R[case3])/C[case3])
+    H[case4] = 60*(4 + (R[case4] - G[case4])/C[case4])
+
+    SL = zeros(A.shape[:-1], dtype=float64)
+
+    case5 = (L > 0)*(L < 1)
+    SL[case5] = ((V[case5] - L[case5])
+                 / npmin((L[case5], 1-L[case5]), axis=0))
+
+    # --- Adjustments to HSL go here ---
+
+    H += dh
+    H %= 360
+
+    SL *= sfactor
+
+    L = 1 - (1 - L)**lgamma
+
+    C = (1 - abs(2*L - 1))*SL
+
+    H /= 60
+    X = C*(1 - abs(H % 2 - 1))
+
+    case1 = (H <= 1)
+    case2 = (1 < H)*(H <= 2)
+    case3 = (2 < H)*(H <= 3)
+    case4 = (3 < H)*(H <= 4)
+    case5 = (4 < H)*(H <= 5)
+    case6 = H > 5
+
+    m = L - C/2
+
+    R = zeros(R.shape, dtype=float64)
+    G = zeros(G.shape, dtype=float64)
+    B = zeros(B.shape, dtype=float64)
+
+    R[case1] = C[case1]
+    G[case1] = X[case1]
+
+    R[case2] = X[case2]
+    G[case2] = C[case2]
+
+    G[case3] = C[case3]
+    B[case3] = X[case3]
+
+    G[case4] = X[case4]
+    B[case4] = C[case4]
+
+    B[case5] = C[case5]
+    R[case5] = X[case5]
+
+    B[case6] = X[case6]
+    R[case6] = C[case6]
+
+    R += m
+    G += m
+    B += m
+
+    return (256*moveaxis((R, G, B), 0, -1)).clip(min=0, max=255)
+
+
+def hsladjust64(A, dh=0, sfactor=1, lgamma=1):
+    """Original float64 implementation. Returns uint8."""
+    return uint8(_clipped64(A, dh, sfactor, lgamma))
+
+
+def hsladjust32(A, dh=0, sfactor=1, lgamma=1, bias=2**-8):
+    """
+    Vectorized float32 implementation. Hue is computed with nested
+    numpy.where calls and HSL -> RGB uses the closed-form expression
+    f(n) = L - C/2*clip(min(k - 3, 9 - k), -1, 1), k = (n + H/30) mod 12,
+    which avoids the six boolean masks of the reference implementation.
+    A small bias is added before truncation so that float32 rounding does
+    not knock exact code values down by one. Returns uint8.
+    """
+    A = numpy.asarray(A, dtype=float32)*float32(1/256)
+    R, G, B = moveaxis(A, -1, 0)
+    V = A.max(axis=-1)
+    C = V - A.min(axis=-1)
+    L = V - C/2
+
+    nonzero = C > 0
+    Cs = numpy.where(nonzero, C, float32(1))
+
+    # Hue in units of 30 degrees, in [0, 12).
+    H = numpy.where(V == R, 2*(((G - B)/Cs) % 6),
+                    numpy.where(V == G, 2*(2 + (B - R)/Cs),
+                                2*(4 + (R - G)/Cs)))
+    H *= nonzero
+
+    D = numpy.minimum(L, 1 - L)
+    positive = D > 0
+    S = (V - L)/numpy.where(positive, D, float32(1))
+    S *= positive
+
+    # --- Adjustments to HSL go here ---
+
+    H += float32(dh/30)
+    H %= 12
+
+    S *= float32(sfactor)
+
+    L = 1 - (1 - L)**float32(lgamma)
+
+    halfC = (1 - abs(2*L - 1))*S/2
+
+    out = numpy.empty(A.shape, dtype=float32)
+
+    for j, n in enumerate((0, 8, 4)):
+        k = (H + n) % 12
+        f = numpy.minimum(k - 3, 9 - k).clip(min=-1, max=1)
+        out[..., j] = L - halfC*f
+
+    out *= 256
+    out += float32(bias)
+    return uint8(out.clip(min=0, max=255))
+
+
+_cachelock = threading.Lock()
+_tables = OrderedDict()
+maxtables = 2
+
+"""Most recently used tables kept on disk (48 MB each)."""
+maxdiskfiles = 8
+
+
+def cachedir():
+    """Directory where exact tables are stored."""
+    base = os.environ.get("XDG_CACHE_HOME",
+                          os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "transcode", "hsladjust")
+
+
+def _prune(directory, keep=None):
+    """Deletes all but the 'keep' most recently used tables in 'directory'."""
+    if keep is None:
+        keep = maxdiskfiles
+
+    entries = []
+
+    for name in os.listdir(directory):
+        if name.endswith(".npy"):
+            path = os.path.join(directory, name)
+
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+
+            except FileNotFoundError:
+                continue
+
+    for mtime, path in sorted(entries, reverse=True)[keep:]:
+        try:
+            os.remove(path)
+
+        except FileNotFoundError:
+            pass
+
+
+def _tablekey(dh, sfactor, lgamma):
+    key = repr((float(dh), float(sfactor), float(lgamma)))
+    return hashlib.sha1(key.encode("utf8")).hexdigest()
+
+
+class LUT(object):
+    """
+    Exact lookup table covering all 2**24 RGB triples, computed with the
+    reference implementation. Tables are kept in memory (at most 'maxtables'
+    of them, 48 MB each) and cached on disk in 'cachedir()' (at most
+    'maxdiskfiles' of them).
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def build(cls, dh=0, sfactor=1, lgamma=1, chunk=16):
+        table = numpy.empty((256, 256, 256, 3), dtype=uint8)
+        N = numpy.arange(256, dtype=uint8)
+        GB = numpy.moveaxis(numpy.meshgrid(N, N, indexing="ij"), 0, -1)
+
+        for r in range(0, 256, chunk):
+            A = numpy.empty((chunk, 256, 256, 3), dtype=uint8)
+            A[..., 0] = N[r:r + chunk, None, None]
+            A[..., 1:] = GB
+            table[r:r + chunk] = hsladjust64(A, dh, sfactor, lgamma)
+
+        return cls(table.reshape(2**24, 3))
+
+    @classmethod
+    def get(cls, dh=0, sfactor=1, lgamma=1, usedisk=True):
+        key = _tablekey(dh, sfactor, lgamma)
+
+        with _cachelock:
+            if key in _tables:
+                _tables.move_to_end(key)
+                return _tables[key]
+
+            path = os.path.join(cachedir(), f"{key}.npy")
+            lut = None
+
+            if usedisk and os.path.isfile(path):
+                try:
+                    table = numpy.load(path)
+
+                except (OSError, ValueError):
+                    table = None
+
+                if table is not None and table.shape == (2**24, 3) \
+                        and table.dtype == uint8:
+                    lut = cls(table)
+
+                    try:
+                        os.utime(path)
+
+                    except OSError:
+                        pass
+
+            if lut is None:
+                lut = cls.build(dh, sfactor, lgamma)
+
+                if usedisk:
+                    lut.save(path)
+
+            _tables[key] = lut
+
+            while len(_tables) > maxtables:
+                _tables.popitem(last=False)
+
+            return lut
+
+    def save(self, path):
+        """
+        Atomically write table to 'path', then prune the least recently used
+        tables. Failure is not fatal.
+        """
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(
+                suffix=".npy", dir=os.path.dirname(path))
+
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    numpy.save(f, self.table)
+
+                os.replace(tmp, path)
+
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+            _prune(os.path.dirname(path))
+
+        except OSError:
+            pass
+
+    def __call__(self, A):
+        A = numpy.asarray(A, dtype=uint8)
+        index = A[..., 0].astype(numpy.uint32) << 16
+        index |= A[..., 1].astype(numpy.uint32) << 8
+        index |= A[..., 2]
+        return self.table.take(index, axis=0)
+
@@ -6,6 +6,7 @@ from transcode.pyqtgui.qfilterconfig import QFilterConfig
 from transcode.pyqtgui.qframeselect import QFrameSelect
 from transcode.pyqtgui.qimageview import QImageView
 from . import HSLAdjust
+from ... import framecache
 
 
 class QHSLAdjDlg(QFilterConfig):
@@ -117,7 +118,13 @@ class QHSLAdjDlg(QFilterConfig):
     @pyqtSlot(int, QTime)
     def loadFrame(self, n, t):
         if self.filtercopy.prev is not None:
-            frame = next(self.filtercopy.iterFrames(n, whence="framenumber"))
+            """
+            Previews use the float32 path to avoid building an exact lookup
+            table every time a spin box changes.
+            """
+            frame = next(framecache.iterFrames(self.filtercopy.prev, n))
+            frame = self.filtercopy.adjustFrame(
+                frame, self.filtercopy.adjuster("float32"))
             im = frame.to_image()
             pixmap = im.convert("RGBA").toqpixmap()
             self.imageView.setFrame(pixmap)
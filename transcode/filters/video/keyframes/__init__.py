@@ -41,13 +41,15 @@ class KeyFrames(BaseVideoFilter, set):
             return set()
 
         n = numpy.int0(sorted(self))
-        m = self.prev.cumulativeIndexMap[n]
-
-        while (m < 0).any():
-            n[m < 0] += 1
-            m = self.prev.cumulativeIndexMap[n]
-
-        return set(m)
+        M = self.prev.cumulativeIndexMap
+
+        """
+        A keyframe on a frame that was dropped upstream moves to the next
+        frame that was not.
+        """
+        valid = (M >= 0).nonzero()[0]
+        k = numpy.searchsorted(valid, n)
+        return set(M[valid[k[k < len(valid)]]].tolist())
 
     def _processFrames(self, iterable):
         frame = iterable.send(None)
@@ -162,6 +162,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._R
 
+        self.reset_framecache()
+
     @property
     def rmax(self):
         if self.transition:
@@ -180,6 +182,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._R
 
+        self.reset_framecache()
+
     @property
     def gmin(self):
         if self.transition:
@@ -198,6 +202,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._G
 
+        self.reset_framecache()
+
     @property
     def gmax(self):
         if self.transition:
@@ -216,6 +222,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._G
 
+        self.reset_framecache()
+
     @property
     def bmin(self):
         if self.transition:
@@ -234,6 +242,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._B
 
+        self.reset_framecache()
+
     @property
     def bmax(self):
         if self.transition:
@@ -252,6 +262,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._B
 
+        self.reset_framecache()
+
     @property
     def gamma(self):
         if self.transition:
@@ -269,6 +281,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._R, self.next._G, self.next._B
 
+        self.reset_framecache()
+
     @property
     def rgamma(self):
         if self.transition:
@@ -286,6 +300,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._R, self.next._G, self.next._B
 
+        self.reset_framecache()
+
     @property
     def ggamma(self):
         if self.transition:
@@ -303,6 +319,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._R, self.next._G, self.next._B
 
+        self.reset_framecache()
+
     @property
     def bgamma(self):
         if self.transition:
@@ -320,6 +338,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._R, self.next._G, self.next._B
 
+        self.reset_framecache()
+
     @property
     def transition(self):
         return self._transition
@@ -329,6 +349,8 @@ class Zone(zoned.Zone):
         self._transition = value
         del self._R, self._G, self._B
 
+        self.reset_framecache()
+
     @bgamma.setter
     def bgamma(self, value):
         self._bgamma = value
@@ -339,6 +361,8 @@ class Zone(zoned.Zone):
         if self.next is not None and self.next.transition:
             del self.next._R, self.next._G, self.next._B
 
+        self.reset_framecache()
+
     @property
     def _R(self):
         if self._R_ is None:
@@ -462,7 +486,7 @@ class Zone(zoned.Zone):
         rgb = map(torgb, frames)
         tuples = map(totuple, rgb)
 
-        for (A, fmt, pict_type, pts, time_base) in map(
+        for (A, fmt, pict_type, pts, time_base) in self.parent.mapFrames(
                 self._processOneFrame, tuples):
             frame = VideoFrame.from_ndarray(A, fmt)
             frame.pict_type = pict_type
@@ -509,6 +533,7 @@ class Zone(zoned.Zone):
 
 class Levels(zoned.ZonedFilter):
     zoneclass = Zone
+    identityIndexMap = True
 
     def __str__(self):
         if self is None:
@@ -11,6 +11,7 @@ from numpy import (log, arange, int0, maximum, meshgrid, exp, moveaxis,
 import threading
 
 from . import Levels
+from ... import framecache
 from transcode.pyqtgui.qframetablecolumn import ZoneCol
 from transcode.pyqtgui.qzones import ZoneDlg
 import sys
@@ -417,7 +418,7 @@ class QLevels(ZoneDlg):
 
     def generatePreview(self, n):
         self.currentFrame = next(
-            self.filtercopy.prev.iterFrames(n, whence="framenumber"))
+            framecache.iterFrames(self.filtercopy.prev, n))
 
         return super().generatePreview(n)
 
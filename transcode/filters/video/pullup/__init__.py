@@ -1,5 +1,6 @@
 #!/usr/bin/python
 from .. import zoned
+from . import telecine
 from ...base import CacheResettingProperty
 from transcode.util import cached, numpify
 import numpy
@@ -9,6 +10,27 @@ from av.video import VideoFrame
 from collections import OrderedDict
 
 
+def _copyYUV(frame, dest):
+    """
+    Copy frame data (converted to yuv420p if needed) into 'dest', an
+    ndarray laid out the same way as frame.to_ndarray() for yuv420p, without
+    creating intermediate arrays.
+    """
+    if frame.format.name != "yuv420p":
+        frame = frame.reformat(format="yuv420p")
+
+    H = frame.height
+    W = frame.width
+    h = H//2
+    w = W//2
+    dests = (dest[:H], dest[H:H + h//2].reshape(h, w),
+             dest[H + h//2:].reshape(h, w))
+
+    for plane, D in zip(frame.planes, dests):
+        A = numpy.frombuffer(plane, dtype=numpy.uint8)
+        D[:] = A.reshape(-1, plane.line_size)[:D.shape[0], :D.shape[1]]
+
+
 class Zone(zoned.Zone):
     getinitkwargs = ["src_start", "src_fps", "pulldown",
                      "pulldownoffset", "yblend", "uvblend"]
@@ -446,14 +468,8 @@ class Zone(zoned.Zone):
 
     @cached
     def start_pts_time(self):
-        start_pts = self.parent.start_pts_time
-        zone = self.prev
-
-        while zone is not None:
-            start_pts += zone.duration
-            zone = zone.prev
-
-        return start_pts
+        return (self.parent.start_pts_time
+                + zoned.Zone.start_pts_time.fget(self))
 
     @property
     def end_pts_time(self):
@@ -622,88 +638,86 @@ class Zone(zoned.Zone):
             frame.pts = self.pts[k - self.dest_start]
             yield frame
 
-    def _pullupBlock(self, frames, frames_yuv, inv_matrix, dest_index, fields):
+    def _pullupBlock(self, ring, avframes, valid, slots, inv_matrix,
+                     dest_index, fields, out, acc):
+        """
+        Reconstructs the frames of one block. Source frames are stored
+        (as yuv420p ndarrays) in 'ring', with the j-th frame of the block in
+        ring[slots[j]] (and the original frame object in
+        avframes[slots[j]]), and valid[j] indicating whether it has been
+        read.
+        'inv_matrix' contains the (fixed-point) blending weights. 'out' is a
+        preallocated uint8 buffer shaped like a single frame, and 'acc' is a
+        pair of int32 buffers of the same shape.
+        """
         framesreturned = False
+        n = len(valid)
+        H = 2*out.shape[0]//3
+        W = out.shape[1]
+
         for (e, o), row, k in zip(fields, inv_matrix, dest_index):
             """Do we have the data to create this frame?"""
             if e == o:
-                try:
-                    if frames[e] is None:
-                        raise IndexError
-
-                except IndexError:
+                if e >= n or not valid[e]:
                     if framesreturned:
                         break
 
                     continue
 
-                frame = frames[e]
-                frame.time_base = self.parent.time_base
-
-                try:
-                    frame.pts = self.pts[k - self.dest_start]
-
-                except Exception:
-                    raise
-
-                yield frame
-                framesreturned = True
+                frame = avframes[slots[e]]
 
             else:
-                try:
-                    if (self.yblend or self.uvblend):
-                        for j, w in enumerate(row):
-                            if w != 0 and frames[j] is None:
-                                raise IndexError
-
-                    if frames[e] is None or frames[o] is None:
-                        raise IndexError
+                nonzero = row.nonzero()[0]
 
-                except IndexError:
+                if (e >= n or o >= n or not valid[e] or not valid[o]
+                        or ((self.yblend or self.uvblend)
+                            and (nonzero.size and (nonzero[-1] >= n
+                                                   or not valid[nonzero].all()
+                                                   )))):
                     if framesreturned:
                         break
 
                     continue
 
-                eframe = frames_yuv[e]
-                H, W = eframe.shape
-                H = H*2/3
-                H = int(H)
-                W = int(W)
-                oframe = frames_yuv[o]
+                eframe = ring[slots[e]]
+                oframe = ring[slots[o]]
 
-                if self.yblend:
-                    Y = numpy.sum([w*frame[:H] for (w, frame)
-                                   in zip(row, frames_yuv) if w != 0], axis=0)
-                    Y = numpy.uint8(Y.clip(min=0, max=255) + 0.5)
+                if self.yblend or self.uvblend:
+                    rows = slice(0 if self.yblend else H,
+                                 None if self.uvblend else H)
+                    A = acc[0, rows]
+                    T = acc[1, rows]
+                    A.fill(1 << (self._weightbits - 1))
 
-                else:
-                    Ye = eframe[:H:2]
-                    Yo = oframe[1:H:2]
-                    Y = numpy.moveaxis([Ye, Yo], 0, 1).reshape(H, W)
+                    for j in nonzero:
+                        numpy.multiply(ring[slots[j], rows], row[j], out=T,
+                                       dtype=numpy.int32)
+                        A += T
 
-                if self.uvblend:
-                    UV = numpy.sum([w*frame[H:] for (w, frame)
-                                    in zip(row, frames_yuv) if w != 0], axis=0)
-                    UV = numpy.uint8(UV.clip(min=0, max=255) + 0.5)
+                    A >>= self._weightbits
+                    numpy.clip(A, 0, 255, out=A)
+                    out[rows] = A
 
-                else:
-                    Ue = eframe[H:5*H//4, :W//2]
-                    Uo = oframe[H:5*H//4, W//2:]
-                    U = numpy.concatenate([Ue, Uo], axis=1)
-                    Ve = eframe[5*H//4:, :W//2]
-                    Vo = oframe[5*H//4:, W//2:]
-                    V = numpy.concatenate([Ve, Vo], axis=1)
-                    UV = numpy.concatenate([U, V], axis=0)
+                if not self.yblend:
+                    out[:H:2] = eframe[:H:2]
+                    out[1:H:2] = oframe[1:H:2]
 
-                YUV = numpy.concatenate((Y, UV), axis=0)
-                frame = VideoFrame.from_ndarray(YUV, format="yuv420p")
+                if not self.uvblend:
+                    out[H:, :W//2] = eframe[H:, :W//2]
+                    out[H:, W//2:] = oframe[H:, W//2:]
 
-                frame.time_base = self.parent.time_base
-                frame.pts = self.pts[k - self.dest_start]
+                frame = VideoFrame.from_ndarray(out, format="yuv420p")
 
-                yield frame
-                framesreturned = True
+            frame.time_base = self.parent.time_base
+            frame.pts = self.pts[k - self.dest_start]
+
+            yield frame
+            framesreturned = True
+
+    _weightbits = 14
+
+    def _fixedWeights(self, M):
+        return numpy.int32(numpy.round(numpy.array(M)*2**self._weightbits))
 
     def _pullupFrames(self, iterable, prev_start):
         if prev_start < self.prev_start + self.old_blksize_head:
@@ -725,24 +739,40 @@ class Zone(zoned.Zone):
             if dest_start >= 0:
                 break
 
-        prev_index = itertools.count(prev_start)
         dest_index = itertools.count(dest_start)
         overlap = max(1, self._pattern_int.max() - self.new_blksize + 1)
-        Iterator = zip(prev_index, iterable)
-
-        skip = prev_start - blk_start
-        frames = [None]*skip
-        frames_yuv = [None]*skip
+        iterator = iter(iterable)
+
+        """
+        Source frames are kept in a ring of yuv420p buffers, allocated
+        once the first frame arrives. 'base' is the ring slot holding frame
+        'blk_start', and 'n' is the number of frames read relative to
+        'blk_start' (frames preceding 'prev_start' are never read, and
+        are marked as invalid).
+        """
+        size = self.old_blksize + overlap
+        ring = out = acc = None
+        avframes = [None]*size
+        valid = numpy.zeros(size, dtype=bool)
+        base = 0
+        n = prev_start - blk_start
+        weights = {}
 
         while blk_start < self.prev_end:
             fl = next_start - blk_start + overlap
-            new_frames = [frame for p_i, frame in itertools.islice(
-                Iterator, max(0, fl - len(frames)))]
-            frames.extend(new_frames)
-            frames_yuv.extend([frame.reformat(format="yuv420p").to_ndarray()
-                               if frame.format.name != "yuv420p"
-                               else frame.to_ndarray()
-                               for frame in new_frames])
+
+            for frame in itertools.islice(iterator, max(0, fl - n)):
+                if ring is None:
+                    shape = (3*frame.height//2, frame.width)
+                    ring = numpy.empty((size,) + shape, dtype=numpy.uint8)
+                    out = numpy.empty(shape, dtype=numpy.uint8)
+                    acc = numpy.empty((2,) + shape, dtype=numpy.int32)
+
+                slot = (base + n) % size
+                _copyYUV(frame, ring[slot])
+                avframes[slot] = frame
+                valid[slot] = True
+                n += 1
 
             if blk_start == self.prev_start:
                 fields = self.reverse_mapping_head
@@ -766,12 +796,24 @@ class Zone(zoned.Zone):
                 M = self.reverse_matrix_blended
                 fields = self.reverse_mapping
 
-            for newframe in self._pullupBlock(
-                    frames, frames_yuv, M, dest_index, fields):
-                yield newframe
+            if id(M) not in weights:
+                weights[id(M)] = (M, self._fixedWeights(M))
+
+            slots = (base + numpy.arange(size)) % size
+
+            if ring is not None:
+                for newframe in self._pullupBlock(
+                        ring, avframes, valid[slots[:n]], slots,
+                        weights[id(M)][1], dest_index, fields, out, acc):
+                    yield newframe
 
-            del frames[:next_start - blk_start]
-            del frames_yuv[:next_start - blk_start]
+            shift = next_start - blk_start
+
+            for slot in slots[:min(shift, size)]:
+                avframes[slot] = None
+                valid[slot] = False
+            base = (base + shift) % size
+            n = max(0, n - shift)
             blk_start = next_start
             next_start = min(next_start + self.old_blksize, self.prev_end)
 
@@ -924,6 +966,70 @@ class ZonedPullup(zoned.ZonedFilter):
             else:
                 n += 1
 
+    def analyzeTelecine(self, start=0, end=None, sample=1,
+                        notifyprogress=None, cancelled=None, **kwargs):
+        """
+        Field metrics of source frames [start, end), for use with
+        applyTelecine. See telecine.analyze.
+        """
+        return telecine.analyze(self.prev, start, end, sample=sample,
+                                notifyprogress=notifyprogress,
+                                cancelled=cancelled, **kwargs)
+
+    def applyTelecine(self, metrics, start=0,
+                      patterns=telecine.defaultpatterns, **kwargs):
+        """
+        Replaces the zones covering source frames [start, start +
+        len(metrics)) with zones following the cadences detected from
+        'metrics' (see telecine.detect). Zones outside of that range are
+        left unchanged. Returns the detected runs.
+        """
+        end = start + len(metrics)
+        runs = telecine.detect(metrics, start, patterns, **kwargs)
+
+        if end < self.prev.framecount:
+            k, zone = self.zoneAt(end)
+
+            if zone.src_start != end:
+                self.insertZoneAt(
+                    end, src_fps=zone.src_fps, pulldown=zone.pulldown,
+                    pulldownoffset=(zone.pulldownoffset + end
+                                    - zone.src_start) % zone.old_blksize,
+                    yblend=zone.yblend, uvblend=zone.uvblend)
+
+        for zone in list(self):
+            if start < zone.src_start < end:
+                self.removeZoneAt(zone.src_start)
+
+        for n, pattern, offset in runs:
+            k, zone = self.zoneAt(n)
+
+            if zone.src_start != n:
+                self.insertZoneAt(n, src_fps=zone.src_fps, pulldown=pattern,
+                                  pulldownoffset=offset, yblend=zone.yblend,
+                                  uvblend=zone.uvblend)
+
+            else:
+                zone.pulldown = pattern
+                zone.pulldownoffset = offset
+
+        return runs
+
+    def autotelecine(self, start=0, end=None, sample=1,
+                     patterns=telecine.defaultpatterns, notifyprogress=None,
+                     cancelled=None):
+        """
+        Detects telecine patterns and offsets in source frames [start, end)
+        and sets up zones accordingly. With sample > 1, only every
+        sample-th GOP-aligned chunk is decoded, and zone boundaries are
+        only as accurate as the sampling allows.
+        """
+        metrics = self.analyzeTelecine(start, end, sample, notifyprogress,
+                                       cancelled)
+
+        if metrics is not None:
+            return self.applyTelecine(metrics, start, patterns)
+
     @cached
     def defaultDuration(self):
         durations = {}
@@ -1,10 +1,14 @@
 from PyQt5.QtGui import (QColor, QValidator)
-from PyQt5.QtCore import Qt, QRegExp
+from PyQt5.QtCore import Qt, QRegExp, pyqtSignal, pyqtSlot
 from PyQt5.QtWidgets import (QItemDelegate, QLineEdit, QAction, QMessageBox,
-                             QVBoxLayout, QHBoxLayout, QLabel)
+                             QVBoxLayout, QHBoxLayout, QLabel,
+                             QProgressDialog, QPushButton)
 from PyQt5.QtGui import QRegExpValidator
 from fractions import Fraction as QQ
 import regex
+import threading
+import traceback
+import types
 from functools import partial
 
 from transcode.pyqtgui.qzones import ZoneDlg
@@ -235,8 +239,29 @@ class BaseFrameRateCol(ZoneCol):
         menu.addAction(QAction(
             "Auto Frame Rate", table,
             triggered=partial(self.autoFrameRate, table=table)))
+
+        menu.addAction(QAction(
+            "Detect Telecine...", table,
+            triggered=partial(self.detectTelecine, table=table)))
+
+        menu.addAction(QAction(
+            "Detect Telecine (Sampled)...", table,
+            triggered=partial(self.detectTelecine, table=table, sample=4)))
         return menu
 
+    def detectTelecine(self, table, sample=1):
+        if len(self.filter) > 1 and QMessageBox.question(
+                table, "Detect Telecine",
+                "Current zone settings will be lost! Do you wish to proceed?",
+                QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes:
+            return
+
+        dlg = TelecineAnalysis(self.filter, sample, table)
+
+        if dlg.exec_() and dlg.metrics is not None:
+            self.filter.applyTelecine(dlg.metrics)
+            table.contentsModified.emit()
+
     def autoFrameRate(self, table):
         isdefault = (len(self.filter) == 1
                      and self.filter.start.src_fps == QQ(24000, 1001)
@@ -250,6 +275,85 @@ class BaseFrameRateCol(ZoneCol):
             table.contentsModified.emit()
 
 
+class TelecineAnalysis(QProgressDialog):
+    progress = pyqtSignal(int)
+    progresscomplete = pyqtSignal()
+    analysiserror = pyqtSignal(BaseException, types.TracebackType)
+
+    def __init__(self, filter, sample=1, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setAutoClose(True)
+        self.setAutoReset(False)
+        self.setWindowTitle("Detecting Telecine...")
+        self.setMinimumWidth(320)
+        self.setLabel(QLabel("Analyzing fields..."))
+
+        self.cancelevent = threading.Event()
+        self.cancelButton = QPushButton("&Cancel")
+        self.setCancelButton(self.cancelButton)
+        self.cancelButton.clicked.connect(self.cancel)
+
+        self.filter = filter
+        self.sample = sample
+        self.metrics = None
+
+        self.setMaximum(filter.prev.framecount//max(1, sample))
+        self.progress.connect(self.updateValue)
+        self.progresscomplete.connect(self.progressComplete)
+        self.analysiserror.connect(self.analysisError)
+
+        self.thread = None
+
+    def _analyze(self):
+        try:
+            self.metrics = self.filter.analyzeTelecine(
+                sample=self.sample, notifyprogress=self.progress.emit,
+                cancelled=self.cancelevent)
+
+        except BaseException as exc:
+            self.analysiserror.emit(exc, exc.__traceback__)
+
+        finally:
+            if self.metrics is not None:
+                self.progresscomplete.emit()
+
+    def exec_(self):
+        self.thread = threading.Thread(target=self._analyze)
+        self.thread.start()
+        return super().exec_()
+
+    def updateValue(self, value):
+        if value > self.value():
+            self.setValue(min(value, self.maximum()))
+
+    def progressComplete(self):
+        self.done(1)
+        self.close()
+
+    @pyqtSlot(BaseException, types.TracebackType)
+    def analysisError(self, exc, tb):
+        message = "".join(traceback.format_exception(type(exc), exc, tb))
+        errorDlg = QMessageBox(self)
+        errorDlg.setWindowTitle("Telecine Detection Error")
+        errorDlg.setText("The following exception was encountered while "
+                         f"detecting telecine:\n\n{message}")
+        errorDlg.setStandardButtons(QMessageBox.Ok)
+        errorDlg.setDefaultButton(QMessageBox.Ok)
+        errorDlg.setIcon(QMessageBox.Critical)
+        errorDlg.exec_()
+        self.done(0)
+        self.close()
+
+    def cancel(self):
+        self.cancelevent.set()
+
+        if self.thread is not None:
+            self.thread.join()
+
+        self.setValue(0)
+        super().cancel()
+
+
 class FrameRateCheckCol(BaseFrameRateCol):
     headerdisplay = "FRZ"
     width = 72
@@ -0,0 +1,367 @@
+"""
+Telecine cadence detection for ZonedPullup.
+
+Analysis is done in two steps:
+
+* analyze: A single vectorized pass over the luma plane of each frame that
+  computes four per-frame field metrics (see 'fieldMetrics'). The frame
+  range is split into GOP-aligned chunks which are decoded and measured
+  concurrently. With sample > 1, only every sample-th chunk is decoded.
+
+* detect: Each candidate (pattern, phase) predicts, for every frame, which
+  fields should repeat the previous field and which field pairing should
+  be combed. Those predictions are scored against the metrics, and a
+  Viterbi search with a fixed switching cost finds the cheapest sequence of
+  cadences, so that zones are split where the cadence breaks.
+"""
+
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+from transcode import parmap
+from ..base import gopChunks
+
+defaultpatterns = ("AAABBCCCDD", "AAABBCCDDD")
+
+"""Columns of the array returned by fieldMetrics."""
+EDIFF, ODIFF, SAME, CROSS = range(4)
+
+_8bitformats = {"yuv420p", "yuvj420p", "yuv422p", "yuvj422p", "yuv444p",
+                "yuvj444p", "yuv411p", "yuv410p", "nv12", "nv21", "gray"}
+
+
+def luma(frame, step=2):
+    """
+    Luma plane of 'frame' as a uint8 array (without copying, if possible),
+    cropped to an even number of rows and subsampled horizontally by 'step'.
+    """
+    if frame.format.name not in _8bitformats:
+        frame = frame.reformat(format="gray")
+
+    plane = frame.planes[0]
+    A = numpy.frombuffer(plane, dtype=numpy.uint8)
+    A = A.reshape(-1, plane.line_size)
+    return A[:frame.height & ~1, :frame.width:step]
+
+
+def fieldMetrics(Y, prevY, out, buf=None):
+    """
+    Writes the following mean absolute differences between the fields of
+    luma planes Y and prevY into 'out':
+
+    out[EDIFF]: Even field vs. previous even field.
+    out[ODIFF]: Odd field vs. previous odd field.
+    out[SAME]:  Even field vs. odd field of the same frame.
+    out[CROSS]: Even field vs. previous odd field.
+
+    If prevY is None, EDIFF, ODIFF and CROSS are set to nan.
+    """
+    E = Y[0::2]
+    O = Y[1::2]
+
+    if buf is None:
+        buf = numpy.empty(E.shape, dtype=numpy.int16)
+
+    def meandiff(A, B):
+        numpy.subtract(A, B, out=buf, dtype=numpy.int16)
+        numpy.abs(buf, out=buf)
+        return buf.mean()
+
+    out[SAME] = meandiff(E, O)
+
+    if prevY is None:
+        out[EDIFF] = out[ODIFF] = out[CROSS] = numpy.nan
+        return out
+
+    out[EDIFF] = meandiff(E, prevY[0::2])
+    out[ODIFF] = meandiff(O, prevY[1::2])
+    out[CROSS] = meandiff(E, prevY[1::2])
+    return out
+
+
+def _analyzeChunk(prev, a, b, step, cancelled=None, notifyprogress=None):
+    """
+    Returns (M, head, tail), where M is the (b - a, 4) array of field
+    metrics of frames a, ..., b - 1 (M[0] has nan where frame a - 1 is
+    needed), and head, tail are the luma planes of the first and last
+    frames.
+    """
+    M = numpy.full((b - a, 4), numpy.nan)
+    head = prevY = buf = None
+    count = 0
+
+    frames = prev.iterFrames(a, b, whence="framenumber")
+
+    try:
+        for frame in islice(frames, b - a):
+            if (isinstance(cancelled, threading.Event)
+                    and cancelled.is_set()):
+                break
+
+            Y = luma(frame, step)
+
+            if buf is None:
+                buf = numpy.empty(Y[0::2].shape, dtype=numpy.int16)
+                head = Y
+
+            fieldMetrics(Y, prevY, M[count], buf)
+            prevY = Y
+            count += 1
+
+            if callable(notifyprogress):
+                notifyprogress(1)
+
+    finally:
+        if hasattr(frames, "close"):
+            frames.close()
+
+    return M[:count], head, prevY
+
+
+def analyze(prev, start=0, end=None, sample=1, step=2, minchunk=240,
+            nworkers=None, notifyprogress=None, cancelled=None):
+    """
+    Computes field metrics (see 'fieldMetrics') for frames [start, end) of
+    'prev'. Returns an array of shape (end - start, 4). Rows of frames that
+    were skipped (sample > 1) or could not be measured are nan.
+
+    The range is split into GOP-aligned chunks, each decoded by its own
+    iterator on a dedicated thread pool of 'nworkers' threads. Chunks are
+    stitched together in order, and the first row of each chunk is
+    recomputed from the last frame of the preceding chunk when available.
+
+    Returns None if 'cancelled' (a threading.Event) was set.
+    """
+    if end is None:
+        end = prev.framecount
+
+    if nworkers is None:
+        nworkers = parmap.nthreads
+
+    M = numpy.full((end - start, 4), numpy.nan)
+    selected = gopChunks(prev, start, end, minchunk)[::max(1, int(sample))]
+
+    lock = threading.Lock()
+    done = [0]
+
+    def progress(k):
+        with lock:
+            done[0] += k
+            count = done[0]
+
+        if callable(notifyprogress):
+            notifyprogress(count)
+
+    def work(ab):
+        return ab, _analyzeChunk(prev, *ab, step, cancelled, progress)
+
+    tail = None
+    tailend = None
+
+    with ThreadPoolExecutor(nworkers,
+                            thread_name_prefix="TelecineWorker") as executor:
+        for (a, b), (C, head, newtail) in parmap.imap(
+                work, selected, maxinflight=nworkers, executor=executor):
+            if isinstance(cancelled, threading.Event) and cancelled.is_set():
+                return
+
+            M[a - start:a - start + len(C)] = C
+
+            if tailend == a and head is not None:
+                fieldMetrics(head, tail, M[a - start])
+
+            tail = newtail
+            tailend = a + len(C)
+
+    if isinstance(cancelled, threading.Event) and cancelled.is_set():
+        return
+
+    return M
+
+
+class Cadence(object):
+    """
+    Field predictions for a telecine pattern (as used by ZonedPullup's
+    'pulldown'), or for progressive frames if pattern is None. Each of
+    the following is a boolean array indexed by position in the pattern:
+
+    erepeat/orepeat: Even/odd field repeats the previous even/odd field.
+    same: Even and odd fields of the frame come from the same picture.
+    cross: Even field comes from the same picture as the previous odd field.
+    """
+
+    def __init__(self, pattern=None):
+        self.pattern = pattern
+
+        if pattern is None:
+            P = numpy.zeros((1, 2), dtype=numpy.int0)
+            new_blksize = 1
+
+        else:
+            P = numpy.array(list(map(ord, pattern.upper())))
+            P = P.reshape(-1, 2) - ord("A")
+            new_blksize = min(numpy.ptp(P[:, 0]), numpy.ptp(P[:, 1])) + 1
+
+        """Letters of the previous frame, shifted back one block at k = 0."""
+        Q = numpy.roll(P, 1, axis=0)
+        Q[0] -= new_blksize
+
+        self.erepeat = P[:, 0] == Q[:, 0]
+        self.orepeat = P[:, 1] == Q[:, 1]
+        self.same = P[:, 0] == P[:, 1]
+        self.cross = P[:, 0] == Q[:, 1]
+
+    def __len__(self):
+        return len(self.erepeat)
+
+    def costs(self, evidence, phase, weights=(1, 1, 1)):
+        """
+        Per-frame cost of this cadence when frame n sits at position
+        (n + phase) % len(self) of the pattern.
+        """
+        motion_e, motion_o, repeat_e, repeat_o, comb = evidence
+        wmotion, wrepeat, wcomb = weights
+        N = len(comb)
+        k = (numpy.arange(N) + phase) % len(self)
+
+        er = self.erepeat[k]
+        orep = self.orepeat[k]
+        C = wmotion*(numpy.where(er, motion_e, 0)
+                     + numpy.where(orep, motion_o, 0))
+        C += wrepeat*(numpy.where(er, 0, repeat_e)
+                      + numpy.where(orep, 0, repeat_o))
+
+        same = self.same[k]
+        cross = self.cross[k]
+        C += wcomb*(numpy.where(same & ~cross, comb.clip(min=0), 0)
+                    + numpy.where(cross & ~same, (-comb).clip(min=0), 0))
+        return C
+
+
+def evidence(M, window=15, minmotion=0.75, repeatratio=0.3):
+    """
+    Normalizes field metrics into evidence arrays, each in [0, 1] (comb in
+    [-1, 1]), that are zero where nothing can be concluded (no motion, or
+    frames not analyzed):
+
+    motion_e/motion_o: Field differs from the previous field.
+    repeat_e/repeat_o: Field repeats the previous field.
+    comb: Positive if the even field matches the odd field of the previous
+        frame better than that of its own frame, negative if vice versa.
+
+    Motion is measured relative to a running median of field differences
+    over 'window' frames, and is considered informative only above
+    'minmotion' (mean absolute difference in code values).
+    """
+    M = numpy.asarray(M, dtype=numpy.float64)
+    ediff = M[:, EDIFF]
+    odiff = M[:, ODIFF]
+    same = M[:, SAME]
+    cross = M[:, CROSS]
+
+    D = (ediff + odiff)/2
+    pad = window//2
+    Dpad = numpy.pad(D, pad, mode="edge")
+
+    with warnings.catch_warnings(), \
+            numpy.errstate(invalid="ignore", divide="ignore"):
+        """Windows consisting entirely of frames not analyzed."""
+        warnings.simplefilter("ignore", RuntimeWarning)
+        S = numpy.nanmedian(sliding_window_view(Dpad, window), axis=1) \
+            if len(D) else D
+        informative = S > minmotion
+        Ssafe = numpy.where(informative, S, 1)
+
+        motion_e = numpy.where(informative, (ediff/Ssafe).clip(0, 1), 0)
+        motion_o = numpy.where(informative, (odiff/Ssafe).clip(0, 1), 0)
+        repeat_e = numpy.where(
+            informative, (1 - ediff/(repeatratio*Ssafe)).clip(0, 1), 0)
+        repeat_o = numpy.where(
+            informative, (1 - odiff/(repeatratio*Ssafe)).clip(0, 1), 0)
+
+        total = same + cross
+        comb = numpy.where(informative*(total > 0),
+                           (same - cross)/numpy.where(total > 0, total, 1), 0)
+
+    evidence = [motion_e, motion_o, repeat_e, repeat_o, comb]
+    return [numpy.nan_to_num(A) for A in evidence]
+
+
+def viterbi(C, switchcost):
+    """
+    Given a cost matrix C of shape (H, N), returns the state sequence
+    minimizing the sum of C[state[n], n] plus 'switchcost' per change of
+    state.
+    """
+    H, N = C.shape
+    back = numpy.empty((N, H), dtype=numpy.int16)
+    states = numpy.arange(H, dtype=numpy.int16)
+
+    if N == 0:
+        return numpy.zeros(0, dtype=numpy.int16)
+
+    D = C[:, 0].copy()
+    back[0] = states
+
+    for n in range(1, N):
+        best = D.argmin()
+        switch = D[best] + switchcost
+        move = D > switch
+        back[n] = numpy.where(move, best, states)
+        numpy.minimum(D, switch, out=D)
+        D += C[:, n]
+
+    path = numpy.empty(N, dtype=numpy.int16)
+    path[-1] = D.argmin()
+
+    for n in range(N - 1, 0, -1):
+        path[n - 1] = back[n, path[n]]
+
+    return path
+
+
+def detect(M, start=0, patterns=defaultpatterns, switchcost=8.0,
+           weights=(1, 1, 1), **kwargs):
+    """
+    Detects cadences from the field metrics 'M' of frames start, start + 1,
+    .... Returns a list of (n, pattern, offset) tuples, one per run of
+    constant cadence, where n is the first frame of the run, pattern is
+    None for progressive frames, and offset is the 'pulldownoffset' that a
+    zone starting at n needs. Additional keyword arguments are passed to
+    'evidence'.
+    """
+    E = evidence(M, **kwargs)
+    hypotheses = [(None, 0)]
+
+    for pattern in patterns:
+        cadence = Cadence(pattern)
+
+        for phase in range(len(cadence)):
+            hypotheses.append((pattern, phase))
+
+    cadences = {pattern: Cadence(pattern) for pattern, phase in hypotheses}
+    C = numpy.array([
+        cadences[pattern].costs(E, (start + phase) % len(cadences[pattern]),
+                                weights)
+        for pattern, phase in hypotheses])
+
+    path = viterbi(C, switchcost)
+
+    if not len(path):
+        return []
+
+    runs = numpy.concatenate(([0], (numpy.diff(path) != 0).nonzero()[0] + 1))
+    results = []
+
+    for k in runs:
+        pattern, phase = hypotheses[path[k]]
+        n = start + int(k)
+        offset = (n + phase) % len(cadences[pattern]) if pattern else 0
+        results.append((n, pattern, offset))
+
+    return results
@@ -1,11 +1,13 @@
 from .. import zoned
-from ..base import BaseVideoFilter
+from ..base import BaseVideoFilter, gopChunks
 from ...base import BaseFilter
 from transcode.util import cached
-from itertools import count
+from itertools import count, accumulate, islice
 import numpy
 from collections import OrderedDict
-import scenedetect
+from .detector import ContentDetector, delta
+from transcode import parmap
+from concurrent.futures import ThreadPoolExecutor
 import threading
 
 
@@ -132,9 +134,12 @@ class Scene(zoned.Zone):
 
             return
 
-        K = self.parent.index(self.next)
-        cutoff = min(
-            [zone.start_pts_time for zone in self.parent[K:]]) - 1.001/240
+        K = self.next._index
+
+        if K is None:
+            K = self.parent.index(self.next)
+
+        cutoff = self.parent.zone_min_start_pts_times[K] - 1.001/240
         diff = self.start_pts_time - self.parent.prev.pts_time[self.prev_start]
 
         for k in count(self.prev_framecount, -1):
@@ -242,6 +247,16 @@ class Scenes(zoned.ZonedFilter):
         self._fixpts = bool(value)
         self.reset_cache()
 
+    def reset_zone_columns(self):
+        del self.zone_min_start_pts_times
+        super().reset_zone_columns()
+
+    @cached
+    def zone_min_start_pts_times(self):
+        """Least start_pts_time of each scene and the scenes after it."""
+        T = [zone.start_pts_time for zone in self.data]
+        return list(accumulate(reversed(T), min))[::-1]
+
     def reset_cache(self, start=0, end=None, reset_children=True):
         del self.prev_pts_time
         del self.src_pts_time
@@ -291,47 +306,30 @@ class Scenes(zoned.ZonedFilter):
         pass
 
     def analyze(self, start=0, end=None,
-                notify_iter=None, notify_complete=None):
-        t = AnalysisThread(self, start, end, notify_iter, notify_complete)
+                notify_iter=None, notify_complete=None, nworkers=None):
+        t = AnalysisThread(self, start, end, notify_iter, notify_complete,
+                           nworkers=nworkers)
         t.start()
         return t
 
     @BaseVideoFilter.pts_time.getter
     def pts_time(self):
         if self.fixpts:
-            A = [zone.pts_time for zone in self]
-
-            for a in A:
-                if (isinstance(a, numpy.ndarray) and a.size) or bool(a):
-                    return numpy.concatenate(A)
-
-            return numpy.zeros((0,))
+            return zoned.ZonedFilter.pts_time.fget(self)
 
         return self.prev.pts_time
 
     @BaseVideoFilter.indexMap.getter
     def indexMap(self):
         if self.fixpts:
-            A = [zone.indexMap for zone in self]
-
-            for a in A:
-                if (isinstance(a, numpy.ndarray) and a.size) or bool(a):
-                    return numpy.concatenate(A)
-
-            return numpy.zeros((0,), dtype=numpy.int0)
+            return zoned.ZonedFilter.indexMap.fget(self)
 
         return numpy.arange(self.prev.framecount)
 
     @BaseVideoFilter.reverseIndexMap.getter
     def reverseIndexMap(self):
         if self.fixpts:
-            A = [zone.reverseIndexMap for zone in self]
-
-            for a in A:
-                if (isinstance(a, numpy.ndarray) and a.size) or bool(a):
-                    return numpy.concatenate(A)
-
-            return numpy.zeros((0,), dtype=numpy.int0)
+            return zoned.ZonedFilter.reverseIndexMap.fget(self)
 
         return numpy.arange(self.prev.framecount)
 
@@ -356,8 +354,18 @@ class Scenes(zoned.ZonedFilter):
 
 
 class AnalysisThread(threading.Thread):
+    """
+    Computes scene metrics for frames [start, end) of scenes.prev and
+    stores them in scenes.stats. The range is split into GOP-aligned chunks
+    of at least 'minchunk' frames, each analyzed with its own reader and
+    detector on a pool of 'nworkers' threads. Chunks are stitched together
+    by recomputing the first delta of each chunk from the last frame of
+    the preceding one.
+    """
+
     def __init__(self, scenes, start, end,
-                 notify_iter=None, notify_complete=None):
+                 notify_iter=None, notify_complete=None, blocksize=32,
+                 nworkers=None, minchunk=240):
         self._start = start
 
         if end is None:
@@ -367,96 +375,140 @@ class AnalysisThread(threading.Thread):
             self._end = end
 
         self.scenes = scenes
-        self.frames = scenes.prev.iterFrames(start, end, whence="framenumber")
         self.n = 0
         self.notify_iter = notify_iter
         self.notify_complete = notify_complete
+        self.blocksize = blocksize
+        self.nworkers = nworkers or parmap.nthreads
+        self.minchunk = minchunk
         self.stopped = threading.Event()
+        self._lock = threading.Lock()
         threading.Thread.__init__(self)
 
-    def get(self, *args, **kwargs):
-        return 0.0
+    def interrupt(self):
+        self.stopped.set()
 
-    def read(self):
-        if self.stopped.isSet():
-            if callable(self.notify_iter):
-                self.notify_iter(-1)
+    def _prepareStats(self):
+        if self.scenes.stats is None:
+            self.scenes.stats = numpy.nan * \
+                numpy.zeros((self.scenes.source.framecount - 1, 4))
 
-            return (False, None)
+        H, W = self.scenes.stats.shape
 
-        try:
-            frame = next(self.frames)
+        if H < self.scenes.prev.framecount - 1 or W < 4:
+            newstats = numpy.nan * \
+                numpy.zeros((self.scenes.source.framecount - 1, 4))
+            newstats[:H, :W] = self.scenes.stats
+            self.scenes.stats = newstats
 
-        except StopIteration:
-            if callable(self.notify_iter):
-                self.notify_iter(-1)
+        """Source frames in range that do not reach prev are left as nan."""
+        if isinstance(self.scenes.prev, BaseFilter):
+            start = self.scenes.prev.cumulativeIndexReverseMap[
+                self._start + 1]
 
-            return (False, None)
+        else:
+            start = self._start
 
-        # pts = frame.pts
-        # m, ms = divmod(pts, 60000)
-        # s = ms/1000
-        # h, m = divmod(m, 60)
+        if (self._end >= self.scenes.prev.framecount
+                or not isinstance(self.scenes.prev, BaseFilter)):
+            end = self.scenes.source.framecount
 
-        if frame.format.name != "rgb24":
-            frame = frame.to_rgb()
+        else:
+            end = self.scenes.prev.cumulativeIndexReverseMap[self._end]
 
-        if callable(self.notify_iter):
-            self.notify_iter(self.n)
+        self.scenes.stats[max(start - 1, 0):end - 1] = numpy.nan
 
-        self.n += 1
-        return (True, frame.to_ndarray())
+    def _storeStats(self, n, M):
+        """Writes metrics M of prev frames n, n + 1, ... into stats."""
+        N = numpy.arange(n, n + len(M))
 
-    def interrupt(self):
-        self.stopped.set()
+        if isinstance(self.scenes.prev, BaseFilter):
+            N = self.scenes.prev.cumulativeIndexReverseMap[N]
 
-    def run(self):
-        try:
-            stats = scenedetect.stats_manager.StatsManager()
-            scenemgr = scenedetect.SceneManager(stats)
-            scenemgr.add_detector(scenedetect.ContentDetector())
-            scenemgr.detect_scenes(frame_source=self)
+        filter = N > 0
+        self.scenes.stats[N[filter] - 1] = M[filter]
 
-            if self.scenes.stats is None:
-                self.scenes.stats = numpy.nan * \
-                    numpy.zeros((self.scenes.source.framecount - 1, 4))
+    def _progress(self, count):
+        with self._lock:
+            self.n += count
+            n = self.n
 
-            H, W = self.scenes.stats.shape
+        if callable(self.notify_iter):
+            self.notify_iter(n - 1)
+
+    def _analyzeChunk(self, chunk):
+        """
+        Analyzes frames [a, b), storing all but the first delta. Returns
+        the HSV images of the first and last frames.
+        """
+        a, b = chunk
+        detector = ContentDetector(self.blocksize)
+        frames = self.scenes.prev.iterFrames(a, b, whence="framenumber")
+        n = a
 
-            if H < self.scenes.prev.framecount - 1 or W < 4:
-                newstats = numpy.nan * \
-                    numpy.zeros((self.scenes.source.framecount - 1, 4))
-                newstats[:H, :W] = self.scenes.stats
-                self.scenes.stats = newstats
+        try:
+            for M in detector.iterBlocks(islice(frames, b - a)):
+                self._storeStats(n, M)
+                n += len(M)
+                self._progress(len(M))
+
+                if self.stopped.is_set():
+                    break
 
-            if isinstance(self.scenes.prev, BaseFilter):
-                start = self.scenes.prev.cumulativeIndexReverseMap[
-                    self._start + 1]
+        finally:
+            if hasattr(frames, "close"):
+                frames.close()
+
+        return detector.first, detector.last
+
+    def analyzeFrames(self, iterable):
+        """
+        Analyzes 'iterable', which must be frames [start, end) of
+        scenes.prev, on the calling thread. Used when frames are decoded
+        elsewhere (see transcode.filters.analysis).
+        """
+        self._prepareStats()
+        detector = ContentDetector(self.blocksize)
+        n = self._start
+
+        for M in detector.iterBlocks(iterable):
+            self._storeStats(n, M)
+            n += len(M)
+            self._progress(len(M))
+
+            if self.stopped.is_set():
+                break
 
-            else:
-                start = self._start
+        if callable(self.notify_complete):
+            self.notify_complete()
 
-            if (self._end >= self.scenes.prev.framecount
-                    or not isinstance(self.scenes.prev, BaseFilter)):
-                end = self.scenes.source.framecount
+    def run(self):
+        try:
+            self._prepareStats()
+            chunks = gopChunks(self.scenes.prev, self._start, self._end,
+                               self.minchunk)
+            last = None
 
-            else:
-                end = self.scenes.prev.cumulativeIndexReverseMap[self._end]
+            with ThreadPoolExecutor(
+                    self.nworkers, thread_name_prefix="SceneWorker") as pool:
+                results = parmap.imap(self._analyzeChunk, chunks,
+                                      maxinflight=self.nworkers,
+                                      executor=pool)
 
-            for m in range(start, end):
-                if isinstance(self.scenes.prev, BaseFilter):
-                    n = self.scenes.prev.cumulativeIndexMap[m]
+                for (a, b), (first, lastframe) in zip(chunks, results):
+                    if self.stopped.is_set():
+                        results.close()
+                        break
 
-                else:
-                    n = m
+                    if (a > self._start and last is not None
+                            and first is not None
+                            and first.shape == last.shape):
+                        self._storeStats(a, delta(first, last)[None])
 
-                if n > 0:
-                    self.scenes.stats[m-1] = stats.get_metrics(
-                        n - self._start, ["content_val", "delta_hue",
-                                          "delta_sat", "delta_lum"])
+                    last = lastframe
 
-                else:
-                    self.scenes.stats[m-1] = numpy.nan
+            if callable(self.notify_iter):
+                self.notify_iter(-1)
 
         finally:
             if callable(self.notify_complete):
@@ -0,0 +1,212 @@
+"""
+Native content detector for Scenes.
+
+Computes the same four metrics as PySceneDetect's ContentDetector (mean
+absolute frame-to-frame difference of the hue, saturation and value
+channels of an 8-bit OpenCV-style HSV image, and their average), but on
+YUV planes downscaled by swscale, with numpy, and on blocks of frames at a
+time.
+
+Columns of the returned metrics (and of Scenes.stats):
+CONTENT, DELTA_HUE, DELTA_SAT, DELTA_LUM.
+"""
+
+import numpy
+
+CONTENT, DELTA_HUE, DELTA_SAT, DELTA_LUM = range(4)
+
+
+def _tables():
+    """
+    Lookup tables for saturation, indexed by V << 8 | C, and for hue,
+    indexed by ((case*511 + d + 255) << 8) | C, where case is 0, 1 or 2
+    if R, G or B is the maximum, and d is G - B, B - R or R - G
+    respectively. Hue is in units of 2 degrees, as in OpenCV.
+    """
+    V = numpy.arange(256)[:, None]
+    C = numpy.arange(256)[None]
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        S = numpy.where(V > 0, numpy.rint(255*C/V), 0).clip(0, 255)
+
+        D = numpy.arange(-255, 256)[None, :, None]
+        case = numpy.arange(3)[:, None, None]
+        H = numpy.where(C > 0, numpy.rint(60*case + 30*D/C) % 180, 0)
+
+    return (numpy.int16(S).ravel(), numpy.int16(H).ravel())
+
+
+_stable, _htable = _tables()
+
+
+def hsv(R, G, B, out=None):
+    """
+    Converts int16 arrays R, G, B (values in [0, 255]) into an int16 array
+    of shape (3,) + R.shape holding 8-bit OpenCV-style HSV.
+    """
+    if out is None:
+        out = numpy.empty((3,) + R.shape, dtype=numpy.int16)
+
+    H, S, V = out
+    numpy.maximum(R, G, out=V)
+    numpy.maximum(V, B, out=V)
+    C = numpy.minimum(R, G)
+    numpy.minimum(C, B, out=C)
+    numpy.subtract(V, C, out=C)
+
+    index = V.astype(numpy.intp)
+    index <<= 8
+    index |= C
+    _stable.take(index, out=S)
+
+    rmax = V == R
+    gmax = (V == G) & ~rmax
+    index[...] = numpy.where(rmax, G - B,
+                             numpy.where(gmax, B - R + 511, R - G + 1022))
+    index += 255
+    index <<= 8
+    index |= C
+    _htable.take(index, out=H)
+    return out
+
+
+def yuvToRGB(Y, U, V, out=None):
+    """
+    Limited-range BT.601 YUV -> RGB in fixed point, as done by swscale for
+    frame.to_rgb(). Returns an int16 array of shape (3,) + Y.shape.
+    """
+    if out is None:
+        out = numpy.empty((3,) + Y.shape, dtype=numpy.int16)
+
+    Y = Y.astype(numpy.int32)
+    Y -= 16
+    Y *= 298
+    Y += 128
+    U = U.astype(numpy.int32)
+    U -= 128
+    V = V.astype(numpy.int32)
+    V -= 128
+
+    R = V*409
+    R += Y
+    G = U*-100
+    G -= 208*V
+    G += Y
+    B = U*516
+    B += Y
+
+    for A, dest in zip((R, G, B), out):
+        A >>= 8
+        numpy.clip(A, 0, 255, out=dest, casting="unsafe")
+
+    return out
+
+
+def delta(HSV, prevHSV):
+    """Metrics of a frame with HSV image 'HSV' following 'prevHSV'."""
+    M = numpy.empty(4)
+    M[DELTA_HUE:] = numpy.abs(HSV - prevHSV).mean(axis=(1, 2))
+    M[CONTENT] = M[DELTA_HUE:].mean()
+    return M
+
+
+class ContentDetector(object):
+    """
+    Computes scene metrics for consecutive frames, 'blocksize' frames at a
+    time. Frames are downscaled by swscale to at most 'width' pixels wide
+    (area-averaged, in yuv444p) before analysis. The HSV images of the
+    first and last frames processed are kept, so that blocks can be fed
+    one after another, and so that independently analyzed runs of frames
+    can be stitched together (see 'delta').
+    """
+
+    def __init__(self, blocksize=32, width=480):
+        self.blocksize = blocksize
+        self.width = width
+        self.first = None
+        self.last = None
+        self._yuv = None
+
+    def reset(self, last=None):
+        self.first = None
+        self.last = last
+
+    def size(self, frame):
+        if frame.width <= self.width:
+            return (frame.width, frame.height)
+
+        return (self.width,
+                max(2, int(frame.height*self.width/frame.width + 1) & ~1))
+
+    def _buffer(self, count, w, h):
+        shape = (3, self.blocksize, h, w)
+
+        if self._yuv is None or self._yuv.shape != shape:
+            if self._yuv is not None:
+                """Frame size changed. Deltas would be meaningless."""
+                self.last = None
+
+            self._yuv = numpy.empty(shape, dtype=numpy.uint8)
+
+        return self._yuv[:, :count]
+
+    def hsv(self, frames):
+        """HSV images of 'frames', shape (3, len(frames), h, w)."""
+        YUV = None
+
+        for k, frame in enumerate(frames):
+            w, h = self.size(frame)
+
+            if YUV is None:
+                YUV = self._buffer(len(frames), w, h)
+
+            small = frame.reformat(width=w, height=h, format="yuv444p",
+                                   interpolation="AREA")
+
+            for plane, dest in zip(small.planes, YUV[:, k]):
+                A = numpy.frombuffer(plane, dtype=numpy.uint8)
+                dest[...] = A.reshape(-1, plane.line_size)[:h, :w]
+
+        RGB = yuvToRGB(*YUV)
+        return hsv(*RGB)
+
+    def process(self, frames):
+        """
+        Returns an array of shape (len(frames), 4) of metrics. The first row
+        is nan if no frame preceded 'frames'.
+        """
+        M = numpy.full((len(frames), 4), numpy.nan)
+
+        if not len(frames):
+            return M
+
+        HSV = self.hsv(frames)
+
+        for j, X in enumerate(HSV, DELTA_HUE):
+            D = numpy.abs(numpy.diff(X, axis=0))
+            M[1:, j] = D.mean(axis=(1, 2))
+
+        M[1:, CONTENT] = M[1:, DELTA_HUE:].mean(axis=1)
+
+        if self.last is not None:
+            M[0] = delta(HSV[:, 0], self.last)
+
+        if self.first is None:
+            self.first = HSV[:, 0].copy()
+
+        self.last = HSV[:, -1].copy()
+        return M
+
+    def iterBlocks(self, frames):
+        """Consumes 'frames' in blocks, yielding the metrics of each block."""
+        block = []
+
+        for frame in frames:
+            block.append(frame)
+
+            if len(block) >= self.blocksize:
+                yield self.process(block)
+                block = []
+
+        if block:
+            yield self.process(block)
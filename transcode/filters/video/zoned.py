@@ -1,7 +1,7 @@
 from .base import BaseVideoFilter
 from ...util import cached, llist, applyState
 import numpy
-from itertools import chain, islice, count
+from itertools import chain, islice, count, accumulate
 from copy import deepcopy
 from more_itertools import peekable
 
@@ -104,6 +104,7 @@ class Zone(object):
         if self.parent is not None:
             self.parent.zone_indices.remove(self._src_start)
             self.parent.zone_indices.add(value)
+            self.parent.reset_zone_columns()
 
         self._src_start = value
         del self.prev_start
@@ -125,6 +126,10 @@ class Zone(object):
         else:
             self.reset_cache_full(notify_parent=False)
 
+    def reset_framecache(self):
+        if self.parent is not None:
+            self.parent.reset_framecache()
+
     @property
     def src_end(self):
         if self.next is not None:
@@ -133,6 +138,17 @@ class Zone(object):
         elif self.parent is not None and self.parent.source is not None:
             return self.parent.source.framecount
 
+    @property
+    def _index(self):
+        """Position of this zone in its parent, or None if not there."""
+        if not isinstance(self.parent, ZonedFilter):
+            return
+
+        k = int(self.parent.zone_src_starts.searchsorted(self.src_start))
+
+        if k < len(self.parent) and self.parent.data[k] is self:
+            return k
+
     @property
     def src_framecount(self):
         return self.src_end - self.src_start
@@ -146,6 +162,11 @@ class Zone(object):
         if self.parent is None:
             return self.src_start
 
+        k = self._index
+
+        if k is not None:
+            return int(self.parent.zone_prev_starts[k])
+
         if (hasattr(self.parent.prev, "cumulativeIndexMap")
                 and self.parent.prev.cumulativeIndexMap is not None):
             if self.src_start >= len(self.parent.prev.cumulativeIndexMap):
@@ -178,6 +199,11 @@ class Zone(object):
 
     @property
     def dest_start(self):
+        k = self._index
+
+        if k is not None and k < len(self.parent.zone_dest_starts):
+            return int(self.parent.zone_dest_starts[k])
+
         ds = 0
         zone = self.prev
 
@@ -234,6 +260,11 @@ class Zone(object):
 
     @cached
     def start_pts_time(self):
+        k = self._index
+
+        if k is not None and k < len(self.parent.zone_start_pts_times):
+            return self.parent.zone_start_pts_times[k]
+
         start_ts = 0
         zone = self.prev
 
@@ -297,6 +328,9 @@ class Zone(object):
 class ZonedFilter(llist, BaseVideoFilter):
     zoneclass = None
 
+    """Set to True by subclasses whose zones neither drop nor add frames."""
+    identityIndexMap = False
+
     def __init__(self, zones=[], prev=None, next=None,
                  notify_input=None, notify_output=None):
         self.zone_indices = set()
@@ -353,9 +387,84 @@ class ZonedFilter(llist, BaseVideoFilter):
         if dictitems is not None:
             new.update(deepcopy(dictitems, memo))
 
+        if self.framecache is not None:
+            self.framecache.shared = True
+            new.framecache = self.framecache
+
         return new
 
+    def reset_zone_columns(self):
+        del self.zone_src_starts
+        del self.zone_prev_starts
+        del self.zone_dest_starts
+        del self.zone_start_pts_times
+
+    @cached
+    def zone_src_starts(self):
+        S = numpy.int0([zone._src_start for zone in self.data])
+
+        if len(S):
+            """See Zone.src_start."""
+            S[0] = 0
+
+        return S
+
+    @cached
+    def zone_prev_starts(self):
+        """
+        Index in self.prev of the first frame of each zone: the first frame
+        at or after src_start that was not dropped by filters before this
+        one.
+        """
+        S = self.zone_src_starts
+        M = getattr(self.prev, "cumulativeIndexMap", None)
+
+        if M is None:
+            return S
+
+        results = numpy.full(len(S), self.prev.framecount, dtype=numpy.int0)
+        valid = (M >= 0).nonzero()[0]
+        k = valid.searchsorted(S)
+        found = k < len(valid)
+        results[found] = M[valid[k[found]]]
+        return results
+
+    @cached
+    def zone_dest_starts(self):
+        """
+        Output frame index of the first frame of each zone, followed by the
+        end of the last zone. Stops at the first zone whose framecount is
+        not known.
+        """
+        starts = [0]
+
+        for zone in self.data:
+            if zone.framecount is None:
+                break
+
+            starts.append(starts[-1] + zone.framecount)
+
+        return numpy.int0(starts)
+
+    @cached
+    def zone_start_pts_times(self):
+        """
+        Sum of the durations of the zones before each zone. Stops at the
+        first zone whose duration is not known.
+        """
+        durations = []
+
+        for zone in self.data[:-1]:
+            if zone.duration is None:
+                break
+
+            durations.append(zone.duration)
+
+        return list(accumulate(durations, initial=0))
+
     def reset_cache(self, start=0, end=None, reset_children=True):
+        self.reset_zone_columns()
+
         if len(self) and reset_children:
             J, zone = self.zoneAt(start)
             j = zone.src_start
@@ -479,86 +588,49 @@ class ZonedFilter(llist, BaseVideoFilter):
             yield frame
 
     def zoneAt(self, n):
-        k = 0
-        K = len(self) - 1
-
-        if (self[k].src_start <= n
-                and (self[k].src_end is None or n < self[k].src_end)):
-            return k, self[k]
+        k = int(self.zone_src_starts.searchsorted(n, side="right")) - 1
 
-        if ((self[K].src_end is None
-             and self[K].src_start <= n)
-                or self[K].src_start <= n < self[K].src_end):
-            return K, self[K]
+        if k < 0:
+            raise IndexError
 
-        while k < K - 1:
-            j = (k + K)//2
+        zone = self[k]
 
-            if n < self[j].src_start:
-                K = j
-                continue
-
-            elif n >= self[j].src_end:
-                k = j
-                continue
-
-            else:
-                return j, self[j]
+        if zone.src_end is not None and n >= zone.src_end:
+            raise IndexError
 
-        raise IndexError
+        return k, zone
 
-    def zoneAtNew(self, m, k=0, K=None):
+    def _zoneAtColumn(self, m, starts, end, k=0, K=None):
+        """
+        Finds the zone containing m, given the starts of the zones (and the
+        end of the last one, if known) in 'starts', and the end of the last
+        zone in 'end' otherwise.
+        """
         if K is None:
             K = len(self) - 1
 
-        if self[k].dest_start <= m < self[k].dest_end:
-            return k, self[k]
-
-        if ((self[K].dest_end is None
-             and self[K].dest_start <= m)
-                or self[K].dest_start <= m < self[K].dest_end):
-            return K, self[K]
-
-        while k < K - 1:
-            j = (k + K)//2
-            if m < self[j].dest_start:
-                K = j
-                continue
-            elif m >= self[j].dest_end:
-                k = j
-                continue
-            else:
-                return j, self[j]
-
-        raise IndexError
-
-    def zoneAtPrev(self, m, k=0, K=None):
-        if K is None:
-            K = len(self) - 1
+        j = min(int(starts.searchsorted(m, side="right")) - 1, len(self) - 1)
 
-        if self[k].prev_start <= m < self[k].prev_end:
-            return k, self[k]
+        if j < max(k, 0) or j > K:
+            raise IndexError
 
-        if ((self[K].prev_end is None
-             and self[K].prev_start <= m)
-                or self[K].prev_start <= m < self[K].prev_end):
-            return K, self[K]
+        if j + 1 < len(starts):
+            end = starts[j + 1]
 
-        while k < K - 1:
-            j = (k + K)//2
+        elif j < len(self) - 1:
+            raise IndexError
 
-            if m < self[j].prev_start:
-                K = j
-                continue
+        if end is not None and m >= end:
+            raise IndexError
 
-            elif m >= self[j].prev_end:
-                k = j
-                continue
+        return j, self[j]
 
-            else:
-                return j, self[j]
+    def zoneAtNew(self, m, k=0, K=None):
+        return self._zoneAtColumn(m, self.zone_dest_starts, None, k, K)
 
-        raise IndexError
+    def zoneAtPrev(self, m, k=0, K=None):
+        end = self.prev.framecount if self.prev is not None else None
+        return self._zoneAtColumn(m, self.zone_prev_starts, end, k, K)
 
     def insertZoneAt(self, n, *args, **kwargs):
         kwargs["parent"] = self
@@ -601,17 +673,48 @@ class ZonedFilter(llist, BaseVideoFilter):
 
         return k+1, newzone
 
+    def _assemble(self, local, offsets, nonneg=False):
+        """
+        Concatenates the arrays named 'local' of all zones, each shifted by
+        the zone's entry in 'offsets' (only where nonnegative, if 'nonneg'
+        is set), as Zone.indexMap, Zone.reverseIndexMap and Zone.pts_time
+        do for a single zone.
+
+        Zones after an edit keep their local arrays (see reset_cache), so
+        only the edited zones are recomputed here, and the rest are just
+        shifted by their new offsets, in one vectorized step.
+        """
+        parts = [getattr(zone, local) for zone in self.data]
+
+        if not parts:
+            return numpy.zeros(0, dtype=numpy.int0)
+
+        A = numpy.concatenate(parts)
+        shift = numpy.repeat(offsets, [len(part) for part in parts])
+
+        if nonneg:
+            shift[A < 0] = 0
+
+        A += shift
+        return A
+
     @BaseVideoFilter.pts_time.getter
     def pts_time(self):
-        return numpy.concatenate([zone.pts_time for zone in self])
+        offsets = numpy.float64([zone.start_pts_time for zone in self.data])
+        return self._assemble("pts_time_local", offsets)
 
     @BaseVideoFilter.indexMap.getter
     def indexMap(self):
-        return numpy.concatenate([zone.indexMap for zone in self])
+        offsets = self.zone_dest_starts
+
+        if len(offsets) <= len(self):
+            return numpy.concatenate([zone.indexMap for zone in self])
+
+        return self._assemble("indexMapLocal", offsets[:-1], nonneg=True)
 
     @BaseVideoFilter.reverseIndexMap.getter
     def reverseIndexMap(self):
-        return numpy.concatenate([zone.reverseIndexMap for zone in self])
+        return self._assemble("reverseIndexMapLocal", self.zone_prev_starts)
 
     def removeZoneAt(self, n):
         k, zone = self.zoneAt(n)
@@ -637,18 +740,22 @@ class ZonedFilter(llist, BaseVideoFilter):
     def insert(self, index, zone):
         llist.insert(self, index, zone)
         self.zone_indices.add(zone.src_start)
+        self.reset_zone_columns()
 
     def append(self, zone):
         llist.append(self, zone)
         self.zone_indices.add(zone.src_start)
+        self.reset_zone_columns()
 
     def extend(self, zones):
         n = len(self)
         llist.extend(self, zones)
 
-        for zone in self[n:]:
+        for zone in self.data[n:]:
             self.zone_indices.add(zone.src_start)
 
+        self.reset_zone_columns()
+
     def __delitem__(self, index):
         zone = self[index]
 
@@ -656,6 +763,7 @@ class ZonedFilter(llist, BaseVideoFilter):
             self.zone_indices.remove(zone.src_start)
 
         llist.__delitem__(self, index)
+        self.reset_zone_columns()
 
     def remove(self, zone):
         llist.remove(self, zone)
@@ -663,9 +771,12 @@ class ZonedFilter(llist, BaseVideoFilter):
         if zone.src_start in self.zone_indices:
             self.zone_indices.remove(zone.src_start)
 
+        self.reset_zone_columns()
+
     def clear(self):
         self.zone_indices.clear()
         super().clear()
+        self.reset_zone_columns()
 
     @cached
     def framecount(self):
@@ -0,0 +1,311 @@
+"""
+Conversion of H.264 and HEVC Annex-B byte streams to the length-prefixed
+NAL units and avcC/hvcC records that Matroska stores.
+"""
+
+import numpy
+
+"""Packets at least this large are scanned with numpy."""
+numpyscan = 16384
+
+"""Codec of the streams written by each encoder."""
+encoders = {
+    "libx264": "h264",
+    "libx265": "hevc",
+}
+
+VPS = 32
+SPS = {"h264": 7, "hevc": 33}
+PPS = {"h264": 8, "hevc": 34}
+SEI = {"h264": 6, "hevc": 39}
+
+"""AVC profiles with chroma format and bit depths in avcC."""
+_highprofiles = {100, 110, 122, 144}
+
+"""AVC profiles with chroma format and bit depths in the SPS."""
+_chromaprofiles = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139,
+                   134, 135}
+
+
+def findNALs(data):
+    """
+    (start, end) offsets of the NAL units of Annex-B byte stream 'data'
+    (a bytes-like object), excluding start codes and trailing zeros.
+    """
+    view = memoryview(data).cast("B")
+
+    if len(view) >= numpyscan:
+        A = numpy.frombuffer(view, dtype=numpy.uint8)
+        K = numpy.flatnonzero(A[2:] == 1)
+        K = K[(A[K] == 0) & (A[K + 1] == 0)].tolist()
+
+    else:
+        if not isinstance(data, bytes):
+            data = view.tobytes()
+
+        view = data
+        K = []
+        k = data.find(b"\x00\x00\x01")
+
+        while k >= 0:
+            K.append(k)
+            k = data.find(b"\x00\x00\x01", k + 3)
+
+    nals = []
+
+    for start, end in zip(K, K[1:] + [len(view)]):
+        start += 3
+
+        while end > start and view[end - 1] == 0:
+            end -= 1
+
+        if end > start:
+            nals.append((start, end))
+
+    return nals
+
+
+def nalType(codec, header):
+    """Type of a NAL unit of 'codec' starting with byte 'header'."""
+    if codec == "hevc":
+        return header >> 1 & 0x3f
+
+    return header & 0x1f
+
+
+def isVCL(codec, naltype):
+    """Whether NAL units of type 'naltype' hold slice data."""
+    if codec == "hevc":
+        return naltype < 32
+
+    return 1 <= naltype <= 5
+
+
+def _unescape(data):
+    """Removes emulation prevention bytes."""
+    return data.replace(b"\x00\x00\x03", b"\x00\x00")
+
+
+class _Bits(object):
+    def __init__(self, data):
+        self.value = int.from_bytes(data, "big")
+        self.size = 8*len(data)
+        self.pos = 0
+
+    def read(self, n):
+        self.pos += n
+
+        if self.pos > self.size:
+            raise ValueError("Unexpected end of parameter set.")
+
+        return self.value >> (self.size - self.pos) & ((1 << n) - 1)
+
+    def readUE(self):
+        zeros = 0
+
+        while not self.read(1):
+            zeros += 1
+
+        return (1 << zeros) - 1 + self.read(zeros)
+
+
+def parseHEVCSPS(sps):
+    """Fields of HEVC sequence parameter set 'sps' needed for hvcC."""
+    bits = _Bits(_unescape(sps[2:]))
+    bits.read(4)
+    maxsublayers = bits.read(3)
+    fields = dict(temporalIdNested=bits.read(1),
+                  numTemporalLayers=maxsublayers + 1,
+                  profile=bits.read(8), compatibility=bits.read(32),
+                  constraints=bits.read(48), level=bits.read(8))
+    present = [(bits.read(1), bits.read(1)) for k in range(maxsublayers)]
+
+    if maxsublayers:
+        bits.read(2*(8 - maxsublayers))
+
+    for profile, level in present:
+        bits.read(88*profile + 8*level)
+
+    bits.readUE()
+    fields["chromaFormat"] = chroma = bits.readUE()
+
+    if chroma == 3:
+        bits.read(1)
+
+    bits.readUE()
+    bits.readUE()
+
+    if bits.read(1):
+        for k in range(4):
+            bits.readUE()
+
+    fields["bitDepthLumaMinus8"] = bits.readUE()
+    fields["bitDepthChromaMinus8"] = bits.readUE()
+    return fields
+
+
+def parseAVCSPS(sps):
+    """Fields of H.264 sequence parameter set 'sps' needed for avcC."""
+    bits = _Bits(_unescape(sps[1:]))
+    fields = dict(profile=bits.read(8), compatibility=bits.read(8),
+                  level=bits.read(8), chromaFormat=1,
+                  bitDepthLumaMinus8=0, bitDepthChromaMinus8=0)
+    bits.readUE()
+
+    if fields["profile"] in _chromaprofiles:
+        fields["chromaFormat"] = chroma = bits.readUE()
+
+        if chroma == 3:
+            bits.read(1)
+
+        fields["bitDepthLumaMinus8"] = bits.readUE()
+        fields["bitDepthChromaMinus8"] = bits.readUE()
+
+    return fields
+
+
+def hvcC(vps, sps, pps, sei=[]):
+    """
+    HEVC decoder configuration record holding NAL units 'vps', 'sps',
+    'pps' and 'sei' (lists of bytes), with 4-byte NAL unit lengths.
+    """
+    fields = parseHEVCSPS(sps[0])
+    data = bytearray(b"\x01")
+    data += fields["profile"].to_bytes(1, "big")
+    data += fields["compatibility"].to_bytes(4, "big")
+    data += fields["constraints"].to_bytes(6, "big")
+    data += fields["level"].to_bytes(1, "big")
+    data += (0xf000).to_bytes(2, "big")
+    data += (0xfc).to_bytes(1, "big")
+    data += (0xfc | fields["chromaFormat"]).to_bytes(1, "big")
+    data += (0xf8 | fields["bitDepthLumaMinus8"]).to_bytes(1, "big")
+    data += (0xf8 | fields["bitDepthChromaMinus8"]).to_bytes(1, "big")
+    data += (0).to_bytes(2, "big")
+    data += (fields["numTemporalLayers"] << 3
+             | fields["temporalIdNested"] << 2 | 3).to_bytes(1, "big")
+
+    """
+    Arrays are not marked complete, as parameter sets that differ from
+    these are left in packets (see AnnexB).
+    """
+    arrays = [(VPS, vps), (SPS["hevc"], sps), (PPS["hevc"], pps),
+              (SEI["hevc"], sei)]
+    arrays = [array for array in arrays if array[1]]
+    data += len(arrays).to_bytes(1, "big")
+
+    for naltype, nals in arrays:
+        data += naltype.to_bytes(1, "big")
+        data += len(nals).to_bytes(2, "big")
+
+        for nal in nals:
+            data += len(nal).to_bytes(2, "big")
+            data += nal
+
+    return bytes(data)
+
+
+def avcC(sps, pps):
+    """
+    H.264 decoder configuration record holding NAL units 'sps' and 'pps'
+    (lists of bytes), with 4-byte NAL unit lengths.
+    """
+    fields = parseAVCSPS(sps[0])
+    data = bytearray(b"\x01")
+    data += bytes(sps[0][1:4])
+    data += (0xff).to_bytes(1, "big")
+    data += (0xe0 | len(sps)).to_bytes(1, "big")
+
+    for nal in sps:
+        data += len(nal).to_bytes(2, "big")
+        data += nal
+
+    data += len(pps).to_bytes(1, "big")
+
+    for nal in pps:
+        data += len(nal).to_bytes(2, "big")
+        data += nal
+
+    if fields["profile"] in _highprofiles:
+        data += (0xfc | fields["chromaFormat"]).to_bytes(1, "big")
+        data += (0xf8 | fields["bitDepthLumaMinus8"]).to_bytes(1, "big")
+        data += (0xf8 | fields["bitDepthChromaMinus8"]).to_bytes(1, "big")
+        data += b"\x00"
+
+    return bytes(data)
+
+
+class AnnexB(object):
+    """
+    Converts the Annex-B packets of an H.264 or HEVC stream ('codec') to
+    length-prefixed NAL units. See 'configure'.
+    """
+
+    def __init__(self, codec):
+        self.codec = encoders.get(codec, codec)
+        self.extradata = None
+        self._outofband = set()
+        self._moved = set()
+
+    def configure(self, data):
+        """
+        Builds the decoder configuration record ('extradata') from the
+        parameter sets (and, for HEVC, SEI) preceding the first slice of
+        packet 'data'. These NAL units are then dropped from any packet
+        repeating them.
+        """
+        codec = self.codec
+        view = memoryview(data).cast("B")
+        nals = {}
+
+        for start, end in findNALs(view):
+            naltype = nalType(codec, view[start])
+
+            if isVCL(codec, naltype):
+                break
+
+            nals.setdefault(naltype, []).append(view[start:end].tobytes())
+
+        sps = nals.get(SPS[codec], [])
+        pps = nals.get(PPS[codec], [])
+
+        if not sps or not pps:
+            raise ValueError("No parameter sets found in first packet.")
+
+        if codec == "hevc":
+            vps = nals.get(VPS, [])
+            sei = nals.get(SEI[codec], [])
+            self.extradata = hvcC(vps, sps, pps, sei)
+            self._outofband = {VPS, SPS[codec], PPS[codec], SEI[codec]}
+            self._moved = set(vps + sps + pps + sei)
+
+        else:
+            self.extradata = avcC(sps, pps)
+            self._outofband = {SPS[codec], PPS[codec]}
+            self._moved = set(sps + pps)
+
+        return self.extradata
+
+    def convert(self, data):
+        """Length-prefixed NAL units of Annex-B packet 'data'."""
+        view = memoryview(data).cast("B")
+        nals = findNALs(view)
+
+        if self._moved:
+            codec = self.codec
+            outofband = self._outofband
+            moved = self._moved
+            nals = [(start, end) for (start, end) in nals
+                    if nalType(codec, view[start]) not in outofband
+                    or view[start:end].tobytes() not in moved]
+
+        out = bytearray(sum(end - start for (start, end) in nals)
+                        + 4*len(nals))
+        k = 0
+
+        for start, end in nals:
+            n = end - start
+            out[k:k + 4] = n.to_bytes(4, "big")
+            out[k + 4:k + 4 + n] = view[start:end]
+            k += 4 + n
+
+        return out
@@ -1,6 +1,10 @@
 import ciqueue
 import threading
 import psutil
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .util import ClosingIterator
 
 
 class ThreadPool(object):
@@ -27,10 +31,13 @@ class ThreadPool(object):
                 y = f(*x)
 
             except Exception as exc:
-                q.put((f, x, None, exc))
+                y = None
+
+            else:
+                exc = None
 
             try:
-                q.put((f, x, y, None))
+                q.put((f, x, y, exc))
 
             except (ciqueue.Closed, ciqueue.Interrupted):
                 pass
@@ -53,6 +60,7 @@ class map(object):
         self._threadPool = threadpool
         self._queueOfQueues = ciqueue.Queue()
         self._isdead = False
+        self._exception = None
 
         for k in range(self._threadPool.threadCount + 2):
             self._queueOfQueues.put(ciqueue.Queue())
@@ -80,6 +88,10 @@ class map(object):
                 except ciqueue.Closed:
                     return
 
+        except BaseException as exc:
+            """Raised to the consumer once results before it are read."""
+            self._exception = exc
+
         finally:
             self._resultsQueue.close()
 
@@ -89,8 +101,7 @@ class map(object):
         self._queueOfQueues.interrupt()
 
     def __iter__(self):
-        while True:
-            yield next(self)
+        return self
 
     def __next__(self):
         if self._isdead:
@@ -101,6 +112,10 @@ class map(object):
 
         except ciqueue.Closed:
             self.stop()
+
+            if self._exception is not None:
+                raise self._exception
+
             raise StopIteration
 
         try:
@@ -116,3 +131,50 @@ class map(object):
 
         self._queueOfQueues.put(q)
         return y
+
+
+nthreads = psutil.cpu_count()
+mainexecutor = ThreadPoolExecutor(nthreads, thread_name_prefix="FrameWorker")
+
+
+def imap(f, iterable, maxinflight=None, executor=mainexecutor):
+    """
+    Ordered parallel map. Items are read from 'iterable' on the calling
+    thread, f(item) is evaluated on 'executor', and results are yielded in
+    the same order as the input. At most 'maxinflight' items (default:
+    nthreads + 2) are pending at any time.
+
+    An exception raised by f is re-raised at the position of the offending
+    item. If the iterator is closed early (or an exception is raised),
+    pending work is cancelled, running work is waited on, and 'iterable'
+    is closed.
+    """
+    if maxinflight is None:
+        maxinflight = nthreads + 2
+
+    iterator = iter(iterable)
+    return ClosingIterator(_imap(f, iterator, maxinflight, executor),
+                           iterator)
+
+
+def _imap(f, iterator, maxinflight, executor):
+    pending = collections.deque()
+
+    try:
+        for item in iterator:
+            pending.append(executor.submit(f, item))
+
+            if len(pending) >= maxinflight:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    finally:
+        for future in pending:
+            future.cancel()
+
+        wait(pending)
+
+        if hasattr(iterator, "close"):
+            iterator.close()
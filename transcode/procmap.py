@@ -0,0 +1,276 @@
+"""
+Process-pool backend for stateless filters.
+
+Each worker process reconstructs the filter once from its __getstate__
+(with 'source'/'prev' stripped, so that readers and upstream filters are not
+dragged along). Frame data travels through a multiprocessing.shared_memory
+ring buffer rather than being pickled; only a small descriptor (format,
+shape, pts, ...) is sent through the pool's pipes.
+
+Each slot of the ring consists of an input half and an output half, so that
+if a worker dies mid-frame, the input is still intact and the frame can be
+resubmitted to a freshly started pool.
+"""
+
+import collections
+import pickle
+
+import numpy
+from av import AudioFrame, VideoFrame
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from .avarrays import toNDArray, toAFrame
+from .util import ClosingIterator
+
+maxrestarts = 3
+defaultmemlimit = 512*1024**2
+
+_worker = {}
+
+
+def _reduceFilter(filter):
+    cls, args, state, *more = filter.__reduce__()
+
+    if more and any(item is not None for item in more):
+        raise TypeError(
+            f"{cls.__name__} filter cannot be sent to a worker process.")
+
+    if state is not None:
+        state = state.copy()
+        state.pop("source", None)
+        state.pop("prev", None)
+
+    return pickle.dumps((cls, args, state))
+
+
+def _initWorker(reduced, shmname):
+    cls, args, state = pickle.loads(reduced)
+    filter = cls(*args)
+
+    if state is not None:
+        filter.__setstate__(state)
+
+    _worker["shm"] = shared_memory.SharedMemory(shmname)
+    _worker["filter"] = filter
+
+
+def _pack(frame, buf, offset, size):
+    """
+    Write frame data into buf[offset:offset + size] if it fits. Returns
+    (meta, shape, dtype, data), where data is None if the frame was written
+    to shared memory, or the array itself otherwise.
+    """
+    if isinstance(frame, VideoFrame):
+        A = frame.to_ndarray()
+        meta = ("video", frame.format.name, frame.pts, frame.time_base,
+                getattr(frame.pict_type, "name", frame.pict_type))
+
+    elif isinstance(frame, AudioFrame):
+        A = toNDArray(frame)
+        meta = ("audio", frame.layout.name, frame.pts, frame.time_base,
+                frame.rate)
+
+    else:
+        raise TypeError(
+            "Expected AudioFrame or VideoFrame, got"
+            f" {frame.__class__.__name__} instead.")
+
+    A = numpy.ascontiguousarray(A)
+
+    if buf is not None and A.nbytes <= size:
+        dest = numpy.ndarray(A.shape, dtype=A.dtype, buffer=buf,
+                             offset=offset)
+        dest[...] = A
+        return meta, A.shape, A.dtype.str, None
+
+    return meta, A.shape, A.dtype.str, A
+
+
+def _unpack(meta, shape, dtype, data, buf, offset):
+    if data is None:
+        data = numpy.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+
+    kind, fmt, pts, time_base, extra = meta
+
+    if kind == "video":
+        frame = VideoFrame.from_ndarray(data, fmt)
+
+        if extra is not None:
+            frame.pict_type = extra
+
+    else:
+        frame = toAFrame(data, layout=fmt)
+        frame.rate = extra
+
+    frame.pts = pts
+    frame.time_base = time_base
+    return frame
+
+
+def _work(method, offset, size, packed):
+    buf = _worker["shm"].buf
+    frame = _unpack(*packed, buf, offset)
+    newframe = getattr(_worker["filter"], method)(frame)
+    return _pack(newframe, buf, offset + size, size)
+
+
+class ProcessPool(object):
+    """
+    Pool of worker processes, each holding its own copy of 'filter', and a
+    shared memory segment of 'nslots' slots, 2*'slotsize' bytes each.
+    """
+
+    def __init__(self, filter, nslots, slotsize, nworkers=None,
+                 mp_context=None):
+        self.nslots = nslots
+        self.slotsize = slotsize
+        self.nworkers = nworkers
+        self.mp_context = mp_context
+        self.restarts = 0
+        self._reduced = _reduceFilter(filter)
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=max(1, 2*nslots*slotsize))
+        self._executor = None
+        self._start()
+
+    def _start(self):
+        try:
+            self._executor = ProcessPoolExecutor(
+                self.nworkers, mp_context=self.mp_context,
+                initializer=_initWorker,
+                initargs=(self._reduced, self._shm.name))
+
+        except BaseException:
+            """Do not leave the shared memory segment behind."""
+            self.close()
+            raise
+
+    def restart(self):
+        self.restarts += 1
+
+        if self.restarts > maxrestarts:
+            self.close()
+            raise BrokenProcessPool(
+                f"Worker pool crashed {self.restarts} times. Giving up.")
+
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._start()
+
+    @property
+    def buf(self):
+        return self._shm.buf
+
+    def offset(self, slot):
+        return 2*slot*self.slotsize
+
+    def pack(self, frame, slot):
+        return _pack(frame, self.buf, self.offset(slot), self.slotsize)
+
+    def unpack(self, packed, slot):
+        return _unpack(*packed, self.buf, self.offset(slot) + self.slotsize)
+
+    def submit(self, method, slot, packed):
+        return self._executor.submit(
+            _work, method, self.offset(slot), self.slotsize, packed)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def imap(filter, iterable, method="_processFrame", maxinflight=None,
+         memlimit=defaultmemlimit, nworkers=None, mp_context=None):
+    """
+    Ordered parallel map of getattr(filter, method) over 'iterable' using
+    worker processes. The size of a slot is taken from the first frame.
+    The number of frames in flight is bounded by both 'maxinflight'
+    (default: number of workers + 2) and 'memlimit' (in bytes).
+
+    Frames that do not fit in a slot (e.g., output of an upscaling filter)
+    are pickled instead. If a worker crashes, the pool is restarted and
+    pending frames are resubmitted, at most 'maxrestarts' times.
+    """
+    iterator = iter(iterable)
+    return ClosingIterator(
+        _imap(filter, iterator, method, maxinflight, memlimit, nworkers,
+              mp_context), iterator)
+
+
+def _imap(filter, iterator, method, maxinflight, memlimit, nworkers,
+          mp_context):
+    pool = None
+
+    try:
+        try:
+            first = next(iterator)
+
+        except StopIteration:
+            return
+
+        if nworkers is None:
+            import psutil
+            nworkers = psutil.cpu_count()
+
+        if maxinflight is None:
+            maxinflight = nworkers + 2
+
+        slotsize = _pack(first, None, 0, 0)[3].nbytes
+        nslots = max(1, min(maxinflight, memlimit//(2*slotsize)))
+
+        pool = ProcessPool(filter, nslots, slotsize, nworkers, mp_context)
+        free = collections.deque(range(nslots))
+        pending = collections.deque()
+
+        def submit(frame):
+            slot = free.popleft()
+            packed = pool.pack(frame, slot)
+            pending.append([slot, packed, pool.submit(method, slot, packed)])
+
+        def resubmit():
+            pool.restart()
+
+            for item in pending:
+                slot, packed, future = item
+                item[2] = pool.submit(method, slot, packed)
+
+        def result():
+            while True:
+                try:
+                    packed = pending[0][2].result()
+
+                except BrokenProcessPool:
+                    resubmit()
+                    continue
+
+                slot, *_ = pending.popleft()
+                frame = pool.unpack(packed, slot)
+                free.append(slot)
+                return frame
+
+        submit(first)
+        del first
+
+        for frame in iterator:
+            if not free:
+                yield result()
+
+            submit(frame)
+
+        while pending:
+            yield result()
+
+    finally:
+        if pool is not None:
+            pool.close()
+
+        if hasattr(iterator, "close"):
+            iterator.close()
@@ -195,6 +195,11 @@ class QFilterConfig(QDialog):
             if dictitems is not None:
                 self.filter.extend(dictitems)
 
+            """
+            Not every __setstate__ reaches BaseFilter.__setstate__, which
+            drops stale preview frames.
+            """
+            self.filter.reset_framecache()
             self.settingsApplied.emit()
 
         self.notModified()
@@ -8,6 +8,7 @@ from PyQt5.QtWidgets import (QAction, QMenu, QSizePolicy, QWidget,
 # from fractions import Fraction as QQ
 import sys
 import traceback
+from ..filters import framecache
 from ass.line import Dialogue
 
 
@@ -322,10 +323,10 @@ class QMultiImageView(QWidget):
 
             try:
                 for k, frame in enumerate(
-                        self.framesource.iterFrames(
+                        framecache.iterFrames(
+                            self.framesource,
                             n - 2 + len(frames),
-                            n + 3,
-                            whence="framenumber"
+                            n + 3
                         ),
                         n - 2 + len(frames)):
                     frames.append(frame.to_image().convert("RGBA").toqpixmap())
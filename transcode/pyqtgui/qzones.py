@@ -11,6 +11,7 @@ from .qimageview import QImageView
 from .qfilterconfig import QFilterConfig
 from ..filters.video.zoned import Zone
 from ..filters.base import BaseFilter
+from ..filters import framecache
 
 from av import VideoFrame
 
@@ -423,8 +424,7 @@ class ZoneDlg(QFilterConfig):
             n = self.slider.slider.value()
 
         if self._mode == 0:
-            frame = next(self.filtercopy.source.iterFrames(
-                n, whence="framenumber"))
+            frame = next(framecache.iterFrames(self.filtercopy.source, n))
 
             if n > self.zonecopy.src_start:
                 self.toggleZoneBtn.setText(f"&Insert {self.zonename} Here")
@@ -433,8 +433,7 @@ class ZoneDlg(QFilterConfig):
                 self.toggleZoneBtn.setText(f"&Remove {self.zonename} Here")
 
         elif self._mode == 1:
-            frame = next(self.filtercopy.prev.iterFrames(
-                n, whence="framenumber"))
+            frame = next(framecache.iterFrames(self.filtercopy.prev, n))
 
             if n > self.zone.prev_start:
                 self.toggleZoneBtn.setText(f"&Insert {self.zonename} Here")
@@ -468,6 +467,7 @@ class ZoneDlg(QFilterConfig):
     @pyqtSlot()
     def applyZone(self):
         self.zone.__setstate__(self.zonecopy.__getstate__())
+        self.zone.reset_framecache()
         self.zoneNotModified()
         self.isModified()
 
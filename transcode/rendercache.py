@@ -0,0 +1,346 @@
+"""
+Lossless on-disk cache of rendered video, read back by later passes of a
+multipass encode instead of decoding and filtering again.
+"""
+
+import hashlib
+import os
+from fractions import Fraction as QQ
+from itertools import chain
+
+import numpy
+from av import VideoFrame
+
+from .containers.basereader import Track as InputTrack
+
+"""Cache directory. Nothing is cached while None."""
+directory = None
+
+"""Disk usage limit, kept by deleting least recently used renders."""
+maxbytes = 100*1024**3
+
+"""Set for passes that no later pass reads from: renders are not written."""
+readonly = False
+
+"""Keys of the renders written or read by this process."""
+used = set()
+
+
+def _update(h, obj, memo):
+    """Feeds a canonical description of 'obj' to hash 'h'."""
+    if obj is None or isinstance(obj, (bool, int, float, complex, str)):
+        h.update(repr(obj).encode("utf8"))
+        return
+
+    if isinstance(obj, bytes):
+        h.update(obj)
+        return
+
+    if id(obj) in memo:
+        h.update(f"<ref {memo[id(obj)][0]}>".encode("utf8"))
+        return
+
+    """Keep 'obj' alive, so that its id is not reused during the walk."""
+    memo[id(obj)] = (len(memo), obj)
+
+    if isinstance(obj, numpy.ndarray):
+        h.update(f"{obj.dtype.str}{obj.shape}".encode("utf8"))
+        h.update(numpy.ascontiguousarray(obj).tobytes())
+
+    elif isinstance(obj, InputTrack):
+        path = obj.container.inputpath
+        stat = os.stat(path)
+        h.update(repr((os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+                       obj.track_index)).encode("utf8"))
+
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}[{len(obj)}]".encode("utf8"))
+
+        for item in obj:
+            _update(h, item, memo)
+
+    elif isinstance(obj, dict):
+        h.update(f"{type(obj).__name__}{{{len(obj)}}}".encode("utf8"))
+
+        for key, value in obj.items():
+            _update(h, key, memo)
+            _update(h, value, memo)
+
+    else:
+        cls, args, *more = obj.__reduce_ex__(2)
+        h.update(f"{cls.__module__}.{cls.__qualname__}".encode("utf8"))
+        _update(h, args, memo)
+
+        for item in more:
+            if isinstance(item, dict):
+                _update(h, item, memo)
+
+            elif item is not None and not isinstance(item, (list, tuple)):
+                _update(h, list(item), memo)
+
+            else:
+                _update(h, item, memo)
+
+
+def digest(*objs):
+    """
+    Hash of the state of 'objs' (filters, input tracks, ...). Returns None
+    if it cannot be computed.
+    """
+    h = hashlib.sha256()
+
+    try:
+        _update(h, objs, {})
+
+    except (TypeError, AttributeError, OSError):
+        return None
+
+    return h.hexdigest()
+
+
+def key(filters, end=None):
+    """
+    Cache key of the frames of filter chain 'filters' before pts 'end'.
+    Returns None if the chain's state cannot be hashed.
+    """
+    return digest(filters.prev, filters, end)
+
+
+def _paths(key):
+    return (os.path.join(directory, f"{key}.frames"),
+            os.path.join(directory, f"{key}.index.npz"))
+
+
+def _entries():
+    """Complete cache files as a list of (atime, key, nbytes)."""
+    entries = []
+
+    for name in os.listdir(directory):
+        if not name.endswith(".frames"):
+            continue
+
+        key = name[:-len(".frames")]
+
+        try:
+            nbytes = sum(os.stat(path).st_size for path in _paths(key))
+            atime = os.stat(_paths(key)[0]).st_mtime
+
+        except FileNotFoundError:
+            continue
+
+        entries.append((atime, key, nbytes))
+
+    return sorted(entries)
+
+
+def remove(key):
+    for path in _paths(key) + (_paths(key)[0] + ".part",):
+        try:
+            os.remove(path)
+
+        except FileNotFoundError:
+            pass
+
+    used.discard(key)
+
+
+def cleanup(reserve=0, logfile=None):
+    """
+    Deletes partial files, and least recently used renders until 'reserve'
+    more bytes fit within 'maxbytes'. Returns False if they would not fit
+    even with the directory emptied.
+    """
+    if reserve > maxbytes:
+        return False
+
+    for name in os.listdir(directory):
+        if name.endswith(".part") and name[:-len(".frames.part")] not in used:
+            os.remove(os.path.join(directory, name))
+
+    entries = _entries()
+    total = sum(nbytes for atime, key, nbytes in entries)
+
+    for atime, key, nbytes in entries:
+        if total + reserve <= maxbytes:
+            break
+
+        if key in used:
+            continue
+
+        print(f"    Render cache: removing {key[:16]} "
+              f"({nbytes/1024**3:,.2f} GiB).", file=logfile)
+        remove(key)
+        total -= nbytes
+
+    return total + reserve <= maxbytes
+
+
+def _geometry(frame):
+    return (frame.format.name, frame.width, frame.height,
+            tuple((plane.line_size, plane.buffer_size)
+                  for plane in frame.planes))
+
+
+def _write(key, frames, count, logfile=None):
+    """
+    Passes 'frames' through, writing them to the cache as they go by. The
+    render is committed only once 'frames' is exhausted.
+    """
+    datapath, indexpath = _paths(key)
+    partpath = datapath + ".part"
+    frames = iter(frames)
+    used.add(key)
+    f = None
+
+    try:
+        try:
+            first = next(frames)
+
+        except StopIteration:
+            return
+
+        geometry = _geometry(first)
+        framebytes = sum(nbytes for (linesize, nbytes) in geometry[3])
+
+        if not cleanup(count*framebytes, logfile):
+            print(f"    Render cache: {count*framebytes/1024**3:,.2f} GiB "
+                  "needed, more than the cache allows. Not caching.",
+                  file=logfile)
+            yield first
+            yield from frames
+            return
+
+        print(f"    Render cache: writing {key[:16]} "
+              f"({count*framebytes/1024**3:,.2f} GiB).", file=logfile)
+        pts = []
+        pict_types = []
+        time_base = first.time_base
+        f = open(partpath, "wb")
+
+        for frame in chain([first], frames):
+            if f is not None and (
+                    _geometry(frame) != geometry or len(pts) >= count
+                    or frame.time_base != time_base):
+                print("    Render cache: frames do not match estimate. "
+                      "Not caching.", file=logfile)
+                f.close()
+                f = None
+                os.remove(partpath)
+
+            if f is not None:
+                try:
+                    for plane in frame.planes:
+                        f.write(memoryview(plane))
+
+                except OSError as exc:
+                    print(f"    Render cache: {exc}. Not caching.",
+                          file=logfile)
+                    f.close()
+                    f = None
+                    os.remove(partpath)
+
+                else:
+                    pts.append(frame.pts)
+                    pict_types.append(int(frame.pict_type))
+
+            yield frame
+
+        if f is not None:
+            f.close()
+            f = None
+            numpy.savez(indexpath, pts=numpy.int64(pts),
+                        pict_type=numpy.int0(pict_types),
+                        time_base=numpy.int64([time_base.numerator,
+                                               time_base.denominator]),
+                        format=numpy.array(geometry[0]),
+                        size=numpy.int64(geometry[1:3]),
+                        planes=numpy.int64(geometry[3]))
+            os.replace(partpath, datapath)
+
+    finally:
+        if f is not None:
+            f.close()
+            os.remove(partpath)
+
+        if hasattr(frames, "close"):
+            frames.close()
+
+
+def _read(key, logfile=None):
+    datapath, indexpath = _paths(key)
+
+    with numpy.load(indexpath) as index:
+        pts = index["pts"]
+        pict_types = index["pict_type"]
+        num, den = index["time_base"]
+        fmt = str(index["format"])
+        width, height = map(int, index["size"])
+        planes = index["planes"]
+
+    time_base = QQ(int(num), int(den))
+    framebytes = int(planes[:, 1].sum())
+    os.utime(datapath)
+    used.add(key)
+    print(f"    Render cache: reading {key[:16]}.", file=logfile)
+
+    if not len(pts):
+        return
+
+    data = numpy.memmap(datapath, dtype=numpy.uint8, mode="r",
+                        shape=(len(pts), framebytes))
+
+    for A, pts_, pict_type in zip(data, pts, pict_types):
+        frame = VideoFrame(width, height, fmt)
+        offset = 0
+
+        for plane, (linesize, nbytes) in zip(frame.planes, planes):
+            src = A[offset:offset + nbytes].reshape(-1, linesize)
+            dest = numpy.frombuffer(plane, dtype=numpy.uint8)
+            dest = dest.reshape(-1, plane.line_size)
+            rows = min(len(src), len(dest))
+            cols = min(linesize, plane.line_size)
+            dest[:rows, :cols] = src[:rows, :cols]
+            offset += nbytes
+
+        frame.pts = int(pts_)
+        frame.time_base = time_base
+        frame.pict_type = int(pict_type)
+        yield frame
+
+
+def iterFrames(filters, frames, end=None, logfile=None):
+    """
+    Frames of filter chain 'filters' before pts 'end', where 'frames' is
+    the (not yet started) iterator that would render them. If the render
+    is cached, 'frames' is closed and the cached frames are returned
+    instead. Otherwise, 'frames' is passed through and, unless 'readonly'
+    is set, written to the cache.
+    """
+    if directory is None:
+        return frames
+
+    k = key(filters, end)
+
+    if k is None:
+        print("    Render cache: filter state cannot be hashed. Not caching.",
+              file=logfile)
+        return frames
+
+    os.makedirs(directory, exist_ok=True)
+
+    if all(os.path.exists(path) for path in _paths(k)):
+        if hasattr(frames, "close"):
+            frames.close()
+
+        return _read(k, logfile)
+
+    if readonly:
+        return frames
+
+    if end is None:
+        count = filters.framecount
+
+    else:
+        count = int(numpy.searchsorted(filters.pts, end))
+
+    return _write(k, frames, count, logfile)
@@ -3,6 +3,7 @@ import numpy
 from fractions import Fraction as QQ
 import queue
 import threading
+import time
 import weakref
 from copy import deepcopy
 
@@ -338,18 +339,103 @@ class llist(collections.UserList):
             return self[-1]
 
 
+class CacheStats(object):
+    """
+    Instrumentation for cached properties. While enabled, counts how often
+    each cached property (keyed by "Class.attribute") is recomputed and
+    invalidated, and how long recomputations take. 'time' is inclusive of
+    cached properties computed along the way, 'selftime' is not.
+
+    Use the module-level instance:
+
+        >>> from transcode.util import cachestats
+        >>> cachestats.enable()
+        >>> zone.pulldownoffset = 2; filters.pts_time
+        >>> print(cachestats)
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._local = threading.local()
+        self.clear()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self.counts = collections.Counter()
+        self.invalidations = collections.Counter()
+        self.times = collections.Counter()
+        self.selftimes = collections.Counter()
+
+    def compute(self, key, func, inst):
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0)
+        t = time.perf_counter()
+
+        try:
+            return func(inst)
+
+        finally:
+            elapsed = time.perf_counter() - t
+            children = stack.pop()
+
+            if stack:
+                stack[-1] += elapsed
+
+            self.counts[key] += 1
+            self.times[key] += elapsed
+            self.selftimes[key] += elapsed - children
+
+    def report(self, key="selftime"):
+        """
+        Returns a list of (name, count, invalidations, time, selftime)
+        tuples, sorted by 'key' in descending order.
+        """
+        names = set(self.counts) | set(self.invalidations)
+        rows = [(name, self.counts[name], self.invalidations[name],
+                 self.times[name], self.selftimes[name]) for name in names]
+        column = ("name", "count", "invalidations",
+                  "time", "selftime").index(key)
+        return sorted(rows, key=lambda row: row[column], reverse=True)
+
+    def __str__(self):
+        lines = [f"{'Cached property':<48} {'Count':>8} {'Invalid.':>8} "
+                 f"{'Time':>10} {'Self':>10}"]
+
+        for name, n, m, t, st in self.report():
+            lines.append(f"{name:<48} {n:>8,d} {m:>8,d} {t:>10.4f} "
+                         f"{st:>10.4f}")
+
+        return "\n".join(lines)
+
+
+cachestats = CacheStats()
+
+
 class cached(property):
     def __init__(self, fget=None, fset=None, fdel=None, doc=None):
         self._attrname = f"_{fget.__name__}"
         super().__init__(fget, fset, fdel, doc)
 
+    def _key(self, inst):
+        return f"{type(inst).__name__}.{self.fget.__name__}"
+
     def __get__(self, inst, cls):
         if inst is None:
             return self
 
         if (not hasattr(inst, self._attrname)
                 or getattr(inst, self._attrname) is None):
-            value = self.fget(inst)
+            if cachestats.enabled:
+                value = cachestats.compute(self._key(inst), self.fget, inst)
+
+            else:
+                value = self.fget(inst)
+
             self.__set__(inst, value)
 
         return getattr(inst, self._attrname)
@@ -359,6 +445,9 @@ class cached(property):
                 and getattr(inst, self._attrname) is None):
             return
 
+        if cachestats.enabled and hasattr(inst, self._attrname):
+            cachestats.invalidations[self._key(inst)] += 1
+
         if callable(self.fdel):
             self.fdel(inst)
 
@@ -415,10 +504,10 @@ class WorkaheadIterator(object):
         try:
             while True:
                 with self._lock:
-                    item = next(self._iterator)
-
                     if self._stopped:
-                        break
+                        return
+
+                    item = next(self._iterator)
 
                 self._queue.put(item)
 
@@ -454,13 +543,53 @@ class WorkaheadIterator(object):
     def close(self):
         with self._lock:
             self._stopped = True
-            self._iterator.close()
 
+            if hasattr(self._iterator, "close"):
+                self._iterator.close()
+
+        """
+        Drain the queue until the reader thread exits, so that it is never
+        left blocked on a full queue, then release any buffered items.
+        """
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.05)
+
+            except queue.Empty:
+                pass
+
+        while True:
+            try:
+                self._queue.get_nowait()
+
+            except queue.Empty:
+                break
+
+
+class ClosingIterator(object):
+    """
+    Iterates over generator 'generator', which reads from 'iterator'.
+    Closing it also closes 'iterator', even if 'generator' was never
+    started (and so never reached its own cleanup).
+    """
+
+    def __init__(self, generator, iterator):
+        self._generator = generator
+        self._iterator = iterator
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._generator)
+
+    def close(self):
         try:
-            self._queue.get(timeout=0)
+            self._generator.close()
 
-        except queue.Empty:
-            pass
+        finally:
+            if hasattr(self._iterator, "close"):
+                self._iterator.close()
 
 
 class WeakRefList(collections.UserList):